@@ -1,3 +1,5 @@
+from typing import Literal, Optional
+
 from pydantic_settings import BaseSettings
 
 
@@ -9,11 +11,56 @@ class Settings(BaseSettings):
     DB_NAME: str
     DB_POOL_SIZE: int
     DB_MAX_OVERFLOW: int
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    DB_REPLICA_HOST: Optional[str] = None
+    DB_REPLICA_PORT: Optional[int] = None
+    DB_REPLICA_NAME: Optional[str] = None
+    READ_YOUR_WRITES_SECONDS: int = 0
+    DB_POOL_BUDGET: int = 0
+    DB_WARMUP_CONNECTIONS: int = 1
 
     SERVER_HOST: str
     SERVER_PORT: int
+    WEB_CONCURRENCY: int = 1
 
     LOG_LEVEL: str
+    LOG_FORMAT: Literal["text", "json"] = "text"
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_ACCESS_SAMPLE_RATE: float = 1.0
+    LOG_SQL_SAMPLE_RATE: float = 1.0
+
+    METRICS_ENABLED: bool = True
+
+    PROFILE_ENABLED: bool = False
+    PROFILE_QUERY_BUDGET: int = 10
+    PROFILE_SLOW_QUERY_MS: float = 200.0
+    PROFILE_EXPLAIN_SAMPLE_RATE: float = 0.1
+    PROFILE_PLANS_SIZE: int = 50
+
+    RESPONSE_FAST_PATH: bool = True
+    ETAG_ENABLED: bool = True
+    LIST_ETAG_ENABLED: bool = False
+    LIST_TOTAL_EXACT_LIMIT: int = 10000
+
+    BULK_BATCH_SIZE: int = 1000
+    EXPORT_BATCH_SIZE: int = 1000
+
+    CACHE_BACKEND: Literal["none", "memory", "redis"] = "none"
+    CACHE_TTL_SECONDS: int = 30
+    CACHE_MAX_ENTRIES: int = 10000
+    CACHE_REDIS_URL: str = "redis://localhost:6379/0"
+
+    SUM_ENGINE: Literal["rollup", "series", "numpy"] = "rollup"
+    ROLLUP_HORIZON_MONTHS: int = 36
+    SUM_BATCH_CHUNK_SIZE: int = 1000
+    SUM_SINGLE_FLIGHT: bool = True
+
+    FEED_QUEUE_SIZE: int = 1000
+    FEED_BATCH_SIZE: int = 1000
+    FEED_POLL_SECONDS: float = 1.0
+    FEED_HEARTBEAT_SECONDS: float = 15.0
+    FEED_RETENTION_HOURS: int = 24
+    FEED_PRUNE_SECONDS: int = 600
 
     class Config:
         env_file = None
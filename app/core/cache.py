@@ -0,0 +1,176 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.config import Settings, settings
+
+
+class MemoryCacheBackend:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[Optional[float], Any]]" = OrderedDict()
+
+    def _alive(self, key: str) -> Optional[Tuple[Optional[float], Any]]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, _ = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return item
+
+    def _put(self, key: str, value: Any, ttl: Optional[int]) -> None:
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    async def get(self, key: str) -> Any:
+        item = self._alive(key)
+        return item[1] if item else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        self._put(key, value, ttl)
+
+    async def add(self, key: str, value: int, ttl: Optional[int] = None) -> None:
+        if self._alive(key) is None:
+            self._put(key, value, ttl)
+
+    async def incr(self, key: str, initial: int, ttl: Optional[int] = None) -> int:
+        item = self._alive(key)
+        value = (item[1] if item else initial) + 1
+        self._put(key, value, ttl)
+        return value
+
+    async def incr_many(self, keys: List[str], initial: int, ttl: Optional[int] = None) -> None:
+        for key in keys:
+            await self.incr(key, initial, ttl)
+
+
+class RedisCacheBackend:
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisCacheBackend":
+        try:
+            from redis import asyncio as redis
+        except ImportError as err:
+            raise RuntimeError("CACHE_BACKEND=redis requires the redis package") from err
+        return cls(redis.from_url(url))
+
+    async def get(self, key: str) -> Any:
+        raw = await self.client.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        await self.client.set(key, json.dumps(value), ex=ttl)
+
+    async def add(self, key: str, value: int, ttl: Optional[int] = None) -> None:
+        await self.client.set(key, json.dumps(value), nx=True, ex=ttl)
+
+    @staticmethod
+    def _queue_incr(pipe, key: str, initial: int, ttl: Optional[int]) -> None:
+        # пропавший ключ начинается с initial, а не с нуля, и каждое изменение продлевает его
+        pipe.set(key, json.dumps(initial), nx=True, ex=ttl)
+        pipe.incr(key)
+        if ttl:
+            pipe.expire(key, ttl)
+
+    async def incr(self, key: str, initial: int, ttl: Optional[int] = None) -> int:
+        async with self.client.pipeline(transaction=False) as pipe:
+            self._queue_incr(pipe, key, initial, ttl)
+            results = await pipe.execute()
+        return int(results[1])
+
+    async def incr_many(self, keys: List[str], initial: int, ttl: Optional[int] = None) -> None:
+        # пакетные изменения сбрасывают тысячи ключей: один конвейер вместо запроса на ключ
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                self._queue_incr(pipe, key, initial, ttl)
+            await pipe.execute()
+
+
+# ключи поколений живут заметно дольше данных: когда ключ поколения истекает, все записи,
+# построенные на нём, уже истекли, и без TTL в Redis оставался бы ключ на каждого пользователя
+# и подписку, которые когда-либо читались
+GENERATION_TTL_FACTOR = 10
+GENERATION_TTL_MIN_SECONDS = 3600
+
+
+class Cache:
+    def __init__(self, backend, ttl: int, prefix: str = "subs"):
+        self.backend = backend
+        self.ttl = ttl
+        self.generation_ttl = max(ttl * GENERATION_TTL_FACTOR, GENERATION_TTL_MIN_SECONDS)
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _generation_key(self, namespace: str, ident: Any) -> str:
+        return f"{self.prefix}:gen:{namespace}:{ident}"
+
+    async def generation(self, namespace: str, ident: Any) -> int:
+        # поколение стартует с текущего времени, а не с нуля: если ключ поколения вытеснен
+        # или истёк, старые записи под прежним номером уже не совпадут с новым
+        key = self._generation_key(namespace, ident)
+        value = await self.backend.get(key)
+        if value is None:
+            await self.backend.add(key, time.time_ns(), self.generation_ttl)
+            value = await self.backend.get(key)
+        return int(value)
+
+    async def versioned_key(self, namespace: str, ident: Any, *parts: Any) -> str:
+        generation = await self.generation(namespace, ident)
+        return ":".join(str(part) for part in (self.prefix, namespace, ident, generation, *parts))
+
+    async def invalidate(self, namespace: str, ident: Any) -> None:
+        self.invalidations += 1
+        await self.backend.incr(
+            self._generation_key(namespace, ident), time.time_ns(), self.generation_ttl
+        )
+
+    async def invalidate_many(self, namespace: str, idents: Iterable[Any]) -> None:
+        keys = [self._generation_key(namespace, ident) for ident in set(idents)]
+        if keys:
+            self.invalidations += len(keys)
+            await self.backend.incr_many(keys, time.time_ns(), self.generation_ttl)
+
+    async def get(self, key: str) -> Any:
+        value = await self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: Any) -> None:
+        await self.backend.set(key, value, self.ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def build_cache(config: Settings) -> Optional[Cache]:
+    if config.CACHE_BACKEND == "memory":
+        backend = MemoryCacheBackend(config.CACHE_MAX_ENTRIES)
+    elif config.CACHE_BACKEND == "redis":
+        backend = RedisCacheBackend.from_url(config.CACHE_REDIS_URL)
+    else:
+        return None
+    return Cache(backend, ttl=config.CACHE_TTL_SECONDS)
+
+
+cache = build_cache(settings)
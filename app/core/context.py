@@ -1,3 +1,3 @@
 from contextvars import ContextVar
 
-trace_id_ctx: ContextVar[int | None] = ContextVar("trace_id", default=None)
+trace_id_ctx: ContextVar[str | None] = ContextVar("trace_id", default=None)
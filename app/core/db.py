@@ -1,25 +1,71 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+import time
+from typing import Optional, Tuple
+
+from fastapi import Depends, Request, Response
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 
 from app.config import settings
+from app.core.metrics import InstrumentedAsyncAdaptedQueuePool, instrument_engine
+from app.core.profiling import profile_engine
+
+READ_YOUR_WRITES_COOKIE = "rw_until"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
 
 
 class Base(DeclarativeBase):
     pass
 
 
-DATABASE_URL = (
-    f"postgresql+asyncpg://{settings.DB_USER}:{settings.DB_PASSWORD}"
-    f"@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
+def database_url(host: str, port: int, name: str) -> str:
+    return f"postgresql+asyncpg://{settings.DB_USER}:{settings.DB_PASSWORD}@{host}:{port}/{name}"
+
+
+DATABASE_URL = database_url(settings.DB_HOST, settings.DB_PORT, settings.DB_NAME)
+REPLICA_DATABASE_URL = (
+    database_url(
+        settings.DB_REPLICA_HOST,
+        settings.DB_REPLICA_PORT or settings.DB_PORT,
+        settings.DB_REPLICA_NAME or settings.DB_NAME,
+    )
+    if settings.DB_REPLICA_HOST
+    else None
 )
 
 is_debug_mode = settings.LOG_LEVEL == "debug"
-engine = create_async_engine(
-    DATABASE_URL,
-    echo=is_debug_mode,
-    future=True,
-    pool_size=settings.DB_POOL_SIZE,
-    max_overflow=settings.DB_MAX_OVERFLOW,
+
+
+def pool_limits() -> Tuple[int, int]:
+    if not settings.DB_POOL_BUDGET:
+        return settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW
+    # каждый воркер uvicorn держит свой пул: общий бюджет соединений делится между ними,
+    # постоянная часть не больше DB_POOL_SIZE, остаток уходит в overflow
+    per_worker = max(settings.DB_POOL_BUDGET // max(settings.WEB_CONCURRENCY, 1), 1)
+    pool_size = min(settings.DB_POOL_SIZE, per_worker)
+    return pool_size, per_worker - pool_size
+
+
+def build_engine(url: str, name: str) -> AsyncEngine:
+    pool_size, max_overflow = pool_limits()
+    db_engine = create_async_engine(
+        url,
+        echo=is_debug_mode,
+        future=True,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        connect_args={"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE},
+        poolclass=InstrumentedAsyncAdaptedQueuePool if settings.METRICS_ENABLED else None,
+    )
+    if settings.METRICS_ENABLED:
+        instrument_engine(db_engine, name)
+    if settings.PROFILE_ENABLED:
+        profile_engine(db_engine)
+    return db_engine
+
+
+engine = build_engine(DATABASE_URL, "primary")
+replica_engine: Optional[AsyncEngine] = (
+    build_engine(REPLICA_DATABASE_URL, "replica") if REPLICA_DATABASE_URL else None
 )
 
 async_session_maker = sessionmaker(
@@ -27,8 +73,45 @@ async_session_maker = sessionmaker(
     class_=AsyncSession,
     expire_on_commit=False,
 )
+# без реплики чтения идут в основную базу
+replica_session_maker = (
+    sessionmaker(bind=replica_engine, class_=AsyncSession, expire_on_commit=False)
+    if replica_engine is not None
+    else async_session_maker
+)
+
+
+def wrote_recently(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
 
 
 async def get_db_session() -> AsyncSession:
     async with async_session_maker() as session:
         yield session
+
+
+def read_session_maker(request: Request) -> sessionmaker:
+    # после записи клиент до истечения куки читает из основной базы, а не из отстающей реплики
+    return async_session_maker if wrote_recently(request) else replica_session_maker
+
+
+async def get_read_db_session(
+    request: Request, response: Response, session: AsyncSession = Depends(get_db_session)
+) -> AsyncSession:
+    if settings.READ_YOUR_WRITES_SECONDS and request.method not in SAFE_METHODS:
+        response.set_cookie(
+            READ_YOUR_WRITES_COOKIE,
+            f"{time.time() + settings.READ_YOUR_WRITES_SECONDS:.0f}",
+            max_age=settings.READ_YOUR_WRITES_SECONDS,
+            httponly=True,
+            samesite="lax",
+        )
+    if read_session_maker(request) is async_session_maker:
+        # та же сессия, что и для записей: второе соединение из пула не берётся
+        yield session
+        return
+    async with replica_session_maker() as replica_session:
+        yield replica_session
@@ -1,43 +1,133 @@
+import atexit
+import json
 import logging
 import logging.config
+import queue
+import random
 import sys
-from typing import Dict
+import zlib
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
 
+from app.config import settings
 from app.core.context import trace_id_ctx
+from app.core.metrics import LOG_RECORDS_DROPPED
 
+TEXT_FORMAT = "%(asctime)s %(levelname)s [%(name)s] [trace_id=%(trace_id)s] %(message)s"
 
-class SingleLineFilter(logging.Filter):
+ACCESS_LOGGERS = ("uvicorn.access", "app.middleware")
+SQL_LOGGERS = ("sqlalchemy.engine",)
+
+_listener: Optional[QueueListener] = None
+
+
+class TraceIdFilter(logging.Filter):
+    # trace_id читается в задаче запроса, до очереди: в потоке записи контекста уже нет
     def filter(self, record):
-        if isinstance(record.msg, str):
-            record.msg = record.msg.replace("\n", "")
         trace_id = trace_id_ctx.get()
         record.trace_id = trace_id if trace_id is not None else 0
         return True
 
 
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = [(prefix, rate) for prefix, rate in rates.items() if rate < 1]
+
+    def filter(self, record):
+        for prefix, rate in self.rates:
+            if record.name.startswith(prefix):
+                # решение зависит от trace_id, поэтому запрос попадает в лог целиком или никак
+                if record.trace_id:
+                    bucket = zlib.crc32(str(record.trace_id).encode()) % 10000
+                    return bucket < rate * 10000
+                return random.random() < rate
+        return True
+
+
+class SingleLineFormatter(logging.Formatter):
+    def formatMessage(self, record):
+        record.message = record.message.replace("\n", "")
+        return super().formatMessage(record)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "trace_id": record.trace_id,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # форматирование (в том числе текста SQL) выполняется в потоке QueueListener
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+def build_handler(log_format: str, queue_size: int, stream=None) -> logging.Handler:
+    global _listener
+    stream_handler = logging.StreamHandler(stream or sys.stdout)
+    if log_format == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(SingleLineFormatter(TEXT_FORMAT))
+    if queue_size <= 0:
+        return stream_handler
+
+    handler = NonBlockingQueueHandler(queue.Queue(queue_size))
+    _listener = QueueListener(handler.queue, stream_handler)
+    _listener.start()
+    return handler
+
+
+def stop_logging() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
 def setup_logging(level: str = "INFO") -> None:
     level = (level or "INFO").upper()
+    stop_logging()
 
     config: Dict = {
         "version": 1,
         "disable_existing_loggers": False,
-        "formatters": {
-            "default": {
-                "format": "%(asctime)s %(levelname)s [%(name)s] [trace_id=%(trace_id)s] %(message)s",
-            }
-        },
         "handlers": {
             "console": {
-                "class": "logging.StreamHandler",
-                "formatter": "default",
-                "stream": "ext://sys.stdout",
-                "filters": ["single_line_filter"],
+                "()": build_handler,
+                "log_format": settings.LOG_FORMAT,
+                "queue_size": settings.LOG_QUEUE_SIZE,
+                "filters": ["trace_id", "sampling"],
             }
         },
         "filters": {
-            "single_line_filter": {
-                "()": SingleLineFilter,
-            }
+            "trace_id": {"()": TraceIdFilter},
+            "sampling": {
+                "()": SamplingFilter,
+                "rates": {
+                    **dict.fromkeys(ACCESS_LOGGERS, settings.LOG_ACCESS_SAMPLE_RATE),
+                    **dict.fromkeys(SQL_LOGGERS, settings.LOG_SQL_SAMPLE_RATE),
+                },
+            },
         },
         "root": {"level": level, "handlers": ["console"]},
         "loggers": {
@@ -0,0 +1,139 @@
+import time
+from typing import Dict, Iterator
+
+from prometheus_client import Counter, Histogram, generate_latest
+from prometheus_client.core import REGISTRY, GaugeMetricFamily
+from prometheus_client.registry import Collector
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests", ["method", "route", "status"])
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"]
+)
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "SQL statement latency", ["operation"], buckets=DB_BUCKETS
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled connection", buckets=DB_BUCKETS
+)
+SINGLE_FLIGHT_CALLS = Counter(
+    "single_flight_calls_total",
+    "Calls that ran a query (leader) or joined one in flight (coalesced)",
+    ["name", "result"],
+)
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total", "Log records dropped because the logging queue was full"
+)
+
+# запросы без подходящего маршрута (404) пишем под одной меткой, чтобы не плодить серии
+UNMATCHED_ROUTE = "unmatched"
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "BEGIN", "COMMIT", "ROLLBACK"}
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # шаблон маршрута появляется в scope только после роутинга
+            route = scope.get("route")
+            labels = (scope["method"], getattr(route, "path", UNMATCHED_ROUTE), str(status))
+            HTTP_REQUESTS.labels(*labels).inc()
+            HTTP_LATENCY.labels(*labels).observe(time.perf_counter() - started)
+
+
+class InstrumentedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - started)
+
+
+class PoolCollector(Collector):
+    # значения читаются из пула в момент опроса, на горячем пути ничего не считается
+    def __init__(self):
+        self.engines: Dict[str, AsyncEngine] = {}
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        size = GaugeMetricFamily("db_pool_size", "Configured pool size", labels=["engine"])
+        checked_out = GaugeMetricFamily(
+            "db_pool_checked_out", "Connections in use", labels=["engine"]
+        )
+        checked_in = GaugeMetricFamily(
+            "db_pool_checked_in", "Idle connections in the pool", labels=["engine"]
+        )
+        overflow = GaugeMetricFamily(
+            "db_pool_overflow", "Connections above pool size", labels=["engine"]
+        )
+        for name, engine in self.engines.items():
+            # dispose() подменяет пул, поэтому берём текущий на каждый опрос
+            pool = engine.sync_engine.pool
+            size.add_metric([name], pool.size())
+            checked_out.add_metric([name], pool.checkedout())
+            checked_in.add_metric([name], pool.checkedin())
+            overflow.add_metric([name], max(pool.overflow(), 0))
+        yield from (size, checked_out, checked_in, overflow)
+
+
+POOL_COLLECTOR = PoolCollector()
+
+
+def sql_operation(statement: str) -> str:
+    # первое слово ищем в начале строки, не копируя весь текст запроса
+    words = statement[:64].split(None, 1)
+    keyword = words[0].upper() if words else ""
+    return keyword if keyword in SQL_OPERATIONS else "OTHER"
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    DB_QUERY_LATENCY.labels(sql_operation(statement)).observe(time.perf_counter() - started)
+
+
+def handle_error(exception_context):
+    # после ошибки after_cursor_execute не вызывается, снимаем отметку сами
+    started = exception_context.connection and exception_context.connection.info.get(
+        "query_started"
+    )
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine: AsyncEngine, name: str = "primary") -> None:
+    sync_engine = engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(sync_engine, "handle_error", handle_error)
+    if not POOL_COLLECTOR.engines:
+        REGISTRY.register(POOL_COLLECTOR)
+    POOL_COLLECTOR.engines[name] = engine
+
+
+def render_metrics() -> bytes:
+    return generate_latest(REGISTRY)
@@ -1,16 +1,62 @@
 import random
-
-from fastapi import Request
+import re
+import time
+from typing import Optional
 
 from app.core.context import trace_id_ctx
 from app.core.logging import get_logger
 
 logger = get_logger("app.middleware")
 
+TRACE_ID_HEADER = b"x-trace-id"
+# чужой trace_id попадает в логи и заголовки, поэтому принимаем только безопасные символы
+TRACE_ID_PATTERN = re.compile(r"[A-Za-z0-9._:-]{1,128}")
+
+
+def new_trace_id() -> str:
+    return f"{random.getrandbits(64):016x}"
+
+
+def incoming_trace_id(headers) -> Optional[str]:
+    for name, value in headers:
+        if name == TRACE_ID_HEADER:
+            trace_id = value.decode("latin-1")
+            return trace_id if TRACE_ID_PATTERN.fullmatch(trace_id) else None
+    return None
+
+
+class TraceMiddleware:
+    # чистый ASGI вместо app.middleware("http"): без BaseHTTPMiddleware нет лишней задачи
+    # и очереди на каждый запрос, а потоковые ответы отдаются как есть
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        trace_id = incoming_trace_id(scope["headers"]) or new_trace_id()
+        token = trace_id_ctx.set(trace_id)
+        logger.info("Incoming request %s %s", scope["method"], scope["path"])
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                # время до начала ответа: у потоковых ответов тело ещё не отдано
+                duration_ms = (time.perf_counter() - started) * 1000
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", []),
+                        (TRACE_ID_HEADER, trace_id.encode("latin-1")),
+                        (b"server-timing", f"app;dur={duration_ms:.2f}".encode()),
+                        (b"x-response-time-ms", f"{duration_ms:.2f}".encode()),
+                    ],
+                }
+            await send(message)
 
-async def add_trace_id(request: Request, call_next):
-    trace_id = random.randint(10**12, 10**13 - 1)
-    trace_id_ctx.set(trace_id)
-    logger.info("Incoming request %s %s", request.method, request.url.path)
-    response = await call_next(request)
-    return response
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            trace_id_ctx.reset(token)
@@ -0,0 +1,191 @@
+import asyncio
+import contextvars
+import random
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import settings
+from app.core.context import trace_id_ctx
+from app.core.logging import get_logger
+from app.core.metrics import sql_operation
+
+logger = get_logger("app.profiling")
+
+# EXPLAIN ANALYZE выполняет запрос ещё раз, поэтому повторяются только чтения и только в
+# транзакции READ ONLY: запись, которую не распознали по тексту, в ней завершится ошибкой
+EXPLAIN_OPERATIONS = {"SELECT", "WITH"}
+# WITH с INSERT/UPDATE (пересборка свёртки) и SELECT ... FOR UPDATE пропускаются сразу
+WRITE_PATTERN = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE)\b", re.IGNORECASE)
+# одновременных EXPLAIN на воркер: каждый занимает соединение из общего пула
+EXPLAIN_CONCURRENCY = 2
+EXPLAIN_TIMEOUT = "30s"
+
+
+@dataclass
+class RequestProfile:
+    trace_id: Optional[str]
+    request: str
+    statements: int = 0
+    db_seconds: float = 0.0
+
+
+profile_ctx: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar(
+    "request_profile", default=None
+)
+
+
+class Profiler:
+    def __init__(self, plans_size: int):
+        self.plans: Deque[Dict[str, Any]] = deque(maxlen=plans_size)
+        self.engines: Dict[Any, AsyncEngine] = {}
+        self.tasks: Set[asyncio.Task] = set()
+        self.requests = 0
+        self.over_budget = 0
+
+    def finish(self, profile: RequestProfile) -> None:
+        self.requests += 1
+        if profile.statements > settings.PROFILE_QUERY_BUDGET:
+            self.over_budget += 1
+            logger.warning(
+                "Query budget exceeded: %s issued %s statements (budget %s), %.1f ms in the database",
+                profile.request,
+                profile.statements,
+                settings.PROFILE_QUERY_BUDGET,
+                profile.db_seconds * 1000,
+            )
+
+    def sample(self, sync_engine, statement: str, parameters, seconds: float) -> None:
+        if sql_operation(statement) not in EXPLAIN_OPERATIONS or sync_engine not in self.engines:
+            return
+        if len(self.tasks) >= EXPLAIN_CONCURRENCY or WRITE_PATTERN.search(statement):
+            return
+        if random.random() >= settings.PROFILE_EXPLAIN_SAMPLE_RATE:
+            return
+        # пустой контекст: EXPLAIN не попадает в счётчики запроса, который его вызвал
+        task = asyncio.get_running_loop().create_task(
+            self.explain(
+                self.engines[sync_engine], statement, parameters, seconds, profile_ctx.get()
+            ),
+            context=contextvars.Context(),
+        )
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def explain(
+        self,
+        engine: AsyncEngine,
+        statement: str,
+        parameters,
+        seconds: float,
+        profile: RequestProfile,
+    ) -> None:
+        trace_id_ctx.set(profile.trace_id)
+        try:
+            async with engine.connect() as conn:
+                await conn.exec_driver_sql("SET TRANSACTION READ ONLY")
+                await conn.exec_driver_sql(f"SET LOCAL statement_timeout = '{EXPLAIN_TIMEOUT}'")
+                result = await conn.exec_driver_sql(
+                    f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters or ()
+                )
+                plan = "\n".join(row[0] for row in result)
+                await conn.rollback()
+        except Exception as err:
+            logger.warning("EXPLAIN of a slow statement failed: %s", err)
+            return
+        self.plans.append(
+            {
+                "trace_id": profile.trace_id,
+                "request": profile.request,
+                "captured_at": datetime.now(timezone.utc).isoformat(),
+                "duration_ms": round(seconds * 1000, 2),
+                "statement": statement,
+                "parameters": [repr(value) for value in parameters or ()],
+                "plan": plan,
+            }
+        )
+        logger.warning(
+            "Slow statement (%.1f ms) in %s, plan captured", seconds * 1000, profile.request
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "over_budget": self.over_budget,
+            "explaining": len(self.tasks),
+            "plans": list(reversed(self.plans)),
+        }
+
+
+profiler = Profiler(settings.PROFILE_PLANS_SIZE)
+
+
+class ProfilingMiddleware:
+    # стоит внутри TraceMiddleware: trace_id запроса к этому моменту уже выставлен
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        query = scope.get("query_string", b"").decode("latin-1")
+        profile = RequestProfile(
+            trace_id_ctx.get(), f"{scope['method']} {scope['path']}{'?' if query else ''}{query}"
+        )
+        token = profile_ctx.set(profile)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                db_ms = profile.db_seconds * 1000
+                timing = f'db;dur={db_ms:.2f};desc="statements: {profile.statements}"'
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", []), (b"server-timing", timing.encode())],
+                }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            profile_ctx.reset(token)
+            profiler.finish(profile)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info["profile_started"].pop()
+    profile = profile_ctx.get()
+    # запросы вне HTTP-запроса (прогрев, слушатель ленты) не считаются
+    if profile is None:
+        return
+    profile.statements += 1
+    profile.db_seconds += seconds
+    if seconds * 1000 >= settings.PROFILE_SLOW_QUERY_MS and not executemany:
+        profiler.sample(conn.engine, statement, parameters, seconds)
+
+
+def handle_error(exception_context):
+    started = exception_context.connection and exception_context.connection.info.get(
+        "profile_started"
+    )
+    if started:
+        started.pop()
+
+
+def profile_engine(engine: AsyncEngine) -> None:
+    sync_engine = engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(sync_engine, "handle_error", handle_error)
+    profiler.engines[sync_engine] = engine
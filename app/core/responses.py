@@ -0,0 +1,10 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+
+class FastJSONResponse(ORJSONResponse):
+    # asyncpg отдаёт свой подкласс UUID, orjson сериализует только точный uuid.UUID
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
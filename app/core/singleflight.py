@@ -0,0 +1,26 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from app.core.metrics import SINGLE_FLIGHT_CALLS
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    # одинаковые одновременные вызовы ждут один запрос к базе; результат не хранится
+    # после завершения, поэтому и инвалидация не нужна
+    def __init__(self, name: str):
+        self.name = name
+        self.in_flight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self.in_flight.get(key)
+        if task is None:
+            SINGLE_FLIGHT_CALLS.labels(self.name, "leader").inc()
+            task = asyncio.ensure_future(fn())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        else:
+            SINGLE_FLIGHT_CALLS.labels(self.name, "coalesced").inc()
+        # отмена одного из ожидающих не должна отменять запрос для остальных
+        return await asyncio.shield(task)
@@ -0,0 +1,63 @@
+import asyncio
+from typing import Awaitable, Callable, Optional, Sequence
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.core.logging import get_logger
+
+logger = get_logger("app.warmup")
+
+Warmer = Callable[[AsyncSession], Awaitable[None]]
+
+RETRY_DELAY_MAX_SECONDS = 30
+
+
+async def warm_connection(db_engine: AsyncEngine, warmers: Sequence[Warmer]) -> None:
+    async with db_engine.connect() as conn:
+        async with AsyncSession(bind=conn) as session:
+            for warmer in warmers:
+                await warmer(session)
+
+
+async def warm_engine(db_engine: AsyncEngine, connections: int, warmers: Sequence[Warmer]):
+    # соединения открываются одновременно, иначе пул раз за разом отдавал бы одно и то же;
+    # больше размера пула не греем: overflow-соединения закрываются при возврате
+    count = min(connections, db_engine.sync_engine.pool.size())
+    await asyncio.gather(*(warm_connection(db_engine, warmers) for _ in range(count)))
+
+
+class WarmUp:
+    def __init__(self, engines: Sequence[AsyncEngine], connections: int, warmers: Sequence[Warmer]):
+        self.engines = engines
+        self.connections = connections
+        self.warmers = warmers
+        self.ready = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    async def run(self) -> None:
+        attempt = 0
+        while True:
+            try:
+                for db_engine in self.engines:
+                    await warm_engine(db_engine, self.connections, self.warmers)
+                break
+            except Exception as err:
+                # база ещё недоступна: не готовы, пробуем снова
+                attempt += 1
+                delay = min(2**attempt, RETRY_DELAY_MAX_SECONDS)
+                logger.warning("Warm-up failed (%s), retrying in %s s", err, delay)
+                await asyncio.sleep(delay)
+        self.ready.set()
+        logger.info("Warm-up finished")
+
+    def start(self) -> None:
+        # прогрев идёт в фоне: /health отвечает сразу, /ready - после прогрева
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
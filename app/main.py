@@ -1,10 +1,17 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from prometheus_client import CONTENT_TYPE_LATEST
 
 from app.config import settings
-from app.core.db import engine
+from app.core.cache import cache
+from app.core.db import engine, replica_engine
 from app.core.logging import get_logger, setup_logging
-from app.core.middleware import add_trace_id
+from app.core.metrics import MetricsMiddleware, render_metrics
+from app.core.middleware import TraceMiddleware
+from app.core.profiling import ProfilingMiddleware, profiler
+from app.core.warmup import WarmUp
+from app.subscriptions.feed import change_feed
 from app.subscriptions.routes import router as subscriptions_router
+from app.subscriptions.warmup import warm_statements
 
 setup_logging(settings.LOG_LEVEL)
 logger = get_logger(__name__)
@@ -15,22 +22,71 @@ app = FastAPI(
     version="1.0.0",
 )
 
-app.middleware("http")(add_trace_id)
+# add_middleware ставит новый слой снаружи: trace_id выставляется раньше всех
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+if settings.PROFILE_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+app.add_middleware(TraceMiddleware)
 
 app.include_router(subscriptions_router, prefix="/subscriptions")
 
+warmup = WarmUp(
+    [engine] if replica_engine is None else [engine, replica_engine],
+    settings.DB_WARMUP_CONNECTIONS,
+    [warm_statements],
+)
+
 
 @app.get("/health", tags=["health"])
 async def healthcheck():
     return {"status": "ok"}
 
 
+@app.get("/ready", tags=["health"])
+async def readiness(response: Response):
+    if not warmup.ready.is_set():
+        response.status_code = 503
+        return {"status": "warming up"}
+    return {"status": "ready"}
+
+
+@app.get("/cache/stats", tags=["health"])
+async def cache_stats():
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
+@app.get("/feed/stats", tags=["health"])
+async def feed_stats():
+    return change_feed.stats()
+
+
+@app.get("/debug/slow-queries", tags=["health"])
+async def slow_queries():
+    if not settings.PROFILE_ENABLED:
+        return {"enabled": False}
+    return {"enabled": True, **profiler.stats()}
+
+
+@app.get("/metrics", tags=["health"], include_in_schema=False)
+async def metrics():
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.on_event("startup")
 async def on_startup():
     logger.info("Application startup")
+    warmup.start()
+    change_feed.start_pruning()
 
 
 @app.on_event("shutdown")
 async def on_shutdown():
+    await warmup.stop()
+    await change_feed.stop()
     await engine.dispose()
+    if replica_engine is not None:
+        await replica_engine.dispose()
     logger.info("Application shutdown")
@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+
+from sqlalchemy import func, select
+
+from app.config import settings
+from app.core.db import async_session_maker, engine
+from app.core.logging import setup_logging
+from app.subscriptions import partitioning
+from app.subscriptions.feed import prune_events
+from app.subscriptions.models import Subscription
+from app.subscriptions.repository import SubscriptionRepository
+from app.subscriptions.rollup import rebuild_rollup, refresh_open_ended
+
+
+async def rollup_rebuild(args: argparse.Namespace) -> int:
+    async with async_session_maker() as session:
+        await rebuild_rollup(session)
+    print("Rollup rebuilt")
+    return 0
+
+
+async def rollup_refresh_open(args: argparse.Namespace) -> int:
+    async with async_session_maker() as session:
+        refreshed = await refresh_open_ended(session)
+    print(f"Rollup refreshed for {refreshed} open-ended (user_id, service_name) keys")
+    return 0
+
+
+async def rollup_verify(args: argparse.Namespace) -> int:
+    async with async_session_maker() as session:
+        users = await session.scalars(
+            select(Subscription.user_id)
+            .group_by(Subscription.user_id)
+            .order_by(func.random())
+            .limit(args.sample)
+        )
+        repo = SubscriptionRepository(session)
+        mismatches = 0
+        for user_id in users.all():
+            from_rollup = await repo.sum_by_user_rollup(user_id)
+            from_series = await repo.sum_by_user_series(user_id)
+            if from_rollup != from_series:
+                mismatches += 1
+                print(f"Mismatch for user {user_id}: rollup={from_rollup} series={from_series}")
+    print(f"Rollup verified, mismatches: {mismatches}")
+    return 1 if mismatches else 0
+
+
+async def feed_prune(args: argparse.Namespace) -> int:
+    pruned = await prune_events(engine)
+    print(f"Pruned {pruned} change feed events older than {settings.FEED_RETENTION_HOURS} h")
+    return 0
+
+
+async def partition_status(args: argparse.Namespace) -> int:
+    async with engine.connect() as conn:
+        current = await conn.run_sync(partitioning.table_scheme)
+        pending = await conn.run_sync(partitioning.table_scheme, partitioning.NEW_TABLE)
+    print(f"{partitioning.TABLE}: {current}")
+    if pending is not None:
+        print(f"{partitioning.NEW_TABLE}: {pending}, waiting for backfill and swap")
+    return 0
+
+
+async def partition_prepare(args: argparse.Namespace) -> int:
+    async with engine.connect() as conn:
+        await conn.run_sync(partitioning.prepare, args.scheme, args.partitions)
+        await conn.commit()
+    print(f"{partitioning.NEW_TABLE} ({args.scheme}) created, writes are mirrored into it")
+    return 0
+
+
+async def partition_backfill(args: argparse.Namespace) -> int:
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        copied = await conn.run_sync(
+            partitioning.backfill,
+            args.batch_size,
+            lambda copied: print(f"Copied {copied} rows", flush=True),
+        )
+    print(f"Backfill finished, {copied} rows copied")
+    return 0
+
+
+async def partition_swap(args: argparse.Namespace) -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(partitioning.swap, args.keep_old, args.lock_timeout)
+    print(f"{partitioning.NEW_TABLE} is now {partitioning.TABLE}")
+    return 0
+
+
+COMMANDS = {
+    "rollup-rebuild": rollup_rebuild,
+    "rollup-refresh-open": rollup_refresh_open,
+    "rollup-verify": rollup_verify,
+    "feed-prune": feed_prune,
+    "partition-status": partition_status,
+    "partition-prepare": partition_prepare,
+    "partition-backfill": partition_backfill,
+    "partition-swap": partition_swap,
+}
+
+
+async def run(args: argparse.Namespace) -> int:
+    try:
+        return await COMMANDS[args.command](args)
+    finally:
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.subscriptions.commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("rollup-rebuild", help="Полностью пересобрать свёртку расходов")
+    subparsers.add_parser(
+        "rollup-refresh-open", help="Продлить свёртку бессрочных подписок до горизонта"
+    )
+    verify = subparsers.add_parser("rollup-verify", help="Сверить свёртку с generate_series")
+    verify.add_argument("--sample", type=int, default=100, help="Сколько пользователей сверить")
+
+    subparsers.add_parser("feed-prune", help="Удалить события ленты старше FEED_RETENTION_HOURS")
+
+    subparsers.add_parser("partition-status", help="Показать схему секционирования таблицы")
+    prepare = subparsers.add_parser(
+        "partition-prepare",
+        help="Создать новую таблицу с индексами и триггер, дублирующий в неё записи",
+    )
+    prepare.add_argument(
+        "--scheme",
+        choices=["none", "hash", "range"],
+        required=True,
+        help="hash - по user_id, range - по годам start_date. Глобального индекса по id нет: "
+        "GET, PUT и DELETE по id проверяют индекс каждой секции",
+    )
+    prepare.add_argument(
+        "--partitions",
+        type=int,
+        default=16,
+        help="Число hash-секций по user_id; каждая добавляет проверку индекса к поиску по id",
+    )
+    backfill = subparsers.add_parser(
+        "partition-backfill", help="Скопировать строки в новую таблицу пачками"
+    )
+    backfill.add_argument("--batch-size", type=int, default=10000, help="Строк в одной пачке")
+    swap = subparsers.add_parser(
+        "partition-swap", help="Поменять таблицы местами под короткой блокировкой"
+    )
+    swap.add_argument(
+        "--keep-old",
+        action="store_true",
+        help="Оставить прежнюю таблицу как subscriptions_old вместо удаления",
+    )
+    swap.add_argument(
+        "--lock-timeout", default="5s", help="Сколько ждать блокировку таблицы перед отказом"
+    )
+
+    setup_logging(settings.LOG_LEVEL)
+    raise SystemExit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+import asyncio
+import contextvars
+import json
+from dataclasses import dataclass
+from datetime import timedelta
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, FrozenSet, Optional, Set, Tuple
+from uuid import UUID
+
+import asyncpg
+from sqlalchemy import (
+    BigInteger,
+    Integer,
+    Interval,
+    Text,
+    bindparam,
+    cast,
+    delete,
+    func,
+    or_,
+    select,
+    tuple_,
+)
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import settings
+from app.core.db import engine
+from app.core.logging import get_logger
+from app.subscriptions.models import EVENTS_CHANNEL, SubscriptionEvent
+
+# лента изменений: триггеры пишут события в subscription_events и шлют NOTIFY, одно
+# соединение LISTEN на воркер будит чтение новых строк, а они раздаются подписчикам SSE.
+# Таблица остаётся источником правды: возобновление по Last-Event-ID и отставшие клиенты
+# дочитывают пропущенное из неё
+
+logger = get_logger("app.feed")
+
+Cursor = Tuple[int, int]
+
+RECONNECT_DELAY_MAX_SECONDS = 30
+# удаление пачками: после долгого перерыва старых событий может накопиться много
+PRUNE_BATCH_SIZE = 10000
+
+# транзакции с xid меньше xmin текущего снимка завершены: их события уже не появятся
+HORIZON = cast(cast(func.pg_snapshot_xmin(func.pg_current_snapshot()), Text), BigInteger)
+
+
+@lru_cache(maxsize=None)
+def events_statement(shape: FrozenSet[str]):
+    events = SubscriptionEvent
+    query = select(*SubscriptionEvent.__table__.c).where(
+        tuple_(events.xid, events.id)
+        > tuple_(bindparam("after_xid", type_=BigInteger), bindparam("after_id", type_=BigInteger)),
+        events.xid < HORIZON,
+    )
+    if "user_id" in shape:
+        query = query.where(events.user_id == bindparam("user_id", type_=PG_UUID(as_uuid=True)))
+    if "service_name" in shape:
+        # переименование видно подписчикам и прежнего, и нового сервиса
+        service_name = bindparam("service_name")
+        query = query.where(
+            or_(events.service_name == service_name, events.old_service_name == service_name)
+        )
+    return query.order_by(events.xid, events.id).limit(bindparam("limit", type_=Integer))
+
+
+HEAD_STATEMENT = (
+    select(SubscriptionEvent.xid, SubscriptionEvent.id)
+    .where(SubscriptionEvent.xid < HORIZON)
+    .order_by(SubscriptionEvent.xid.desc(), SubscriptionEvent.id.desc())
+    .limit(1)
+)
+
+PRUNE_STATEMENT = delete(SubscriptionEvent).where(
+    SubscriptionEvent.id.in_(
+        select(SubscriptionEvent.id)
+        .where(SubscriptionEvent.created_at < func.now() - bindparam("retention", type_=Interval))
+        .limit(bindparam("limit", type_=Integer))
+    )
+)
+
+
+async def prune_events(db_engine: AsyncEngine) -> int:
+    # не зависит от подписчиков: события пишутся триггерами, даже если ленту никто не читает
+    params = {
+        "retention": timedelta(hours=settings.FEED_RETENTION_HOURS),
+        "limit": PRUNE_BATCH_SIZE,
+    }
+    pruned = 0
+    while True:
+        async with db_engine.begin() as conn:
+            result = await conn.execute(PRUNE_STATEMENT, params)
+        pruned += result.rowcount
+        if result.rowcount < PRUNE_BATCH_SIZE:
+            return pruned
+
+
+def format_event_id(cursor: Cursor) -> str:
+    return f"{cursor[0]}-{cursor[1]}"
+
+
+def parse_event_id(value: str) -> Cursor:
+    # "0" - с самого старого хранимого события
+    if value.strip() == "0":
+        return 0, 0
+    try:
+        xid, event_id = value.strip().split("-")
+        return int(xid), int(event_id)
+    except ValueError as err:
+        raise ValueError(f"Invalid event id: {value!r}") from err
+
+
+@dataclass(frozen=True)
+class FeedEvent:
+    cursor: Cursor
+    user_id: UUID
+    service_name: str
+    old_service_name: Optional[str]
+    # кадр SSE собирается один раз и отдаётся всем подписчикам как есть
+    frame: bytes
+
+    @classmethod
+    def from_row(cls, row: Any) -> "FeedEvent":
+        cursor = (row.xid, row.id)
+        data = {
+            "op": row.op,
+            "subscription_id": str(row.subscription_id),
+            "user_id": str(row.user_id),
+            "service_name": row.service_name,
+            "old_service_name": row.old_service_name,
+            "subscription": row.data,
+            "created_at": row.created_at.isoformat(),
+        }
+        frame = f"id: {format_event_id(cursor)}\nevent: {row.op}\ndata: {json.dumps(data)}\n\n"
+        return cls(cursor, row.user_id, row.service_name, row.old_service_name, frame.encode())
+
+
+class Subscriber:
+    def __init__(self, user_id: Optional[UUID], service_name: Optional[str], queue_size: int):
+        self.user_id = user_id
+        self.service_name = service_name
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        # очередь переполнилась: новые события не копятся, клиент дочитает их из таблицы
+        self.lagging = False
+
+    def matches(self, event: FeedEvent) -> bool:
+        if self.user_id is not None and event.user_id != self.user_id:
+            return False
+        if self.service_name is not None:
+            return self.service_name in (event.service_name, event.old_service_name)
+        return True
+
+    def offer(self, event: FeedEvent) -> None:
+        if self.lagging:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # медленный клиент не задерживает слушателя и остальных подписчиков
+            self.lagging = True
+
+    def filters(self) -> Dict[str, Any]:
+        params = {"user_id": self.user_id, "service_name": self.service_name}
+        return {name: value for name, value in params.items() if value is not None}
+
+
+class ChangeFeed:
+    def __init__(self, db_engine: AsyncEngine):
+        self.engine = db_engine
+        self.subscribers: Set[Subscriber] = set()
+        self.position: Optional[Cursor] = None
+        self.task: Optional[asyncio.Task] = None
+        self.ready: Optional[asyncio.Event] = None
+        self.wake: Optional[asyncio.Event] = None
+        self.pruner: Optional[asyncio.Task] = None
+
+    def dsn(self) -> str:
+        return self.engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+    def _notified(self, *args: Any) -> None:
+        self.wake.set()
+
+    async def _read(self, shape: FrozenSet[str], params: Dict[str, Any]) -> list:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                events_statement(shape), {**params, "limit": settings.FEED_BATCH_SIZE}
+            )
+            return result.all()
+
+    async def read_after(self, cursor: Cursor, filters: Dict[str, Any]) -> AsyncIterator[FeedEvent]:
+        while True:
+            rows = await self._read(
+                frozenset(filters), {**filters, "after_xid": cursor[0], "after_id": cursor[1]}
+            )
+            for row in rows:
+                event = FeedEvent.from_row(row)
+                cursor = event.cursor
+                yield event
+            if len(rows) < settings.FEED_BATCH_SIZE:
+                return
+
+    async def poll(self) -> None:
+        async for event in self.read_after(self.position, {}):
+            self.position = event.cursor
+            for subscriber in self.subscribers:
+                if subscriber.matches(event):
+                    subscriber.offer(event)
+
+    async def prune_forever(self) -> None:
+        while True:
+            try:
+                pruned = await prune_events(self.engine)
+                if pruned:
+                    logger.info("Pruned %s change feed events", pruned)
+            except Exception as err:
+                logger.warning("Change feed pruning failed: %s", err)
+            await asyncio.sleep(settings.FEED_PRUNE_SECONDS)
+
+    def start_pruning(self) -> None:
+        if settings.FEED_PRUNE_SECONDS and self.pruner is None:
+            self.pruner = asyncio.create_task(self.prune_forever())
+
+    async def listen(self) -> None:
+        conn = await asyncpg.connect(self.dsn())
+        try:
+            await conn.add_listener(EVENTS_CHANNEL, self._notified)
+            if self.position is None:
+                async with self.engine.connect() as db_conn:
+                    head = (await db_conn.execute(HEAD_STATEMENT)).one_or_none()
+                self.position = tuple(head) if head else (0, 0)
+            self.ready.set()
+            while not conn.is_closed():
+                # после переподключения первое чтение забирает всё, что пришло без слушателя
+                self.wake.clear()
+                await self.poll()
+                try:
+                    # NOTIFY будит сразу; таймаут нужен, когда старую транзакцию без событий
+                    # завершили и горизонт сдвинулся без уведомления
+                    await asyncio.wait_for(self.wake.wait(), settings.FEED_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await conn.close(timeout=5)
+        raise ConnectionError("LISTEN connection closed")
+
+    async def run(self) -> None:
+        attempt = 0
+        while True:
+            try:
+                await self.listen()
+            except Exception as err:
+                attempt += 1
+                delay = min(2**attempt, RECONNECT_DELAY_MAX_SECONDS)
+                logger.warning("Change feed listener failed (%s), reconnecting in %s s", err, delay)
+                await asyncio.sleep(delay)
+
+    async def start(self, timeout: float = 10) -> None:
+        # слушатель поднимается с первым подписчиком: воркеру без SSE-клиентов
+        # отдельное соединение не нужно
+        if self.task is None:
+            self.ready, self.wake = asyncio.Event(), asyncio.Event()
+            # общий слушатель не наследует trace_id и профиль запроса первого подписчика
+            self.task = asyncio.create_task(self.run(), context=contextvars.Context())
+        await asyncio.wait_for(self.ready.wait(), timeout)
+
+    async def stop(self) -> None:
+        for task in (self.task, self.pruner):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self.task, self.pruner, self.position = None, None, None
+        self.subscribers.clear()
+
+    async def events(
+        self,
+        user_id: Optional[UUID] = None,
+        service_name: Optional[str] = None,
+        after: Optional[Cursor] = None,
+    ) -> AsyncIterator[Optional[FeedEvent]]:
+        # None - пора отправить heartbeat
+        await self.start()
+        subscriber = Subscriber(user_id, service_name, settings.FEED_QUEUE_SIZE)
+        self.subscribers.add(subscriber)
+        try:
+            cursor = self.position if after is None else after
+            # подписка раньше чтения таблицы: событие не теряется между ними, а повтор
+            # отбрасывается по курсору
+            subscriber.lagging = after is not None
+            while True:
+                if subscriber.lagging and subscriber.queue.empty():
+                    subscriber.lagging = False
+                    async for event in self.read_after(cursor, subscriber.filters()):
+                        cursor = event.cursor
+                        yield event
+                try:
+                    event = await asyncio.wait_for(
+                        subscriber.queue.get(), settings.FEED_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if event.cursor <= cursor:
+                    continue
+                cursor = event.cursor
+                yield event
+        finally:
+            self.subscribers.discard(subscriber)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "listening": self.task is not None and not self.task.done(),
+            "subscribers": len(self.subscribers),
+            "lagging": sum(subscriber.lagging for subscriber in self.subscribers),
+            "position": format_event_id(self.position) if self.position else None,
+        }
+
+
+change_feed = ChangeFeed(engine)
@@ -1,20 +1,54 @@
+import asyncio
+import csv
+import io
+import json
+from contextlib import aclosing
 from datetime import date
-from typing import List, Optional
+from typing import Any, AsyncIterator, List, Literal, Optional, Sequence, Tuple, Union
 from uuid import UUID
 
-from fastapi import Depends, HTTPException, Query
+from fastapi import Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import Row
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.db import get_db_session
+from app.config import settings
+from app.core.cache import cache
+from app.core.db import get_db_session, get_read_db_session, read_session_maker
+from app.core.logging import get_logger
+from app.core.responses import FastJSONResponse
+from app.core.singleflight import SingleFlight
 from app.subscriptions import schemas
-from app.subscriptions.repository import SubscriptionRepository
+from app.subscriptions.feed import change_feed, parse_event_id
+from app.subscriptions.repository import (
+    EXPORT_COLUMNS,
+    SUBSCRIPTION_ROWS,
+    SubscriptionRepository,
+    subscription_from_cache,
+)
+from app.utils.cursor import decode_cursor, encode_cursor
 from app.utils.date import parse_month_year
+from app.utils.etag import etag_matches, make_etag
+
+logger = get_logger("app.subscriptions")
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "application/ndjson")
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+SumEngine = Literal["rollup", "series", "numpy"]
+TotalMode = Literal["exact", "estimated", "auto"]
+
+sum_flight = SingleFlight("sum")
 
 
 def get_repository(
     session: AsyncSession = Depends(get_db_session),
+    read_session: AsyncSession = Depends(get_read_db_session),
 ) -> SubscriptionRepository:
-    return SubscriptionRepository(session)
+    return SubscriptionRepository(session, cache=cache, read_session=read_session)
 
 
 def start_date_query(
@@ -25,12 +59,85 @@ def start_date_query(
     return parse_month_year(start_date)
 
 
+def check_period(start_date: Optional[date], end_date: Optional[date]) -> None:
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date is after end_date")
+
+
 def end_date_query(
     end_date: Optional[str] = Query(None, description="Month-Year MM-YYYY"),
+    start_date: Optional[date] = Depends(start_date_query),
 ) -> Optional[date]:
     if end_date is None:
         return None
-    return parse_month_year(end_date)
+    # start_date_query FastAPI вызывает один раз на запрос, здесь берётся её результат
+    end = parse_month_year(end_date)
+    check_period(start_date, end)
+    return end
+
+
+def parse_bulk_body(body: bytes, content_type: str) -> List[Any]:
+    if content_type.split(";")[0].strip().lower() in NDJSON_CONTENT_TYPES:
+        rows: List[Any] = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError as err:
+                # битая строка не прерывает импорт, а попадает в ошибки этой строки
+                rows.append(err)
+        return rows
+
+    try:
+        rows = json.loads(body)
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail="Invalid JSON body") from err
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array of subscriptions")
+    return rows
+
+
+def validation_errors(err: ValidationError) -> List[dict]:
+    return [
+        {"loc": list(e["loc"]), "msg": e["msg"], "type": e["type"]}
+        for e in err.errors(include_url=False)
+    ]
+
+
+def row_cursor(row: dict) -> str:
+    # строки из кэша уже в JSON-виде, из базы - с date и UUID
+    return encode_cursor(date.fromisoformat(str(row["start_date"])), UUID(str(row["id"])))
+
+
+def cursor_after(cursor: Optional[str], offset: Optional[int]) -> Optional[Tuple[date, UUID]]:
+    if not cursor:
+        return None
+    if offset:
+        raise HTTPException(status_code=400, detail="cursor and offset are exclusive")
+    try:
+        return decode_cursor(cursor)
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err)) from err
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+
+def ndjson_chunk(rows: Sequence[Row]) -> bytes:
+    return "".join(json.dumps(row._asdict(), default=str) + "\n" for row in rows).encode()
+
+
+def csv_chunk(rows: Sequence[Row], header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(column.key for column in EXPORT_COLUMNS)
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
 
 
 class SubscriptionHandler:
@@ -41,14 +148,77 @@ class SubscriptionHandler:
     ) -> schemas.SubscriptionOut:
         return await repo.create(sub)
 
+    async def bulk_create(
+        self,
+        request: Request,
+        repo: SubscriptionRepository = Depends(get_repository),
+    ) -> schemas.SubscriptionBulkResult:
+        rows = parse_bulk_body(await request.body(), request.headers.get("content-type", ""))
+        ids: List[UUID] = []
+        errors: List[schemas.SubscriptionBulkError] = []
+
+        batch_size = settings.BULK_BATCH_SIZE
+        for batch_start in range(0, len(rows), batch_size):
+            batch: List[schemas.SubscriptionCreate] = []
+            batch_indexes: List[int] = []
+            for index, row in enumerate(rows[batch_start : batch_start + batch_size], batch_start):
+                if isinstance(row, ValueError):
+                    errors.append(
+                        schemas.SubscriptionBulkError(
+                            index=index,
+                            errors=[{"msg": f"Invalid JSON: {row}", "type": "json_invalid"}],
+                        )
+                    )
+                    continue
+                try:
+                    batch.append(schemas.SubscriptionCreate.model_validate(row))
+                    batch_indexes.append(index)
+                except ValidationError as err:
+                    errors.append(
+                        schemas.SubscriptionBulkError(index=index, errors=validation_errors(err))
+                    )
+
+            if not batch:
+                continue
+            try:
+                created, failed = await repo.bulk_create(batch)
+            except DBAPIError as err:
+                # отклонённые строки отсеиваются в репозитории, сюда доходят ошибки всей пачки
+                logger.warning("Bulk batch starting at row %s failed: %s", batch_start, err.orig)
+                failed = dict.fromkeys(range(len(batch)), str(err.orig))
+                created = []
+            ids.extend(created)
+            errors.extend(
+                schemas.SubscriptionBulkError(
+                    index=batch_indexes[position], errors=[{"msg": msg, "type": "db_error"}]
+                )
+                for position, msg in failed.items()
+            )
+
+        errors.sort(key=lambda e: e.index)
+        return schemas.SubscriptionBulkResult(created=len(ids), ids=ids, errors=errors)
+
     async def get(
         self,
         subscription_id: UUID,
+        request: Request,
+        response: Response,
         repo: SubscriptionRepository = Depends(get_repository),
     ) -> schemas.SubscriptionOut:
-        sub = await repo.get(subscription_id)
+        if settings.ETAG_ENABLED and "if-none-match" in request.headers:
+            # 304 проверяется по индексу без чтения строки; без If-None-Match ETag берётся
+            # из уже прочитанной строки и лишнего запроса нет
+            updated_at = await repo.get_version(subscription_id)
+            if updated_at is None:
+                raise HTTPException(status_code=404, detail="Subscription not found")
+            if cached := not_modified(request, make_etag(subscription_id, updated_at)):
+                return cached
+
+        sub, updated_at = await repo.get_with_version(subscription_id)
         if not sub:
             raise HTTPException(status_code=404, detail="Subscription not found")
+        if settings.ETAG_ENABLED:
+            response.headers["ETag"] = make_etag(subscription_id, updated_at)
         return sub
 
     async def update(
@@ -72,25 +242,243 @@ class SubscriptionHandler:
             raise HTTPException(status_code=404, detail="Subscription not found")
         return {"message": "Subscription deleted"}
 
+    async def patch_batch(
+        self,
+        payload: schemas.SubscriptionBatchPatch,
+        repo: SubscriptionRepository = Depends(get_repository),
+    ) -> schemas.SubscriptionBatchResult:
+        ids = await repo.patch_many(payload.items)
+        updated = set(ids)
+        not_found = [item.id for item in payload.items if item.id not in updated]
+        return schemas.SubscriptionBatchResult(count=len(ids), ids=ids, not_found=not_found)
+
+    async def update_by_filter(
+        self,
+        sub: schemas.SubscriptionUpdate,
+        user_id: Optional[UUID] = None,
+        service_name: Optional[str] = None,
+        start_date: Optional[date] = Depends(start_date_query),
+        end_date: Optional[date] = Depends(end_date_query),
+        repo: SubscriptionRepository = Depends(get_repository),
+    ) -> schemas.SubscriptionBatchResult:
+        if not user_id and not service_name:
+            raise HTTPException(status_code=400, detail="user_id or service_name is required")
+        if not sub.model_fields_set:
+            raise HTTPException(status_code=400, detail="Nothing to update")
+        ids = await repo.update_by_filter(sub, user_id, service_name, start_date, end_date)
+        return schemas.SubscriptionBatchResult(count=len(ids), ids=ids)
+
+    async def delete_by_filter(
+        self,
+        user_id: Optional[UUID] = None,
+        service_name: Optional[str] = None,
+        start_date: Optional[date] = Depends(start_date_query),
+        end_date: Optional[date] = Depends(end_date_query),
+        repo: SubscriptionRepository = Depends(get_repository),
+    ) -> schemas.SubscriptionBatchResult:
+        # без user_id или сервиса запрос задел бы всю таблицу
+        if not user_id and not service_name:
+            raise HTTPException(status_code=400, detail="user_id or service_name is required")
+        ids = await repo.delete_by_filter(user_id, service_name, start_date, end_date)
+        return schemas.SubscriptionBatchResult(count=len(ids), ids=ids)
+
     async def lists(
         self,
         user_id: UUID,
+        request: Request,
+        response: Response,
         service_name: Optional[str] = None,
         start_date: Optional[date] = Depends(start_date_query),
         end_date: Optional[date] = Depends(end_date_query),
         limit: Optional[int] = 10,
         offset: Optional[int] = 0,
+        cursor: Optional[str] = Query(
+            None, description=f"Курсор следующей страницы из заголовка {NEXT_CURSOR_HEADER}"
+        ),
+        total: Optional[TotalMode] = Query(
+            None,
+            description="Ответ конвертом {items, total, total_estimated}: exact - точный подсчёт, "
+            "estimated - оценка планировщика, auto - точный до LIST_TOTAL_EXACT_LIMIT",
+        ),
         repo: SubscriptionRepository = Depends(get_repository),
-    ) -> List[schemas.SubscriptionOut]:
-        return await repo.list_by_user(user_id, service_name, start_date, end_date, limit, offset)
+    ) -> Union[List[schemas.SubscriptionOut], schemas.SubscriptionPage]:
+        after = cursor_after(cursor, offset)
+        headers = {}
+        count = None
+        if settings.LIST_ETAG_ENABLED:
+            count, digest = await repo.list_version(user_id, service_name, start_date, end_date)
+            # строка запроса задаёт фильтры и страницу, версия - состояние выборки
+            etag = make_etag(request.url.query, count, digest)
+            if cached := not_modified(request, etag):
+                return cached
+            headers["ETag"] = response.headers["ETag"] = etag
+
+        if total:
+            # число подписок для ETag уже точное, второй подсчёт не нужен
+            rows, count, estimated = await repo.list_page(
+                user_id, service_name, start_date, end_date, limit, offset, after, total, count
+            )
+            if limit and len(rows) == limit:
+                headers[NEXT_CURSOR_HEADER] = row_cursor(rows[-1])
+            if settings.RESPONSE_FAST_PATH:
+                return FastJSONResponse(
+                    {"items": rows, "total": count, "total_estimated": estimated}, headers=headers
+                )
+            response.headers.update(headers)
+            # строки из базы и из кэша приводятся к одному JSON-виду, как в кэше подписки
+            items = SUBSCRIPTION_ROWS.dump_python(rows, mode="json")
+            return schemas.SubscriptionPage(
+                items=[subscription_from_cache(item) for item in items],
+                total=count,
+                total_estimated=estimated,
+            )
+
+        if settings.RESPONSE_FAST_PATH:
+            rows = await repo.list_rows_by_user(
+                user_id, service_name, start_date, end_date, limit, offset, after
+            )
+            if limit and len(rows) == limit:
+                headers[NEXT_CURSOR_HEADER] = row_cursor(rows[-1])
+            # готовый Response отдаётся как есть: response_model остаётся только для схемы
+            return FastJSONResponse(rows, headers=headers)
+
+        subs = await repo.list_by_user(
+            user_id, service_name, start_date, end_date, limit, offset, after
+        )
+        if limit and len(subs) == limit:
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(subs[-1].start_date, subs[-1].id)
+        return subs
+
+    async def export(
+        self,
+        request: Request,
+        export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+        user_id: Optional[UUID] = None,
+        service_name: Optional[str] = None,
+        start_date: Optional[date] = Depends(start_date_query),
+        end_date: Optional[date] = Depends(end_date_query),
+    ) -> StreamingResponse:
+        # сессия из зависимости закрывается до начала отдачи тела,
+        # поэтому поток открывает свою и держит серверный курсор до конца выгрузки
+        session_maker = read_session_maker(request)
+
+        async def body() -> AsyncIterator[bytes]:
+            if export_format == "csv":
+                yield csv_chunk([], header=True)
+            async with session_maker() as session:
+                repo = SubscriptionRepository(session)
+                async for rows in repo.iter_export_rows(
+                    user_id, service_name, start_date, end_date
+                ):
+                    yield csv_chunk(rows) if export_format == "csv" else ndjson_chunk(rows)
+
+        media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+        return StreamingResponse(
+            body(),
+            media_type=media_type,
+            headers={
+                "Content-Disposition": f'attachment; filename="subscriptions.{export_format}"'
+            },
+        )
+
+    async def events(
+        self,
+        user_id: Optional[UUID] = None,
+        service_name: Optional[str] = None,
+        last_event_id: Optional[str] = Header(
+            None, description="id последнего полученного события, с него продолжается поток"
+        ),
+        after: Optional[str] = Query(
+            None, description="То же, что Last-Event-ID, для первого подключения; 0 - с начала"
+        ),
+        limit: Optional[int] = Query(None, ge=1, description="Закрыть поток после N событий"),
+    ) -> StreamingResponse:
+        cursor = None
+        if last_event_id or after:
+            try:
+                cursor = parse_event_id(last_event_id or after)
+            except ValueError as err:
+                raise HTTPException(status_code=400, detail=str(err)) from err
+        try:
+            await change_feed.start()
+        except asyncio.TimeoutError as err:
+            raise HTTPException(status_code=503, detail="Change feed is not ready") from err
+
+        async def body() -> AsyncIterator[bytes]:
+            # первый кадр сразу: клиент получает заголовки, не дожидаясь события
+            yield b": connected\n\n"
+            sent = 0
+            async with aclosing(change_feed.events(user_id, service_name, cursor)) as events:
+                async for event in events:
+                    if event is None:
+                        yield b": heartbeat\n\n"
+                        continue
+                    yield event.frame
+                    sent += 1
+                    if limit and sent >= limit:
+                        return
+
+        return StreamingResponse(body(), media_type="text/event-stream", headers=SSE_HEADERS)
 
     async def sums(
         self,
         user_id: UUID,
+        request: Request,
         service_name: Optional[str] = None,
         start_date: Optional[date] = Depends(start_date_query),
         end_date: Optional[date] = Depends(end_date_query),
+        engine: Optional[SumEngine] = Query(
+            None, description="Движок подсчёта, по умолчанию SUM_ENGINE из настроек"
+        ),
         repo: SubscriptionRepository = Depends(get_repository),
     ) -> dict:
-        total = await repo.sum_by_user(user_id, service_name, start_date, end_date)
-        return {"sum": total}
+        if not settings.SUM_SINGLE_FLIGHT:
+            total = await repo.sum_by_user(user_id, service_name, start_date, end_date, engine)
+            return {"sum": total}
+
+        # в ключе и база чтения: клиент в окне read-your-writes не получит ответ реплики
+        engine = engine or settings.SUM_ENGINE
+        session_maker = read_session_maker(request)
+        key = (user_id, service_name, start_date, end_date, engine, session_maker.kw["bind"])
+
+        async def shared_sum() -> int:
+            # своя сессия, а не сессия ведущего запроса: если его клиент отключится, FastAPI
+            # закроет ту сессию, пока остальные ещё ждут результат
+            async with session_maker() as session:
+                shared_repo = SubscriptionRepository(session)
+                return await shared_repo.sum_by_user(
+                    user_id, service_name, start_date, end_date, engine
+                )
+
+        return {"sum": await sum_flight.do(key, shared_sum)}
+
+    async def sums_batch(
+        self,
+        payload: schemas.SubscriptionSumBatchRequest,
+        engine: Optional[SumEngine] = Query(
+            None, description="Движок подсчёта, по умолчанию SUM_ENGINE из настроек"
+        ),
+        repo: SubscriptionRepository = Depends(get_repository),
+    ) -> schemas.SubscriptionSumBatchResult:
+        check_period(payload.start_date, payload.end_date)
+        sums = await repo.sum_by_users(
+            payload.user_ids, payload.service_name, payload.start_date, payload.end_date, engine
+        )
+        return schemas.SubscriptionSumBatchResult(sums=sums)
+
+    async def sums_breakdown(
+        self,
+        user_id: UUID,
+        service_name: Optional[str] = None,
+        start_date: Optional[date] = Depends(start_date_query),
+        end_date: Optional[date] = Depends(end_date_query),
+        by_service: bool = Query(False, description="Разбить каждый месяц по сервисам"),
+        engine: Optional[SumEngine] = Query(
+            None, description="Движок подсчёта, по умолчанию SUM_ENGINE из настроек"
+        ),
+        repo: SubscriptionRepository = Depends(get_repository),
+    ) -> schemas.SubscriptionSpendBreakdown:
+        items = await repo.breakdown_by_user(
+            user_id, service_name, start_date, end_date, by_service, engine
+        )
+        return schemas.SubscriptionSpendBreakdown(sum=sum(item.sum for item in items), items=items)
@@ -1,12 +1,42 @@
 from datetime import date, datetime
 from uuid import UUID, uuid4
 
-from sqlalchemy import Date, DateTime, Index, Integer, String, func
+from sqlalchemy import (
+    DDL,
+    BigInteger,
+    Boolean,
+    CheckConstraint,
+    Computed,
+    Date,
+    DateTime,
+    Identity,
+    Index,
+    Integer,
+    String,
+    event,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import DATERANGE, JSONB, Range
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.core.db import Base
 
+# перевёрнутый период (end_date раньше start_date) пуст: он ни с чем не пересекается,
+# как и в расчёте сумм, где generate_series по нему не даёт ни одного месяца
+PERIOD_EXPRESSION = (
+    "CASE WHEN end_date < start_date THEN 'empty'::daterange "
+    "ELSE daterange(start_date, end_date, '[]') END"
+)
+
+
+def btree_gist_available(ddl, target, bind, **kw) -> bool:
+    # btree_gist входит в contrib официального образа postgres, но не в каждую сборку
+    return bool(
+        bind.scalar(text("SELECT 1 FROM pg_available_extensions WHERE name = 'btree_gist'"))
+    )
+
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
@@ -26,5 +56,140 @@ class Subscription(Base):
         onupdate=func.now(),
         nullable=False,
     )
+    # открытая верхняя граница у бессрочных: фильтр по периоду - одно пересечение &&
+    period: Mapped[Range[date]] = mapped_column(
+        DATERANGE, Computed(PERIOD_EXPRESSION, persisted=True), nullable=False
+    )
+
+    __table_args__ = (
+        # INCLUDE-колонки нужны проверке ETag: фильтры /list/ и updated_at читаются из индекса
+        Index(
+            "ix_subscriptions_user_id_start_date_id_covering",
+            "user_id",
+            "start_date",
+            "id",
+            postgresql_include=["service_name", "end_date", "updated_at", "period"],
+        ),
+        Index("ix_subscriptions_id_updated_at", "id", postgresql_include=["updated_at"]),
+        # /sum/ без свёртки и её пересборка читают строки целиком из этого индекса
+        Index(
+            "ix_subscriptions_user_id_service_name_start_date",
+            "user_id",
+            "service_name",
+            "start_date",
+            postgresql_include=["price", "end_date", "period"],
+        ),
+        # пересечение периодов внутри пользователя без чтения всех его строк
+        Index(
+            "ix_subscriptions_user_id_period",
+            "user_id",
+            "period",
+            postgresql_using="gist",
+        ).ddl_if(callable_=btree_gist_available),
+    )
+
+
+event.listen(
+    Subscription.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(callable_=btree_gist_available),
+)
+
+
+class SubscriptionMonthlySpend(Base):
+    __tablename__ = "subscription_monthly_spend"
+
+    user_id: Mapped[UUID] = mapped_column(PG_UUID(as_uuid=True), primary_key=True)
+    month: Mapped[date] = mapped_column(Date, primary_key=True)
+    service_name: Mapped[str] = mapped_column(String, primary_key=True)
+    # максимум по подпискам с датой окончания и по бессрочным отдельно:
+    # бессрочные учитываются только до текущего месяца включительно
+    max_price: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    open_max_price: Mapped[int | None] = mapped_column(Integer, nullable=True)
+
+
+class SubscriptionRollupState(Base):
+    __tablename__ = "subscription_rollup_state"
+
+    # одна строка: последний месяц, до которого бессрочные подписки разложены в свёртке
+    id: Mapped[bool] = mapped_column(Boolean, primary_key=True, default=True)
+    covered_until: Mapped[date] = mapped_column(Date, nullable=False)
+
+    __table_args__ = (CheckConstraint("id", name="ck_subscription_rollup_state_single_row"),)
 
-    __table_args__ = (Index("ix_subscriptions_user_id", "user_id"),)
+
+class SubscriptionEvent(Base):
+    __tablename__ = "subscription_events"
+
+    id: Mapped[int] = mapped_column(BigInteger, Identity(), primary_key=True)
+    # транзакция записи: id выдаются до коммита и видны не по порядку, а всё, что старше
+    # xmin текущего снимка, уже закоммичено - лента читает по (xid, id) без пропусков
+    xid: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+    op: Mapped[str] = mapped_column(String, nullable=False)
+    subscription_id: Mapped[UUID] = mapped_column(PG_UUID(as_uuid=True), nullable=False)
+    user_id: Mapped[UUID] = mapped_column(PG_UUID(as_uuid=True), nullable=False)
+    service_name: Mapped[str] = mapped_column(String, nullable=False)
+    old_service_name: Mapped[str | None] = mapped_column(String, nullable=True)
+    # подписка в JSON-виде SubscriptionOut, у удалённых NULL
+    data: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+
+    __table_args__ = (
+        Index("ix_subscription_events_xid_id", "xid", "id"),
+        Index("ix_subscription_events_created_at", "created_at"),
+    )
+
+
+EVENTS_CHANNEL = "subscription_events"
+
+# те же поля и JSON-вид, что у SubscriptionOut
+SUBSCRIPTION_JSON = """jsonb_build_object(
+                'service_name', n.service_name, 'price', n.price, 'start_date', n.start_date,
+                'end_date', n.end_date, 'id', n.id, 'user_id', n.user_id)"""
+
+# события пишутся триггерами на уровне оператора: пакетные изменения и импорт дают одну
+# вставку из таблицы переходов и одно уведомление, а не по строке на каждую подписку
+OUTBOX_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION subscriptions_outbox() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO subscription_events (xid, op, subscription_id, user_id, service_name)
+        SELECT pg_current_xact_id()::text::bigint, 'delete', o.id, o.user_id, o.service_name
+        FROM old_rows o;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO subscription_events
+            (xid, op, subscription_id, user_id, service_name, old_service_name, data)
+        SELECT pg_current_xact_id()::text::bigint, 'update', n.id, n.user_id, n.service_name,
+            o.service_name, {SUBSCRIPTION_JSON}
+        FROM new_rows n JOIN old_rows o ON o.id = n.id;
+    ELSE
+        INSERT INTO subscription_events (xid, op, subscription_id, user_id, service_name, data)
+        SELECT pg_current_xact_id()::text::bigint, 'create', n.id, n.user_id, n.service_name,
+            {SUBSCRIPTION_JSON}
+        FROM new_rows n;
+    END IF;
+    PERFORM pg_notify('{EVENTS_CHANNEL}', '');
+    RETURN NULL;
+END
+$$
+"""
+# таблицы переходов нельзя объявить у триггера на несколько событий
+OUTBOX_TRIGGERS = {
+    "INSERT": "REFERENCING NEW TABLE AS new_rows",
+    "UPDATE": "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows",
+    "DELETE": "REFERENCING OLD TABLE AS old_rows",
+}
+
+event.listen(Subscription.__table__, "after_create", DDL(OUTBOX_FUNCTION))
+for _operation, _referencing in OUTBOX_TRIGGERS.items():
+    event.listen(
+        Subscription.__table__,
+        "after_create",
+        DDL(
+            f"CREATE TRIGGER subscriptions_outbox_{_operation.lower()} AFTER {_operation} "
+            f"ON subscriptions {_referencing} FOR EACH STATEMENT "
+            "EXECUTE FUNCTION subscriptions_outbox()"
+        ),
+    )
@@ -0,0 +1,234 @@
+import re
+from datetime import date
+from typing import Callable, List, Literal, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import Connection, text
+
+# онлайн-перестройка таблицы subscriptions (секционирование и обратно): новая таблица
+# создаётся рядом, триггер на старой дублирует в неё все записи, строки копируются
+# пачками, затем таблицы меняются местами под короткой блокировкой.
+# Функции принимают синхронное соединение: их вызывает и миграция Alembic, и команды
+# app.subscriptions.commands через AsyncConnection.run_sync
+
+Scheme = Literal["none", "hash", "range"]
+
+TABLE = "subscriptions"
+NEW_TABLE = "subscriptions_new"
+OLD_TABLE = "subscriptions_old"
+SYNC_TRIGGER = "subscriptions_partition_sync"
+
+PARTITION_KEYS = {"hash": "user_id", "range": "start_date"}
+STRATEGIES = {"h": "hash", "r": "range"}
+# годовые секции для range создаются до текущего года плюс столько лет вперёд,
+# всё остальное попадает в секцию по умолчанию
+RANGE_YEARS_AHEAD = 2
+
+INDEX_DEF = re.compile(r"^CREATE (UNIQUE )?INDEX (\S+) ON (?:ONLY )?(\S+) ")
+
+
+def table_scheme(conn: Connection, table: str = TABLE) -> Optional[Scheme]:
+    exists = conn.scalar(text("SELECT to_regclass(:table) IS NOT NULL"), {"table": table})
+    if not exists:
+        return None
+    strategy = conn.scalar(
+        text(
+            "SELECT partstrat::text FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"
+        ),
+        {"table": table},
+    )
+    return STRATEGIES.get(strategy, "none")
+
+
+def copied_columns(conn: Connection) -> List[str]:
+    # генерируемые колонки считаются в новой таблице сами
+    return list(
+        conn.scalars(
+            text(
+                "SELECT column_name FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND table_name = :table "
+                "AND is_generated = 'NEVER' ORDER BY ordinal_position"
+            ),
+            {"table": TABLE},
+        )
+    )
+
+
+def secondary_indexes(conn: Connection, table: str) -> List[Tuple[str, str]]:
+    rows = conn.execute(
+        text(
+            "SELECT c.relname, pg_get_indexdef(i.indexrelid) FROM pg_index i "
+            "JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE i.indrelid = to_regclass(:table) AND NOT i.indisprimary ORDER BY c.relname"
+        ),
+        {"table": table},
+    )
+    return [(name, definition) for name, definition in rows]
+
+
+def user_triggers(conn: Connection) -> List[str]:
+    return list(
+        conn.scalars(
+            text(
+                "SELECT pg_get_triggerdef(oid) FROM pg_trigger "
+                "WHERE tgrelid = to_regclass(:table) AND NOT tgisinternal AND tgname <> :sync"
+            ),
+            {"table": TABLE, "sync": SYNC_TRIGGER},
+        )
+    )
+
+
+def _create_partitions(conn: Connection, scheme: Scheme, partitions: int) -> None:
+    if scheme == "hash":
+        for remainder in range(partitions):
+            conn.execute(
+                text(
+                    f"CREATE TABLE {TABLE}_h{partitions}_{remainder} PARTITION OF {NEW_TABLE} "
+                    f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+                )
+            )
+    elif scheme == "range":
+        first = conn.scalar(text(f"SELECT min(start_date) FROM {TABLE}")) or date.today()
+        for year in range(first.year, date.today().year + RANGE_YEARS_AHEAD + 1):
+            conn.execute(
+                text(
+                    f"CREATE TABLE {TABLE}_y{year} PARTITION OF {NEW_TABLE} "
+                    f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+                )
+            )
+        conn.execute(text(f"CREATE TABLE {TABLE}_ydefault PARTITION OF {NEW_TABLE} DEFAULT"))
+
+
+def prepare(conn: Connection, scheme: Scheme, partitions: int = 16) -> None:
+    existing = table_scheme(conn, NEW_TABLE)
+    if existing == scheme:
+        # повторный запуск после сбоя: таблица и триггер уже есть, копирование продолжится
+        return
+    if existing is not None:
+        conn.execute(text(f"DROP TABLE {NEW_TABLE}"))
+
+    partition_by, primary_key = "", "id"
+    if scheme != "none":
+        partition_by = f" PARTITION BY {scheme.upper()} ({PARTITION_KEYS[scheme]})"
+        # первичный ключ секционированной таблицы обязан включать ключ секционирования
+        primary_key = f"id, {PARTITION_KEYS[scheme]}"
+    conn.execute(
+        text(
+            f"CREATE TABLE {NEW_TABLE} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS "
+            f"INCLUDING GENERATED){partition_by}"
+        )
+    )
+    conn.execute(
+        text(f"ALTER TABLE {NEW_TABLE} ADD CONSTRAINT {NEW_TABLE}_pkey PRIMARY KEY ({primary_key})")
+    )
+    _create_partitions(conn, scheme, partitions)
+
+    # индексы строятся до копирования: позже CREATE INDEX заблокировал бы триггер,
+    # а с ним и записи в рабочую таблицу
+    for name, definition in secondary_indexes(conn, TABLE):
+        match = INDEX_DEF.match(definition)
+        unique, rest = match.group(1) or "", definition[match.end() :]
+        conn.execute(text(f"CREATE {unique}INDEX {name}_new ON {NEW_TABLE} {rest}"))
+
+    columns = copied_columns(conn)
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"NEW.{column}" for column in columns)
+    conn.execute(
+        text(
+            f"""
+            CREATE OR REPLACE FUNCTION {SYNC_TRIGGER}() RETURNS trigger
+            LANGUAGE plpgsql AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    DELETE FROM {NEW_TABLE} WHERE id = OLD.id;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO {NEW_TABLE} ({column_list}) VALUES ({new_values})
+                    ON CONFLICT DO NOTHING;
+                END IF;
+                RETURN NULL;
+            END
+            $$
+            """
+        )
+    )
+    conn.execute(
+        text(
+            f"CREATE TRIGGER {SYNC_TRIGGER} AFTER INSERT OR UPDATE OR DELETE ON {TABLE} "
+            f"FOR EACH ROW EXECUTE FUNCTION {SYNC_TRIGGER}()"
+        )
+    )
+
+
+def backfill_batch(
+    conn: Connection, after: Optional[UUID], batch_size: int
+) -> Tuple[int, Optional[UUID]]:
+    # FOR SHARE: удаление или изменение строки ждёт конца пачки, и его триггер
+    # срабатывает уже после копирования, поэтому удалённая строка не воскресает
+    column_list = ", ".join(copied_columns(conn))
+    params = {"limit": batch_size}
+    where = ""
+    if after is not None:
+        params["after"] = after
+        where = "WHERE id > :after "
+    row = conn.execute(
+        text(
+            f"""
+            WITH batch AS (
+                SELECT {column_list} FROM {TABLE} {where}ORDER BY id LIMIT :limit FOR SHARE
+            ), copied AS (
+                INSERT INTO {NEW_TABLE} ({column_list}) SELECT {column_list} FROM batch
+                ON CONFLICT DO NOTHING
+            )
+            SELECT count(*), (SELECT id FROM batch ORDER BY id DESC LIMIT 1) FROM batch
+            """
+        ),
+        params,
+    ).one()
+    return row[0], row[1]
+
+
+def backfill(
+    conn: Connection,
+    batch_size: int = 10000,
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    # соединение должно быть в autocommit: каждая пачка - отдельная транзакция
+    copied, after = 0, None
+    while True:
+        count, after = backfill_batch(conn, after, batch_size)
+        if not count:
+            return copied
+        copied += count
+        if progress:
+            progress(copied)
+
+
+def swap(conn: Connection, keep_old: bool = False, lock_timeout: str = "5s") -> None:
+    # вызывается в одной транзакции: блокировка держится только на переименования
+    conn.execute(text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+    conn.execute(text(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE"))
+    old_indexes = [name for name, _ in secondary_indexes(conn, TABLE)]
+    new_indexes = [name for name, _ in secondary_indexes(conn, NEW_TABLE)]
+    triggers = user_triggers(conn)
+
+    conn.execute(text(f"DROP TRIGGER {SYNC_TRIGGER} ON {TABLE}"))
+    conn.execute(text(f"DROP FUNCTION {SYNC_TRIGGER}()"))
+    conn.execute(text(f"ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}"))
+    if keep_old:
+        conn.execute(
+            text(f"ALTER TABLE {OLD_TABLE} RENAME CONSTRAINT {TABLE}_pkey TO {OLD_TABLE}_pkey")
+        )
+        for name in old_indexes:
+            conn.execute(text(f"ALTER INDEX {name} RENAME TO {name}_old"))
+    else:
+        conn.execute(text(f"DROP TABLE {OLD_TABLE}"))
+
+    conn.execute(text(f"ALTER TABLE {NEW_TABLE} RENAME TO {TABLE}"))
+    conn.execute(text(f"ALTER TABLE {TABLE} RENAME CONSTRAINT {NEW_TABLE}_pkey TO {TABLE}_pkey"))
+    for name in new_indexes:
+        conn.execute(text(f"ALTER INDEX {name} RENAME TO {name.removesuffix('_new')}"))
+    # пользовательские триггеры (не синхронизирующий) переезжают на новую таблицу только
+    # сейчас, иначе они срабатывали бы и на копирование
+    for definition in triggers:
+        conn.execute(text(definition))
@@ -0,0 +1,417 @@
+from datetime import date
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import (
+    Date,
+    Integer,
+    Text,
+    and_,
+    any_,
+    bindparam,
+    case,
+    cast,
+    column,
+    delete,
+    func,
+    or_,
+    select,
+    text,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, DATERANGE
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+
+from app.subscriptions.models import Subscription, SubscriptionMonthlySpend
+from app.subscriptions.schemas import SubscriptionOut
+
+# запросы горячих путей собираются один раз на набор переданных фильтров ("форму"),
+# значения уходят bind-параметрами: SQLAlchemy не пересобирает конструкцию и не считает
+# ключ кэша компиляции заново, а asyncpg переиспользует подготовленный запрос
+Shape = FrozenSet[str]
+
+USER_ID = bindparam("user_id", type_=PG_UUID(as_uuid=True))
+USER_IDS = bindparam("user_ids", type_=ARRAY(PG_UUID(as_uuid=True)))
+SUBSCRIPTION_ID = bindparam("subscription_id", type_=PG_UUID(as_uuid=True))
+SUBSCRIPTION_IDS = bindparam("subscription_ids", type_=ARRAY(PG_UUID(as_uuid=True)))
+SERVICE_NAME = bindparam("service_name")
+START_DATE = bindparam("start_date", type_=Date)
+END_DATE = bindparam("end_date", type_=Date)
+
+
+def period_overlaps(start_date=None, end_date=None):
+    lower = cast(start_date, Date) if start_date is not None else None
+    upper = None
+    if end_date is not None:
+        # [start_date, end_date + 1 день) - тот же период, что '[]'; перевёрнутый фильтр ручки
+        # отклоняют с 400, greatest лишь не даёт daterange упасть при вызове репозитория
+        upper = cast(end_date, Date) + 1
+        if lower is not None:
+            upper = func.greatest(upper, lower)
+    overlaps = Subscription.period.overlaps(func.daterange(lower, upper, "[)", type_=DATERANGE))
+    # у подписки с end_date раньше start_date период пуст, но фильтр отбирает её, как и до
+    # колонки period: end_date >= start и start_date <= end (его добавляет вызывающий)
+    reversed_row = Subscription.end_date < Subscription.start_date
+    if start_date is not None:
+        reversed_row = and_(reversed_row, Subscription.end_date >= start_date)
+    return or_(overlaps, reversed_row)
+
+
+def subscription_conditions(
+    user_id=None, service_name=None, start_date=None, end_date=None
+) -> List[Any]:
+    conditions = []
+    if user_id is not None:
+        conditions.append(Subscription.user_id == user_id)
+    if service_name is not None:
+        conditions.append(Subscription.service_name == service_name)
+    if start_date is not None or end_date is not None:
+        conditions.append(period_overlaps(start_date, end_date))
+    if end_date is not None:
+        # следует из пересечения, но по start_date btree-индексы отдают строки пользователя
+        # уже в порядке /list/, чего GiST по period не умеет
+        conditions.append(Subscription.start_date <= end_date)
+    return conditions
+
+
+def filter_params(
+    user_id: Optional[UUID],
+    service_name: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+) -> Dict[str, Any]:
+    # пустые фильтры в запрос не попадают, как и раньше
+    params = {
+        "user_id": user_id,
+        "service_name": service_name,
+        "start_date": start_date,
+        "end_date": end_date,
+    }
+    return {name: value for name, value in params.items() if value}
+
+
+def list_params(
+    user_id: UUID,
+    service_name: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    limit: Optional[int] = None,
+    offset: Optional[int] = None,
+    after: Optional[Tuple[date, UUID]] = None,
+) -> Dict[str, Any]:
+    params = filter_params(user_id, service_name, start_date, end_date)
+    if after:
+        params["after_start_date"], params["after_id"] = after
+    if limit is not None:
+        params["limit"] = limit
+    if offset:
+        params["offset"] = offset
+    return params
+
+
+def _shape_conditions(shape: Shape, prefix: str = "") -> List[Any]:
+    def param(bind):
+        if bind.key not in shape:
+            return None
+        return bindparam(prefix + bind.key, type_=bind.type) if prefix else bind
+
+    conditions = subscription_conditions(
+        param(USER_ID), param(SERVICE_NAME), param(START_DATE), param(END_DATE)
+    )
+    if "user_ids" in shape:
+        conditions.append(Subscription.user_id == any_(USER_IDS))
+    return conditions
+
+
+@lru_cache(maxsize=None)
+def list_statement(shape: Shape):
+    query = select(Subscription).where(*_shape_conditions(shape))
+    if "after_id" in shape:
+        query = query.where(
+            tuple_(Subscription.start_date, Subscription.id)
+            > tuple_(
+                bindparam("after_start_date", type_=Date),
+                bindparam("after_id", type_=PG_UUID(as_uuid=True)),
+            )
+        )
+    query = query.order_by(Subscription.start_date, Subscription.id)
+    if "limit" in shape:
+        query = query.limit(bindparam("limit", type_=Integer))
+    if "offset" in shape:
+        query = query.offset(bindparam("offset", type_=Integer))
+    return query
+
+
+# версии для ETag читаются только из индексов: id INCLUDE updated_at и
+# (user_id, start_date, id) INCLUDE (service_name, end_date, updated_at)
+ITEM_VERSION_STATEMENT = select(Subscription.updated_at).where(Subscription.id == SUBSCRIPTION_ID)
+
+
+@lru_cache(maxsize=None)
+def list_version_statement(shape: Shape):
+    # max(updated_at) не годится: updated_at - время начала транзакции, и изменение из более
+    # старой транзакции, закоммиченной позже, его не сдвинет. XOR хэшей (id, updated_at)
+    # меняется при любом изменении любой строки выборки
+    row_hash = func.hashtextextended(
+        cast(Subscription.id, Text) + cast(Subscription.updated_at, Text), 0
+    )
+    return select(func.count(), func.bit_xor(row_hash)).where(*_shape_conditions(shape))
+
+
+@lru_cache(maxsize=None)
+def total_rows_statement(shape: Shape):
+    query = select(Subscription.id).where(*_shape_conditions(shape))
+    if "total_cap" in shape:
+        query = query.limit(bindparam("total_cap", type_=Integer))
+    return query
+
+
+@lru_cache(maxsize=None)
+def total_statement(shape: Shape):
+    return select(func.count()).select_from(total_rows_statement(shape).subquery("counted"))
+
+
+@lru_cache(maxsize=None)
+def list_rows_statement(shape: Shape):
+    # колонки в порядке полей SubscriptionOut: строка сразу отдаётся в JSON, без ORM-объекта
+    columns = Subscription.__table__.c
+    query = list_statement(shape - {"total", "total_cap"}).with_only_columns(
+        *(columns[name] for name in SubscriptionOut.model_fields)
+    )
+    if "total" in shape:
+        # некоррелированный подзапрос выполняется один раз (InitPlan) по всей выборке фильтра:
+        # count(*) OVER () посчитал бы только строки после курсора и читал бы их целиком
+        query = query.add_columns(total_statement(shape).scalar_subquery().label("total"))
+    return query
+
+
+def _month_price():
+    # бессрочные подписки в свёртке разложены и на будущие месяцы, учитываем их до текущего
+    rollup = SubscriptionMonthlySpend
+    return case(
+        (
+            rollup.month <= func.date_trunc("month", func.current_date()),
+            func.greatest(rollup.max_price, rollup.open_max_price),
+        ),
+        else_=rollup.max_price,
+    )
+
+
+def _rollup_conditions(shape: Shape) -> List[Any]:
+    rollup = SubscriptionMonthlySpend
+    conditions = []
+    if "user_id" in shape:
+        conditions.append(rollup.user_id == USER_ID)
+    if "user_ids" in shape:
+        conditions.append(rollup.user_id == any_(USER_IDS))
+    if "service_name" in shape:
+        conditions.append(rollup.service_name == SERVICE_NAME)
+    if "start_date" in shape:
+        conditions.append(rollup.month >= START_DATE)
+    if "end_date" in shape:
+        conditions.append(rollup.month <= END_DATE)
+    return conditions
+
+
+@lru_cache(maxsize=None)
+def sum_rollup_statement(shape: Shape):
+    return select(func.sum(_month_price()).label("total_sum")).where(*_rollup_conditions(shape))
+
+
+@lru_cache(maxsize=None)
+def sum_rollup_batch_statement(shape: Shape):
+    rollup = SubscriptionMonthlySpend
+    return (
+        select(rollup.user_id, func.sum(_month_price()).label("total_sum"))
+        .where(*_rollup_conditions(shape))
+        .group_by(rollup.user_id)
+    )
+
+
+def _per_service_month(shape: Shape):
+    filtered_subs = (
+        select(
+            Subscription.user_id,
+            Subscription.service_name,
+            Subscription.price,
+            Subscription.start_date,
+            Subscription.end_date,
+        )
+        .where(*_shape_conditions(shape))
+        .subquery("filtered_subs")
+    )
+
+    series_sub = (
+        select(
+            filtered_subs.c.user_id,
+            filtered_subs.c.service_name,
+            filtered_subs.c.price,
+            func.generate_series(
+                func.date_trunc("month", filtered_subs.c.start_date),
+                func.date_trunc(
+                    "month", func.coalesce(filtered_subs.c.end_date, func.current_date())
+                ),
+                text("interval '1 month'"),
+            ).label("month"),
+        )
+        .select_from(filtered_subs)
+        .subquery("series_sub")
+    )
+
+    month_conditions = []
+    if "start_date" in shape:
+        month_conditions.append(series_sub.c.month >= START_DATE)
+    if "end_date" in shape:
+        month_conditions.append(series_sub.c.month <= END_DATE)
+
+    return (
+        select(
+            series_sub.c.user_id,
+            series_sub.c.month,
+            series_sub.c.service_name,
+            func.max(series_sub.c.price).label("max_price"),
+        )
+        .where(*month_conditions)
+        .group_by(series_sub.c.user_id, series_sub.c.month, series_sub.c.service_name)
+        .subquery("per_service_month")
+    )
+
+
+@lru_cache(maxsize=None)
+def sum_series_statement(shape: Shape):
+    per_service_month = _per_service_month(shape)
+    return select(func.sum(per_service_month.c.max_price).label("total_sum"))
+
+
+@lru_cache(maxsize=None)
+def sum_series_batch_statement(shape: Shape):
+    per_service_month = _per_service_month(shape)
+    return select(
+        per_service_month.c.user_id,
+        func.sum(per_service_month.c.max_price).label("total_sum"),
+    ).group_by(per_service_month.c.user_id)
+
+
+@lru_cache(maxsize=None)
+def breakdown_rollup_statement(shape: Shape, by_service: bool):
+    rollup = SubscriptionMonthlySpend
+    columns = [rollup.month, rollup.service_name] if by_service else [rollup.month]
+    total = func.sum(_month_price())
+    # будущие месяцы, где есть только бессрочные подписки, дают NULL и в ряд не попадают
+    return (
+        select(*columns, total.label("total_sum"))
+        .where(*_rollup_conditions(shape))
+        .group_by(*columns)
+        .having(total.is_not(None))
+        .order_by(*columns)
+    )
+
+
+@lru_cache(maxsize=None)
+def breakdown_series_statement(shape: Shape, by_service: bool):
+    per_service_month = _per_service_month(shape)
+    columns = [cast(per_service_month.c.month, Date).label("month")]
+    if by_service:
+        columns.append(per_service_month.c.service_name)
+    return (
+        select(*columns, func.sum(per_service_month.c.max_price).label("total_sum"))
+        .group_by(*columns)
+        .order_by(*columns)
+    )
+
+
+@lru_cache(maxsize=None)
+def sum_rows_statement(shape: Shape):
+    return select(
+        Subscription.user_id,
+        Subscription.service_name,
+        Subscription.price,
+        Subscription.start_date,
+        Subscription.end_date,
+    ).where(*_shape_conditions(shape))
+
+
+def _locked_old(*conditions):
+    # прежнее название сервиса нужно для пересчёта свёртки, RETURNING отдаёт только новое:
+    # UPDATE берёт его из подзапроса, который блокирует те же строки
+    return (
+        select(Subscription.id, Subscription.service_name)
+        .where(*conditions)
+        .with_for_update()
+        .subquery("old")
+    )
+
+
+def _changed_columns(old) -> Tuple[Any, ...]:
+    return (
+        Subscription.id,
+        Subscription.user_id,
+        Subscription.service_name,
+        old.c.service_name.label("old_service_name"),
+    )
+
+
+@lru_cache(maxsize=None)
+def update_statement(fields: Tuple[str, ...]):
+    columns = Subscription.__table__.c
+    old = _locked_old(Subscription.id == SUBSCRIPTION_ID)
+    return (
+        update(Subscription)
+        .where(Subscription.id == old.c.id)
+        .values({name: bindparam(f"new_{name}", type_=columns[name].type) for name in fields})
+        .returning(Subscription, old.c.service_name.label("old_service_name"))
+        .execution_options(synchronize_session=False)
+    )
+
+
+@lru_cache(maxsize=None)
+def patch_many_statement(fields: Tuple[str, ...]):
+    # значения каждой колонки идут одним массивом, а не параметром на строку:
+    # у asyncpg не больше 32767 параметров на запрос
+    columns = Subscription.__table__.c
+    patch = (
+        func.unnest(
+            SUBSCRIPTION_IDS,
+            *(bindparam(f"new_{name}", type_=ARRAY(columns[name].type)) for name in fields),
+        )
+        .table_valued(
+            column("id", PG_UUID(as_uuid=True)),
+            *(column(name, columns[name].type) for name in fields),
+        )
+        .render_derived("patch")
+    )
+    old = _locked_old(Subscription.id == any_(SUBSCRIPTION_IDS))
+    return (
+        update(Subscription)
+        .where(Subscription.id == old.c.id, Subscription.id == patch.c.id)
+        .values({name: patch.c[name] for name in fields})
+        .returning(*_changed_columns(old))
+        .execution_options(synchronize_session=False)
+    )
+
+
+@lru_cache(maxsize=None)
+def update_by_filter_statement(shape: Shape, fields: Tuple[str, ...]):
+    # параметры UPDATE с именами колонок SQLAlchemy дописал бы в SET, поэтому у фильтров
+    # и новых значений свои префиксы
+    columns = Subscription.__table__.c
+    old = _locked_old(*_shape_conditions(shape, prefix="filter_"))
+    return (
+        update(Subscription)
+        .where(Subscription.id == old.c.id)
+        .values({name: bindparam(f"new_{name}", type_=columns[name].type) for name in fields})
+        .returning(*_changed_columns(old))
+        .execution_options(synchronize_session=False)
+    )
+
+
+@lru_cache(maxsize=None)
+def delete_by_filter_statement(shape: Shape):
+    return (
+        delete(Subscription)
+        .where(*_shape_conditions(shape))
+        .returning(Subscription.id, Subscription.user_id, Subscription.service_name)
+        .execution_options(synchronize_session=False)
+    )
@@ -1,81 +1,338 @@
-from datetime import date
-from typing import List, Optional
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
 from uuid import UUID
 
-from sqlalchemy import func, or_, select, text
+from pydantic import TypeAdapter
+from sqlalchemy import Row, delete, insert, select
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.config import settings
+from app.core.cache import Cache
 from app.subscriptions import schemas
 from app.subscriptions.models import Subscription
+from app.subscriptions.queries import (
+    ITEM_VERSION_STATEMENT,
+    breakdown_rollup_statement,
+    breakdown_series_statement,
+    delete_by_filter_statement,
+    filter_params,
+    list_params,
+    list_rows_statement,
+    list_statement,
+    list_version_statement,
+    patch_many_statement,
+    subscription_conditions,
+    sum_rollup_batch_statement,
+    sum_rollup_statement,
+    sum_rows_statement,
+    sum_series_batch_statement,
+    sum_series_statement,
+    total_rows_statement,
+    total_statement,
+    update_by_filter_statement,
+    update_statement,
+)
+from app.subscriptions.rollup import refresh_rollup, rollup_coverage
+from app.subscriptions.vectorized import monthly_breakdown, sum_monthly_max
+
+EXPORT_COLUMNS = (
+    Subscription.service_name,
+    Subscription.price,
+    Subscription.start_date,
+    Subscription.end_date,
+    Subscription.id,
+    Subscription.user_id,
+)
+
+# в кэш строки кладутся в том же JSON-виде, что и SubscriptionOut.model_dump(mode="json")
+SUBSCRIPTION_ROWS = TypeAdapter(List[Dict[str, Any]])
+
+
+def subscription_from_cache(data: Dict[str, Any]) -> schemas.SubscriptionOut:
+    # в кэше лежит JSON-представление, а валидатор схемы принимает даты только как MM-YYYY
+    end_date = data["end_date"]
+    return schemas.SubscriptionOut.model_validate(
+        {
+            **data,
+            "start_date": date.fromisoformat(data["start_date"]),
+            "end_date": date.fromisoformat(end_date) if end_date else None,
+        }
+    )
 
 
 class SubscriptionRepository:
-    def __init__(self, session: AsyncSession):
+    def __init__(
+        self,
+        session: AsyncSession,
+        cache: Optional[Cache] = None,
+        read_session: Optional[AsyncSession] = None,
+    ):
         self.session = session
+        self.cache = cache
+        # чтения без записи идут в реплику, если она настроена; записи - всегда в session
+        self.read_session = read_session or session
+        # кэш заполняют только чтения из основной базы: реплика сразу после записи отдаёт
+        # старые строки, и под новым поколением они жили бы до истечения TTL
+        self.fills_cache = self.read_session is session
+
+    async def _invalidate(
+        self, user_ids: Iterable[UUID] = (), subscription_ids: Iterable[UUID] = ()
+    ) -> None:
+        if not self.cache:
+            return
+        # вызывается после коммита: чтение основной базы под новым поколением уже видит
+        # запись, а реплика, которая её ещё не получила, кэш не заполняет (fills_cache)
+        await self.cache.invalidate_many("user", user_ids)
+        await self.cache.invalidate_many("sub", subscription_ids)
 
     async def _get_subscription_obj(self, subscription_id: UUID) -> Subscription:
-        result = await self.session.execute(
+        result = await self.read_session.execute(
             select(Subscription).where(Subscription.id == subscription_id)
         )
         return result.scalar_one_or_none()
 
     async def create(self, sub_in: schemas.SubscriptionCreate) -> schemas.SubscriptionOut:
-        subscription = Subscription(**sub_in.model_dump())
-        self.session.add(subscription)
+        subscription = await self.session.scalar(
+            insert(Subscription).values(**sub_in.model_dump()).returning(Subscription)
+        )
+        await refresh_rollup(self.session, [(subscription.user_id, subscription.service_name)])
         await self.session.commit()
-        await self.session.refresh(subscription)
+        await self._invalidate(user_ids=[subscription.user_id])
         return schemas.SubscriptionOut.model_validate(subscription)
 
-    async def get(self, subscription_id: UUID) -> Optional[schemas.SubscriptionOut]:
+    async def _insert_isolating(
+        self,
+        items: List[Tuple[int, schemas.SubscriptionCreate]],
+        ids: List[UUID],
+        failed: Dict[int, str],
+    ) -> None:
+        # пачка вставляется в своей точке сохранения; если база отклонила строку, пачка
+        # делится пополам, пока ошибка не сузится до неё: остальные строки вставляются
+        try:
+            async with self.session.begin_nested():
+                result = await self.session.scalars(
+                    insert(Subscription).returning(Subscription.id, sort_by_parameter_order=True),
+                    [sub_in.model_dump() for _, sub_in in items],
+                )
+                inserted = list(result.all())
+        except DBAPIError as err:
+            if len(items) == 1:
+                failed[items[0][0]] = str(err.orig)
+                return
+            middle = len(items) // 2
+            await self._insert_isolating(items[:middle], ids, failed)
+            await self._insert_isolating(items[middle:], ids, failed)
+            return
+        ids.extend(inserted)
+
+    async def bulk_create(
+        self, subs_in: Sequence[schemas.SubscriptionCreate]
+    ) -> Tuple[List[UUID], Dict[int, str]]:
+        # id вставленных строк и ошибки базы по позиции строки в subs_in
+        ids: List[UUID] = []
+        failed: Dict[int, str] = {}
+        try:
+            await self._insert_isolating(list(enumerate(subs_in)), ids, failed)
+            inserted = [sub_in for index, sub_in in enumerate(subs_in) if index not in failed]
+            await refresh_rollup(
+                self.session, [(sub_in.user_id, sub_in.service_name) for sub_in in inserted]
+            )
+            await self.session.commit()
+        except Exception:
+            await self.session.rollback()
+            raise
+        await self._invalidate(user_ids=[sub_in.user_id for sub_in in inserted])
+        return ids, failed
+
+    async def get_with_version(
+        self, subscription_id: UUID
+    ) -> Tuple[Optional[schemas.SubscriptionOut], Optional[datetime]]:
+        # updated_at для ETag берётся из той же строки, что и тело, без отдельного запроса
+        cache_key = None
+        if self.cache:
+            cache_key = await self.cache.versioned_key("sub", subscription_id)
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                updated_at = cached.get("updated_at")
+                version = datetime.fromisoformat(updated_at) if updated_at else None
+                return subscription_from_cache(cached), version
+
         sub = await self._get_subscription_obj(subscription_id)
-        if sub:
-            return schemas.SubscriptionOut.model_validate(sub)
-        return None
+        if not sub:
+            return None, None
+        sub_out = schemas.SubscriptionOut.model_validate(sub)
+        if cache_key and self.fills_cache:
+            await self.cache.set(
+                cache_key,
+                {**sub_out.model_dump(mode="json"), "updated_at": sub.updated_at.isoformat()},
+            )
+        return sub_out, sub.updated_at
+
+    async def get(self, subscription_id: UUID) -> Optional[schemas.SubscriptionOut]:
+        sub, _ = await self.get_with_version(subscription_id)
+        return sub
+
+    async def get_version(self, subscription_id: UUID) -> Optional[datetime]:
+        return await self.read_session.scalar(
+            ITEM_VERSION_STATEMENT, {"subscription_id": subscription_id}
+        )
+
+    async def list_version(
+        self,
+        user_id: UUID,
+        service_name: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+    ) -> Tuple[int, Optional[int]]:
+        # версия всей выборки по фильтру, а не страницы: любое изменение в ней меняет ETag
+        # всех страниц, зато запрос не зависит от limit, offset и курсора
+        params = filter_params(user_id, service_name, start_date, end_date)
+        result = await self.read_session.execute(list_version_statement(frozenset(params)), params)
+        count, digest = result.one()
+        return count, digest
 
     async def update(
         self, subscription_id: UUID, sub_in: schemas.SubscriptionUpdate
     ) -> Optional[schemas.SubscriptionOut]:
-        sub = await self._get_subscription_obj(subscription_id)
-        if not sub:
+        values = sub_in.model_dump(exclude_unset=True)
+        if not values:
+            return await self.get(subscription_id)
+
+        # вместе со строкой приходит прежнее название сервиса, см. update_statement
+        params = {f"new_{name}": value for name, value in values.items()}
+        result = await self.session.execute(
+            update_statement(tuple(sorted(values))), {"subscription_id": subscription_id, **params}
+        )
+        row = result.one_or_none()
+        if row is None:
+            await self.session.rollback()
             return None
-        for field, value in sub_in.model_dump(exclude_unset=True).items():
-            setattr(sub, field, value)
+
+        sub = row.Subscription
+        await refresh_rollup(
+            self.session,
+            [(sub.user_id, row.old_service_name), (sub.user_id, sub.service_name)],
+        )
         await self.session.commit()
-        await self.session.refresh(sub)
+        await self._invalidate(user_ids=[sub.user_id], subscription_ids=[sub.id])
         return schemas.SubscriptionOut.model_validate(sub)
 
     async def delete(self, subscription_id: UUID) -> bool:
-        sub = await self._get_subscription_obj(subscription_id)
-        if not sub:
+        result = await self.session.execute(
+            delete(Subscription)
+            .where(Subscription.id == subscription_id)
+            .returning(Subscription.user_id, Subscription.service_name)
+        )
+        row = result.one_or_none()
+        if row is None:
+            await self.session.rollback()
             return False
-        await self.session.delete(sub)
+
+        await refresh_rollup(self.session, [(row.user_id, row.service_name)])
         await self.session.commit()
+        await self._invalidate(user_ids=[row.user_id], subscription_ids=[subscription_id])
         return True
 
+    async def _apply_changes(self, statements: Iterable[Tuple[Any, Dict[str, Any]]]) -> List[UUID]:
+        # все изменения и пересчёт свёртки - одна транзакция: ошибка откатывает всю пачку
+        rows: List[Row] = []
+        try:
+            for statement, params in statements:
+                rows.extend((await self.session.execute(statement, params)).all())
+            keys = [(row.user_id, row.service_name) for row in rows]
+            keys.extend(
+                (row.user_id, row.old_service_name)
+                for row in rows
+                if "old_service_name" in row._fields
+            )
+            await refresh_rollup(self.session, keys)
+            await self.session.commit()
+        except Exception:
+            await self.session.rollback()
+            raise
+        ids = [row.id for row in rows]
+        await self._invalidate(user_ids=[row.user_id for row in rows], subscription_ids=ids)
+        return ids
+
+    async def patch_many(self, items: Sequence[schemas.SubscriptionPatchItem]) -> List[UUID]:
+        # подписки с одинаковым набором полей меняются одним UPDATE ... FROM unnest(...)
+        groups: Dict[Tuple[str, ...], List[Tuple[UUID, Dict[str, Any]]]] = defaultdict(list)
+        for item in items:
+            values = item.model_dump(exclude_unset=True, exclude={"id"})
+            groups[tuple(sorted(values))].append((item.id, values))
+
+        statements = []
+        for fields, group in groups.items():
+            params: Dict[str, Any] = {"subscription_ids": [item_id for item_id, _ in group]}
+            for name in fields:
+                params[f"new_{name}"] = [values[name] for _, values in group]
+            statements.append((patch_many_statement(fields), params))
+        return await self._apply_changes(statements)
+
+    async def update_by_filter(
+        self,
+        sub_in: schemas.SubscriptionUpdate,
+        user_id: Optional[UUID] = None,
+        service_name: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+    ) -> List[UUID]:
+        values = sub_in.model_dump(exclude_unset=True)
+        filters = filter_params(user_id, service_name, start_date, end_date)
+        statement = update_by_filter_statement(frozenset(filters), tuple(sorted(values)))
+        params = {f"filter_{name}": value for name, value in filters.items()}
+        params.update({f"new_{name}": value for name, value in values.items()})
+        return await self._apply_changes([(statement, params)])
+
+    async def delete_by_filter(
+        self,
+        user_id: Optional[UUID] = None,
+        service_name: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+    ) -> List[UUID]:
+        params = filter_params(user_id, service_name, start_date, end_date)
+        return await self._apply_changes([(delete_by_filter_statement(frozenset(params)), params)])
+
     def _base_query(
         self,
-        user_id: UUID,
+        user_id: Optional[UUID],
         service_name: Optional[str] = None,
         start_date: Optional[date] = None,
         end_date: Optional[date] = None,
     ):
-        query = select(Subscription)
-        query = query.where(Subscription.user_id == user_id)
+        params = filter_params(user_id, service_name, start_date, end_date)
+        return select(Subscription).where(*subscription_conditions(**params))
 
-        if service_name:
-            query = query.where(Subscription.service_name == service_name)
-
-        if start_date:
-            query = query.where(
-                or_(Subscription.end_date >= start_date, Subscription.end_date.is_(None))
+    async def list_by_user(
+        self,
+        user_id: UUID,
+        service_name: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        after: Optional[Tuple[date, UUID]] = None,
+    ) -> List[schemas.SubscriptionOut]:
+        cache_key = None
+        if self.cache:
+            cache_key = await self.cache.versioned_key(
+                "user", user_id, service_name, start_date, end_date, limit, offset, after
             )
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                return [subscription_from_cache(data) for data in cached]
 
-        if end_date:
-            query = query.where(Subscription.start_date <= end_date)
+        params = list_params(user_id, service_name, start_date, end_date, limit, offset, after)
+        result = await self.read_session.execute(list_statement(frozenset(params)), params)
+        subs = [schemas.SubscriptionOut.model_validate(sub) for sub in result.scalars().all()]
+        if cache_key and self.fills_cache:
+            await self.cache.set(cache_key, [sub.model_dump(mode="json") for sub in subs])
+        return subs
 
-        return query
-
-    async def list_by_user(
+    async def list_rows_by_user(
         self,
         user_id: UUID,
         service_name: Optional[str] = None,
@@ -83,73 +340,258 @@ class SubscriptionRepository:
         end_date: Optional[date] = None,
         limit: Optional[int] = None,
         offset: Optional[int] = None,
-    ) -> List[schemas.SubscriptionOut]:
-        query = self._base_query(user_id, service_name, start_date, end_date)
-        query = query.limit(limit).offset(offset)
+        after: Optional[Tuple[date, UUID]] = None,
+    ) -> List[Dict[str, Any]]:
+        # те же строки, что у list_by_user, но словарями с полями SubscriptionOut, без ORM
+        # и pydantic; ключ кэша общий, значения из кэша отдаются как есть
+        cache_key = None
+        if self.cache:
+            cache_key = await self.cache.versioned_key(
+                "user", user_id, service_name, start_date, end_date, limit, offset, after
+            )
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                return cached
 
-        result = await self.session.execute(query)
-        return [schemas.SubscriptionOut.model_validate(sub) for sub in result.scalars().all()]
+        params = list_params(user_id, service_name, start_date, end_date, limit, offset, after)
+        result = await self.read_session.execute(list_rows_statement(frozenset(params)), params)
+        # dict(zip()) в несколько раз дешевле Row._asdict() на тысячах строк
+        keys = tuple(result.keys())
+        rows = [dict(zip(keys, row, strict=True)) for row in result]
+        if cache_key and self.fills_cache:
+            await self.cache.set(cache_key, SUBSCRIPTION_ROWS.dump_python(rows, mode="json"))
+        return rows
 
-    async def sum_by_user(
+    async def estimate_total(
         self,
         user_id: UUID,
         service_name: Optional[str] = None,
         start_date: Optional[date] = None,
         end_date: Optional[date] = None,
     ) -> int:
-        filtered_subs = (
-            self._base_query(user_id, service_name, start_date, end_date)
-            .with_only_columns(
-                Subscription.service_name,
-                Subscription.price,
-                Subscription.start_date,
-                Subscription.end_date,
-            )
-            .subquery("filtered_subs")
+        # оценка планировщика по статистике ANALYZE: EXPLAIN без выполнения запроса
+        params = filter_params(user_id, service_name, start_date, end_date)
+        connection = await self.read_session.connection()
+        compiled = total_rows_statement(frozenset(params)).compile(dialect=connection.dialect)
+        values = compiled.construct_params(params)
+        result = await connection.exec_driver_sql(
+            f"EXPLAIN (FORMAT JSON) {compiled}",
+            tuple(values[name] for name in compiled.positiontup),
         )
+        return int(result.scalar()[0]["Plan"]["Plan Rows"])
 
-        series_sub = (
-            select(
-                filtered_subs.c.service_name,
-                filtered_subs.c.price,
-                func.generate_series(
-                    func.date_trunc("month", filtered_subs.c.start_date),
-                    func.date_trunc(
-                        "month", func.coalesce(filtered_subs.c.end_date, func.current_date())
-                    ),
-                    text("interval '1 month'"),
-                ).label("month"),
-            )
-            .select_from(filtered_subs)
-            .subquery("series_sub")
+    async def _page_total(
+        self,
+        rows: List[Dict[str, Any]],
+        filters: Dict[str, Any],
+        cap: Dict[str, Any],
+        complete: bool,
+    ) -> int:
+        if rows:
+            count = rows[0]["total"]
+            for row in rows:
+                del row["total"]
+            return count
+        if complete:
+            return 0
+        # страница за концом выборки или limit=0: подсчёт приходит только вместе со строками
+        return await self.read_session.scalar(
+            total_statement(frozenset(filters) | frozenset(cap)), {**filters, **cap}
         )
 
-        per_service_month = (
-            select(
-                series_sub.c.month,
-                series_sub.c.service_name,
-                func.max(series_sub.c.price).label("max_price"),
+    async def list_page(
+        self,
+        user_id: UUID,
+        service_name: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        after: Optional[Tuple[date, UUID]] = None,
+        total: str = "auto",
+        known_total: Optional[int] = None,
+    ) -> Tuple[List[Dict[str, Any]], int, bool]:
+        # строки как у list_rows_by_user и число подписок под фильтром тем же запросом;
+        # known_total - уже посчитанное точное число, например для ETag
+        cache_key = None
+        if self.cache:
+            cache_key = await self.cache.versioned_key(
+                "user", user_id, service_name, start_date, end_date, limit, offset, after, total
             )
-            .group_by(series_sub.c.month, series_sub.c.service_name)
-            .subquery("per_service_month")
-        )
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                return cached["items"], cached["total"], cached["total_estimated"]
+
+        filters = filter_params(user_id, service_name, start_date, end_date)
+        counted = known_total is None and total != "estimated"
+        # дальше порога точный подсчёт не нужен: хватает знать, что порог превышен
+        cap = {"total_cap": settings.LIST_TOTAL_EXACT_LIMIT + 1} if total == "auto" else {}
+        params = list_params(user_id, service_name, start_date, end_date, limit, offset, after)
+        shape = frozenset(params)
+        if counted:
+            params.update(cap)
+            shape = frozenset(params) | {"total"}
+        result = await self.read_session.execute(list_rows_statement(shape), params)
+        keys = tuple(result.keys())
+        rows = [dict(zip(keys, row, strict=True)) for row in result]
 
-        per_month_conditions = []
-        if start_date:
-            per_month_conditions.append(per_service_month.c.month >= start_date)
-        if end_date:
-            per_month_conditions.append(per_service_month.c.month <= end_date)
+        count, estimated = known_total, False
+        if counted:
+            # пустая первая страница с ненулевым limit значит, что под фильтр ничего не попало
+            complete = not (offset or after) and limit != 0
+            count = await self._page_total(rows, filters, cap, complete)
+            if count > settings.LIST_TOTAL_EXACT_LIMIT and total == "auto":
+                count = max(count, await self.estimate_total(**filters))
+                estimated = True
+        elif known_total is None:
+            count = await self.estimate_total(**filters)
+            estimated = True
 
-        max_per_month = (
-            select(
-                per_service_month.c.month,
-                func.sum(per_service_month.c.max_price).label("service_max_price"),
+        if cache_key and self.fills_cache:
+            await self.cache.set(
+                cache_key,
+                {
+                    "items": SUBSCRIPTION_ROWS.dump_python(rows, mode="json"),
+                    "total": count,
+                    "total_estimated": estimated,
+                },
             )
-            .where(*per_month_conditions)
-            .group_by(per_service_month.c.month)
-            .subquery("max_per_month")
+        return rows, count, estimated
+
+    async def iter_export_rows(
+        self,
+        user_id: Optional[UUID] = None,
+        service_name: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+    ) -> AsyncIterator[Sequence[Row]]:
+        query = (
+            self._base_query(user_id, service_name, start_date, end_date)
+            .with_only_columns(*EXPORT_COLUMNS)
+            .execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
         )
+        result = await self.read_session.stream(query)
+        async for rows in result.partitions():
+            yield rows
+
+    async def _sum_engine(self, engine: Optional[str]) -> str:
+        engine = engine or settings.SUM_ENGINE
+        # свёртку не продлили до текущего месяца: бессрочные подписки в ней обрываются
+        if engine == "rollup" and not await rollup_coverage.covers(self.read_session):
+            return "series"
+        return engine
+
+    async def sum_by_user(
+        self,
+        user_id: UUID,
+        service_name: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        engine: Optional[str] = None,
+    ) -> int:
+        engine = await self._sum_engine(engine)
+        if engine == "series":
+            return await self.sum_by_user_series(user_id, service_name, start_date, end_date)
+        if engine == "numpy":
+            return await self.sum_by_user_numpy(user_id, service_name, start_date, end_date)
+        return await self.sum_by_user_rollup(user_id, service_name, start_date, end_date)
+
+    async def sum_by_user_rollup(
+        self,
+        user_id: UUID,
+        service_name: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+    ) -> int:
+        params = filter_params(user_id, service_name, start_date, end_date)
+        result = await self.read_session.execute(sum_rollup_statement(frozenset(params)), params)
+        return int(result.scalar() or 0)
 
-        query = select(func.sum(max_per_month.c.service_max_price).label("total_sum"))
-        result = await self.session.execute(query)
+    async def sum_by_user_series(
+        self,
+        user_id: UUID,
+        service_name: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+    ) -> int:
+        params = filter_params(user_id, service_name, start_date, end_date)
+        result = await self.read_session.execute(sum_series_statement(frozenset(params)), params)
         return int(result.scalar() or 0)
+
+    async def sum_by_user_numpy(
+        self,
+        user_id: UUID,
+        service_name: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+    ) -> int:
+        # из базы читаются только сами подписки, раскладка по месяцам идёт в приложении
+        params = filter_params(user_id, service_name, start_date, end_date)
+        result = await self.read_session.execute(sum_rows_statement(frozenset(params)), params)
+        return sum_monthly_max([row[1:] for row in result.all()], start_date, end_date)
+
+    async def breakdown_by_user(
+        self,
+        user_id: UUID,
+        service_name: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        by_service: bool = False,
+        engine: Optional[str] = None,
+    ) -> List[schemas.SubscriptionSpendPoint]:
+        engine = await self._sum_engine(engine)
+        params = filter_params(user_id, service_name, start_date, end_date)
+        shape = frozenset(params)
+        if engine == "numpy":
+            result = await self.read_session.execute(sum_rows_statement(shape), params)
+            points = monthly_breakdown(
+                [row[1:] for row in result.all()], start_date, end_date, by_service
+            )
+        else:
+            if engine == "series":
+                statement = breakdown_series_statement(shape, by_service)
+            else:
+                statement = breakdown_rollup_statement(shape, by_service)
+            result = await self.read_session.execute(statement, params)
+            points = [
+                (row.month, row.service_name if by_service else None, int(row.total_sum))
+                for row in result.all()
+            ]
+        return [
+            schemas.SubscriptionSpendPoint(month=month, service_name=name, sum=total)
+            for month, name, total in points
+        ]
+
+    async def sum_by_users(
+        self,
+        user_ids: Sequence[UUID],
+        service_name: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        engine: Optional[str] = None,
+    ) -> Dict[UUID, int]:
+        engine = await self._sum_engine(engine)
+        user_ids = list(dict.fromkeys(user_ids))
+        totals = dict.fromkeys(user_ids, 0)
+        # один запрос с GROUP BY user_id на пачку, размер пачки ограничивает массив параметров
+        for chunk_start in range(0, len(user_ids), settings.SUM_BATCH_CHUNK_SIZE):
+            params = filter_params(None, service_name, start_date, end_date)
+            params["user_ids"] = user_ids[chunk_start : chunk_start + settings.SUM_BATCH_CHUNK_SIZE]
+            shape = frozenset(params)
+            if engine == "numpy":
+                result = await self.read_session.execute(sum_rows_statement(shape), params)
+                rows_by_user = defaultdict(list)
+                for row in result.all():
+                    rows_by_user[row.user_id].append(row[1:])
+                for user_id, rows in rows_by_user.items():
+                    totals[user_id] = sum_monthly_max(rows, start_date, end_date)
+                continue
+
+            if engine == "series":
+                statement = sum_series_batch_statement(shape)
+            else:
+                statement = sum_rollup_batch_statement(shape)
+            result = await self.read_session.execute(statement, params)
+            for user_id, total in result.all():
+                totals[user_id] = int(total or 0)
+        return totals
@@ -0,0 +1,211 @@
+import time
+from datetime import date
+from typing import Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import Date, Integer, String, bindparam, cast, delete, func, select, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.core.logging import get_logger
+from app.subscriptions.models import (
+    Subscription,
+    SubscriptionMonthlySpend,
+    SubscriptionRollupState,
+)
+
+logger = get_logger("app.rollup")
+
+RollupKey = Tuple[UUID, str]
+
+REFRESH_CHUNK_SIZE = 1000
+# как часто воркер перечитывает, до какого месяца продлена свёртка
+COVERAGE_CHECK_SECONDS = 300
+
+
+def _horizon():
+    # бессрочные подписки раскладываются по месяцам на ROLLUP_HORIZON_MONTHS вперёд,
+    # при чтении отрезаются текущим месяцем
+    return func.date_trunc("month", func.current_date()) + func.make_interval(
+        0, settings.ROLLUP_HORIZON_MONTHS
+    )
+
+
+def store_coverage():
+    statement = pg_insert(SubscriptionRollupState).values(
+        id=True, covered_until=cast(_horizon(), Date)
+    )
+    return statement.on_conflict_do_update(
+        index_elements=[SubscriptionRollupState.id],
+        set_={"covered_until": statement.excluded.covered_until},
+    )
+
+
+COVERAGE_STATEMENT = select(SubscriptionRollupState.covered_until)
+
+
+class RollupCoverage:
+    def __init__(self):
+        self.covered_until: Optional[date] = None
+        self.checked_at = float("-inf")
+
+    async def covers(self, session: AsyncSession) -> bool:
+        current_month = date.today().replace(day=1)
+        if time.monotonic() - self.checked_at >= COVERAGE_CHECK_SECONDS:
+            self.covered_until = await session.scalar(COVERAGE_STATEMENT)
+            self.checked_at = time.monotonic()
+            if self.covered_until is not None and current_month > self.covered_until:
+                logger.warning(
+                    "Rollup covers open-ended subscriptions only until %s, sums fall back to "
+                    "generate_series: run rollup-refresh-open",
+                    self.covered_until,
+                )
+        # строки нет только в базе из create_all (тесты, бенчмарки): свёртку там продлевать
+        # некому, и каждая запись раскладывает свои бессрочные подписки от текущего месяца
+        return self.covered_until is None or current_month <= self.covered_until
+
+
+rollup_coverage = RollupCoverage()
+
+
+def monthly_spend_rows(*conditions):
+    series_sub = (
+        select(
+            Subscription.user_id,
+            Subscription.service_name,
+            Subscription.price,
+            Subscription.end_date,
+            func.generate_series(
+                func.date_trunc("month", Subscription.start_date),
+                func.date_trunc("month", func.coalesce(Subscription.end_date, _horizon())),
+                text("interval '1 month'"),
+            ).label("month"),
+        )
+        .where(*conditions)
+        .subquery("series_sub")
+    )
+
+    return select(
+        series_sub.c.user_id,
+        cast(series_sub.c.month, Date).label("month"),
+        series_sub.c.service_name,
+        func.max(series_sub.c.price).filter(series_sub.c.end_date.is_not(None)).label("max_price"),
+        func.max(series_sub.c.price)
+        .filter(series_sub.c.end_date.is_(None))
+        .label("open_max_price"),
+    ).group_by(series_sub.c.user_id, series_sub.c.month, series_sub.c.service_name)
+
+
+ROLLUP_COLUMNS = ["user_id", "month", "service_name", "max_price", "open_max_price"]
+
+
+# ключи передаются массивами, поэтому текст запросов не зависит от их числа:
+# оба запроса компилируются и подготавливаются один раз на соединение
+KEY_PARAMS = (
+    bindparam("user_ids", type_=ARRAY(PG_UUID(as_uuid=True))),
+    bindparam("service_names", type_=ARRAY(String)),
+)
+
+LOCK_STATEMENT = text(
+    """
+    SELECT pg_advisory_xact_lock(hashtextextended(keys.user_id::text || ':' || keys.service_name, 0))
+    FROM unnest(:user_ids, :service_names) AS keys (user_id, service_name)
+    """
+).bindparams(*KEY_PARAMS)
+
+REFRESH_STATEMENT = text(
+    """
+    WITH keys AS (
+        SELECT * FROM unnest(:user_ids, :service_names) AS keys (user_id, service_name)
+    ),
+    fresh AS (
+        SELECT
+            s.user_id,
+            m.month::date AS month,
+            s.service_name,
+            max(s.price) FILTER (WHERE s.end_date IS NOT NULL) AS max_price,
+            max(s.price) FILTER (WHERE s.end_date IS NULL) AS open_max_price
+        FROM subscriptions s
+        JOIN keys ON keys.user_id = s.user_id AND keys.service_name = s.service_name
+        CROSS JOIN LATERAL generate_series(
+            date_trunc('month', s.start_date),
+            date_trunc(
+                'month',
+                coalesce(
+                    s.end_date,
+                    date_trunc('month', current_date) + make_interval(months => :horizon_months)
+                )
+            ),
+            interval '1 month'
+        ) AS m (month)
+        GROUP BY s.user_id, m.month, s.service_name
+    ),
+    upserted AS (
+        INSERT INTO subscription_monthly_spend
+            (user_id, month, service_name, max_price, open_max_price)
+        SELECT user_id, month, service_name, max_price, open_max_price FROM fresh
+        ON CONFLICT (user_id, month, service_name) DO UPDATE
+        SET max_price = excluded.max_price, open_max_price = excluded.open_max_price
+        -- неизменившиеся месяцы не переписываются: пакетные правки задевают их тысячами
+        WHERE (subscription_monthly_spend.max_price, subscription_monthly_spend.open_max_price)
+            IS DISTINCT FROM (excluded.max_price, excluded.open_max_price)
+    )
+    DELETE FROM subscription_monthly_spend r
+    USING keys
+    WHERE r.user_id = keys.user_id
+      AND r.service_name = keys.service_name
+      AND NOT EXISTS (
+          SELECT 1 FROM fresh f
+          WHERE f.user_id = r.user_id AND f.month = r.month AND f.service_name = r.service_name
+      )
+    """
+).bindparams(*KEY_PARAMS, bindparam("horizon_months", type_=Integer))
+
+
+async def refresh_rollup(session: AsyncSession, keys: Iterable[RollupKey]) -> None:
+    keys = sorted(set(keys))
+    # пакетные изменения задевают сотни тысяч ключей: пересчёт идёт частями в той же транзакции
+    for chunk_start in range(0, len(keys), REFRESH_CHUNK_SIZE):
+        chunk = keys[chunk_start : chunk_start + REFRESH_CHUNK_SIZE]
+        key_params = {
+            "user_ids": [user_id for user_id, _ in chunk],
+            "service_names": [service_name for _, service_name in chunk],
+        }
+
+        # сериализуем пересчёт одного (user_id, service_name) между транзакциями,
+        # иначе параллельные записи перетирают свёртку данными из своих снапшотов;
+        # ключи отсортированы, поэтому блокировки берутся в одном порядке
+        await session.execute(LOCK_STATEMENT, key_params)
+        await session.execute(
+            REFRESH_STATEMENT, {**key_params, "horizon_months": settings.ROLLUP_HORIZON_MONTHS}
+        )
+
+
+async def rebuild_rollup(session: AsyncSession) -> None:
+    # блокируем запись в subscriptions на время перестройки, чтение свёртки не блокируется
+    await session.execute(text("LOCK TABLE subscriptions IN SHARE MODE"))
+    await session.execute(delete(SubscriptionMonthlySpend))
+    await session.execute(
+        pg_insert(SubscriptionMonthlySpend).from_select(ROLLUP_COLUMNS, monthly_spend_rows())
+    )
+    await session.execute(store_coverage())
+    await session.commit()
+
+
+async def refresh_open_ended(session: AsyncSession) -> int:
+    result = await session.execute(
+        select(Subscription.user_id, Subscription.service_name)
+        .where(Subscription.end_date.is_(None))
+        .distinct()
+    )
+    keys: List[RollupKey] = [tuple(row) for row in result.all()]
+    for chunk_start in range(0, len(keys), REFRESH_CHUNK_SIZE):
+        await refresh_rollup(session, keys[chunk_start : chunk_start + REFRESH_CHUNK_SIZE])
+        await session.commit()
+    # все бессрочные подписки продлены: чтение свёртки снова покрывает текущий месяц
+    await session.execute(store_coverage())
+    await session.commit()
+    return len(keys)
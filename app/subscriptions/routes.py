@@ -6,8 +6,16 @@ router = APIRouter()
 handler = SubscriptionHandler()
 
 router.add_api_route("/", handler.create, methods=["POST"], status_code=201)
+router.add_api_route("/bulk/", handler.bulk_create, methods=["POST"])
+router.add_api_route("/batch/", handler.patch_batch, methods=["PATCH"])
+router.add_api_route("/", handler.update_by_filter, methods=["PATCH"])
+router.add_api_route("/", handler.delete_by_filter, methods=["DELETE"])
 router.add_api_route("/{subscription_id}", handler.get, methods=["GET"])
 router.add_api_route("/{subscription_id}", handler.update, methods=["PUT"])
 router.add_api_route("/{subscription_id}", handler.delete, methods=["DELETE"])
 router.add_api_route("/list/", handler.lists, methods=["GET"])
 router.add_api_route("/sum/", handler.sums, methods=["GET"])
+router.add_api_route("/sum/batch/", handler.sums_batch, methods=["POST"])
+router.add_api_route("/sum/breakdown/", handler.sums_breakdown, methods=["GET"])
+router.add_api_route("/export/", handler.export, methods=["GET"])
+router.add_api_route("/events/", handler.events, methods=["GET"])
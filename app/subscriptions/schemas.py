@@ -1,10 +1,14 @@
 from datetime import date
+from typing import Any, Dict, List
 from uuid import UUID
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
 
 from app.utils.date import parse_month_year
 
+# колонка price - integer (int4); границы проверяются только у входных данных
+PRICE_MAX = 2**31 - 1
+
 
 class SubscriptionBase(BaseModel):
     service_name: str = Field(..., description="Название подписки или сервиса")
@@ -21,6 +25,7 @@ class SubscriptionBase(BaseModel):
 
 
 class SubscriptionCreate(SubscriptionBase):
+    price: int = Field(..., ge=0, le=PRICE_MAX, description="Стоимость подписки в рублях")
     user_id: UUID = Field(..., description="ID пользователя, которому принадлежит подписка")
 
     model_config = {
@@ -38,7 +43,7 @@ class SubscriptionCreate(SubscriptionBase):
 
 class SubscriptionUpdate(SubscriptionBase):
     service_name: str | None = Field(None, description="Название подписки")
-    price: int | None = Field(None, description="Стоимость подписки")
+    price: int | None = Field(None, ge=0, le=PRICE_MAX, description="Стоимость подписки")
     start_date: date | None = Field(None, description="Дата начала")
     end_date: date | None = Field(None, description="Дата окончания")
 
@@ -54,6 +59,43 @@ class SubscriptionUpdate(SubscriptionBase):
     }
 
 
+class SubscriptionPatchItem(SubscriptionUpdate):
+    id: UUID = Field(..., description="ID подписки")
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {"id": "123e4567-e89b-12d3-a456-426614174000", "price": 500}
+        }
+    }
+
+    @model_validator(mode="after")
+    def check_not_empty(self):
+        if not self.model_fields_set - {"id"}:
+            raise ValueError("At least one field to update is required")
+        return self
+
+
+class SubscriptionBatchPatch(BaseModel):
+    items: List[SubscriptionPatchItem] = Field(
+        ..., min_length=1, description="Подписки и изменения для каждой из них"
+    )
+
+    @field_validator("items")
+    @classmethod
+    def check_unique_ids(cls, items):
+        if len({item.id for item in items}) != len(items):
+            raise ValueError("Subscription ids must be unique")
+        return items
+
+
+class SubscriptionBatchResult(BaseModel):
+    count: int = Field(..., description="Количество изменённых или удалённых подписок")
+    ids: List[UUID] = Field(..., description="ID изменённых или удалённых подписок")
+    not_found: List[UUID] = Field(
+        default_factory=list, description="ID из запроса, которых нет в базе"
+    )
+
+
 class SubscriptionOut(SubscriptionBase):
     id: UUID = Field(..., description="Уникальный идентификатор подписки")
     user_id: UUID = Field(..., description="ID пользователя")
@@ -70,3 +112,62 @@ class SubscriptionOut(SubscriptionBase):
             }
         }
     }
+
+
+class SubscriptionPage(BaseModel):
+    items: List[SubscriptionOut] = Field(..., description="Подписки на странице")
+    total: int = Field(..., description="Число подписок под фильтром без учёта страницы")
+    total_estimated: bool = Field(
+        ..., description="total - оценка планировщика, а не точный подсчёт"
+    )
+
+
+class SubscriptionBulkError(BaseModel):
+    index: int = Field(..., description="Порядковый номер строки во входных данных")
+    errors: List[dict[str, Any]] = Field(..., description="Ошибки валидации или записи строки")
+
+
+class SubscriptionBulkResult(BaseModel):
+    created: int = Field(..., description="Количество созданных подписок")
+    ids: List[UUID] = Field(..., description="ID созданных подписок в порядке входных строк")
+    errors: List[SubscriptionBulkError] = Field(..., description="Строки, которые не были созданы")
+
+
+class SubscriptionSumBatchRequest(BaseModel):
+    user_ids: List[UUID] = Field(..., min_length=1, description="ID пользователей")
+    service_name: str | None = Field(None, description="Фильтр по названию подписки")
+    start_date: date | None = Field(None, description="Начало периода (месяц-год)")
+    end_date: date | None = Field(None, description="Конец периода (месяц-год)")
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "user_ids": ["550e8400-e29b-41d4-a716-446655440000"],
+                "service_name": "Yandex Plus",
+                "start_date": "01-2025",
+                "end_date": "12-2025",
+            }
+        }
+    }
+
+    @field_validator("start_date", "end_date", mode="before")
+    @classmethod
+    def validate_month_year(cls, v):
+        return parse_month_year(v)
+
+
+class SubscriptionSumBatchResult(BaseModel):
+    sums: Dict[UUID, int] = Field(..., description="Сумма подписок по каждому пользователю")
+
+
+class SubscriptionSpendPoint(BaseModel):
+    month: date = Field(..., description="Первое число месяца")
+    service_name: str | None = Field(
+        None, description="Название подписки, если запрошена разбивка по сервисам"
+    )
+    sum: int = Field(..., description="Сумма подписок за месяц")
+
+
+class SubscriptionSpendBreakdown(BaseModel):
+    sum: int = Field(..., description="Сумма подписок за весь период")
+    items: List[SubscriptionSpendPoint] = Field(..., description="Помесячный ряд по возрастанию")
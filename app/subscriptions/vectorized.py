@@ -0,0 +1,109 @@
+from datetime import date
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+SubscriptionSpan = Tuple[str, int, date, Optional[date]]
+SpendPoint = Tuple[date, Optional[str], int]
+
+EMPTY = np.iinfo(np.int64).min
+
+
+def month_index(value: date) -> int:
+    return value.year * 12 + value.month - 1
+
+
+def month_from_index(index: int) -> date:
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def monthly_max_grid(
+    rows: Iterable[SubscriptionSpan],
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    today: Optional[date] = None,
+) -> Optional[Tuple[np.ndarray, int, np.ndarray]]:
+    # то же, что series-движок в SQL: по каждому месяцу и сервису берётся максимальная
+    # цена, месяцы раскладываются по индексам year * 12 + month без generate_series;
+    # возвращает сервисы, индекс первого месяца и сетку сервисы x месяцы
+    rows = list(rows)
+    if not rows:
+        return None
+    today = today or date.today()
+
+    services, service_codes = np.unique([row[0] for row in rows], return_inverse=True)
+    prices = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+    first = np.fromiter((month_index(row[2]) for row in rows), dtype=np.int64, count=len(rows))
+    last = np.fromiter(
+        (month_index(row[3] or today) for row in rows), dtype=np.int64, count=len(rows)
+    )
+
+    # месяц учитывается, если его первое число попадает в [start_date, end_date]
+    if start_date:
+        first = np.maximum(first, month_index(start_date) + (start_date.day > 1))
+    if end_date:
+        last = np.minimum(last, month_index(end_date))
+
+    keep = first <= last
+    if not keep.any():
+        return None
+    service_codes, prices, first, last = (
+        service_codes[keep],
+        prices[keep],
+        first[keep],
+        last[keep],
+    )
+
+    base = int(first.min())
+    span = int(last.max() - base + 1)
+    lengths = last - first + 1
+    # разворачиваем каждую подписку в её месяцы: смещение начала + номер внутри отрезка
+    starts = np.repeat(first - base, lengths)
+    within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    grid = np.full(len(services) * span, EMPTY, dtype=np.int64)
+    np.maximum.at(
+        grid, np.repeat(service_codes, lengths) * span + starts + within, np.repeat(prices, lengths)
+    )
+    return services, base, grid.reshape(len(services), span)
+
+
+def sum_monthly_max(
+    rows: Iterable[SubscriptionSpan],
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    today: Optional[date] = None,
+) -> int:
+    result = monthly_max_grid(rows, start_date, end_date, today)
+    if result is None:
+        return 0
+    _, _, grid = result
+    return int(grid[grid != EMPTY].sum())
+
+
+def monthly_breakdown(
+    rows: Iterable[SubscriptionSpan],
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    by_service: bool = False,
+    today: Optional[date] = None,
+) -> List[SpendPoint]:
+    result = monthly_max_grid(rows, start_date, end_date, today)
+    if result is None:
+        return []
+    services, base, grid = result
+    filled = grid != EMPTY
+
+    if by_service:
+        # порядок как у SQL: по месяцу, внутри месяца по сервису
+        month_offsets, service_codes = np.nonzero(filled.T)
+        return [
+            (month_from_index(base + int(offset)), str(services[code]), int(grid[code, offset]))
+            for offset, code in zip(month_offsets, service_codes, strict=True)
+        ]
+
+    totals = np.where(filled, grid, 0).sum(axis=0)
+    return [
+        (month_from_index(base + int(offset)), None, int(totals[offset]))
+        for offset in np.flatnonzero(filled.any(axis=0))
+    ]
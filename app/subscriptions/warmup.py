@@ -0,0 +1,19 @@
+import uuid
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.subscriptions.repository import SubscriptionRepository
+
+
+async def warm_statements(session: AsyncSession) -> None:
+    # те же запросы, что у горячих ручек с параметрами по умолчанию: asyncpg готовит их
+    # и загружает типы на этом соединении, SQLAlchemy кладёт компиляцию в свой кэш
+    repo = SubscriptionRepository(session)
+    user_id = uuid.uuid4()
+    await repo.get(user_id)
+    if settings.RESPONSE_FAST_PATH:
+        await repo.list_rows_by_user(user_id, limit=10, offset=0)
+    else:
+        await repo.list_by_user(user_id, limit=10, offset=0)
+    await repo.sum_by_user(user_id)
@@ -0,0 +1,19 @@
+import base64
+import json
+from datetime import date
+from typing import Tuple
+from uuid import UUID
+
+
+def encode_cursor(start_date: date, subscription_id: UUID) -> str:
+    raw = json.dumps([start_date.isoformat(), str(subscription_id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(value: str) -> Tuple[date, UUID]:
+    try:
+        padded = value + "=" * (-len(value) % 4)
+        start_date, subscription_id = json.loads(base64.urlsafe_b64decode(padded))
+        return date.fromisoformat(start_date), UUID(subscription_id)
+    except Exception as err:
+        raise ValueError(f"Invalid cursor: {value!r}") from err
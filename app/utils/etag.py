@@ -0,0 +1,21 @@
+import hashlib
+from typing import Any, Optional
+
+
+def make_etag(*parts: Any) -> str:
+    # слабый валидатор: тело с той же версией данных может отличаться байтами
+    # (обычный и быстрый путь сериализации), но не по смыслу
+    digest = hashlib.blake2b("|".join(map(str, parts)).encode(), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # для If-None-Match сравнение слабое: W/ не учитывается
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(",")
+    )
@@ -0,0 +1,81 @@
+"""Стоимость сборки и компиляции запроса /subscriptions/sum/: прежний путь
+(конструкция собирается заново на каждый запрос) против заранее собранного запроса
+на форму фильтров.
+
+    python -m benchmarks.bench_compile --iterations 2000 --requests 500
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import date
+from typing import Callable, Dict, List
+
+from app.core.db import async_session_maker, engine
+from app.subscriptions.queries import filter_params, sum_series_statement
+from benchmarks.common import print_table, summarize, timed
+
+USER_ID = uuid.uuid4()
+PARAMS = filter_params(USER_ID, "Netflix", date(2025, 1, 1), date(2025, 12, 1))
+SHAPE = frozenset(PARAMS)
+
+
+def build_fresh():
+    # так запрос собирался до кэширования: новая конструкция на каждый вызов
+    return sum_series_statement.__wrapped__(SHAPE)
+
+
+def build_cached():
+    return sum_series_statement(SHAPE)
+
+
+def measure_cpu(build: Callable, iterations: int) -> Dict[str, float]:
+    # ключ кэша компиляции SQLAlchemy считает при каждом execute();
+    # у переиспользуемой конструкции он мемоизирован
+    build_samples: List[float] = []
+    compile_samples: List[float] = []
+    for _ in range(iterations):
+        with timed(build_samples):
+            build()._generate_cache_key()
+        with timed(compile_samples):
+            build().compile(dialect=engine.dialect)
+    return {
+        "build + cache key": summarize(build_samples),
+        "full compile": summarize(compile_samples),
+    }
+
+
+async def measure_requests(build: Callable, requests: int) -> Dict[str, Dict[str, float]]:
+    samples: List[float] = []
+    cpu_started = time.process_time()
+    async with async_session_maker() as session:
+        for _ in range(requests):
+            with timed(samples):
+                await session.execute(build(), PARAMS)
+    cpu_per_request = (time.process_time() - cpu_started) / requests
+    return {
+        "request latency": summarize(samples),
+        "request cpu": summarize([cpu_per_request]),
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    try:
+        for title, build in (
+            ("before: statement rebuilt per request", build_fresh),
+            ("after: prebuilt statement per filter shape", build_cached),
+        ):
+            await measure_requests(build, 10)
+            rows = measure_cpu(build, args.iterations)
+            rows.update(await measure_requests(build, args.requests))
+            print_table(title, rows)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=500)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,82 @@
+"""Условные GET: полный ответ без ETag, полный ответ с проверкой версии и 304 на
+If-None-Match для GET /subscriptions/{id} и /list/.
+
+    python -m benchmarks.bench_etag --requests 300 --limit 100
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+import httpx
+from sqlalchemy import String, func, select
+
+from app.config import settings
+from app.core.db import async_session_maker, engine
+from app.main import app
+from app.subscriptions.models import Subscription
+from benchmarks.common import print_table, summarize, timed
+
+
+async def measure(
+    client: httpx.AsyncClient, path: str, requests: int, if_none_match: Optional[str]
+) -> Dict[str, float]:
+    headers = {"If-None-Match": if_none_match} if if_none_match else {}
+    samples: List[float] = []
+    size = 0
+    cpu_started = time.process_time()
+    for _ in range(requests):
+        with timed(samples):
+            resp = await client.get(path, headers=headers)
+        size = len(resp.content)
+    row = summarize(samples)
+    row["cpu_ms"] = (time.process_time() - cpu_started) / requests * 1000
+    row["bytes"] = size
+    return row
+
+
+async def main(args: argparse.Namespace) -> None:
+    try:
+        async with async_session_maker() as session:
+            row = (
+                await session.execute(
+                    select(Subscription.user_id, func.min(Subscription.id.cast(String)))
+                    .group_by(Subscription.user_id)
+                    .having(func.count() >= args.limit)
+                    .order_by(func.count())
+                    .limit(1)
+                )
+            ).first()
+        if row is None:
+            raise SystemExit("Database is empty, run python -m benchmarks.seed first")
+        user_id, subscription_id = row
+
+        paths = {
+            "GET /{id}": f"/subscriptions/{subscription_id}",
+            f"GET /list/ limit={args.limit}": f"/subscriptions/list/?user_id={user_id}"
+            f"&limit={args.limit}",
+        }
+        rows: Dict[str, Dict[str, float]] = {}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, path in paths.items():
+                settings.ETAG_ENABLED = settings.LIST_ETAG_ENABLED = False
+                await measure(client, path, 20, None)
+                rows[f"{name}: no etag"] = await measure(client, path, args.requests, None)
+                settings.ETAG_ENABLED = settings.LIST_ETAG_ENABLED = True
+                etag = (await client.get(path)).headers["etag"]
+                rows[f"{name}: 200 + etag"] = await measure(client, path, args.requests, None)
+                rows[f"{name}: 304"] = await measure(client, path, args.requests, etag)
+        print_table("conditional GET", rows)
+        for name, row in rows.items():
+            print(f"  {name}: cpu {row['cpu_ms']:.2f} ms/request, body {row['bytes']:.0f} bytes")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--limit", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,84 @@
+"""Задержка /health и GET /subscriptions/{id}: прежний add_trace_id через
+app.middleware("http") (BaseHTTPMiddleware) против чистого ASGI TraceMiddleware.
+
+    python -m benchmarks.bench_http --requests 3000 --concurrency 10
+"""
+
+import argparse
+import asyncio
+import random
+from typing import Dict, List
+
+import httpx
+from fastapi import FastAPI, Request
+from sqlalchemy import select
+
+from app.config import settings
+from app.core.context import trace_id_ctx
+from app.core.db import async_session_maker, engine
+from app.core.metrics import MetricsMiddleware
+from app.main import app
+from app.subscriptions.models import Subscription
+from benchmarks.common import print_table, summarize, timed
+
+
+async def legacy_add_trace_id(request: Request, call_next):
+    trace_id_ctx.set(random.randint(10**12, 10**13 - 1))
+    return await call_next(request)
+
+
+def build_legacy_app() -> FastAPI:
+    # те же маршруты, что у app, но со старым middleware
+    legacy = FastAPI()
+    legacy.router.routes.extend(app.router.routes)
+    legacy.middleware("http")(legacy_add_trace_id)
+    if settings.METRICS_ENABLED:
+        legacy.add_middleware(MetricsMiddleware)
+    return legacy
+
+
+async def measure(client: httpx.AsyncClient, path: str, requests: int, concurrency: int):
+    samples: List[float] = []
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        for _ in remaining:
+            with timed(samples):
+                resp = await client.get(path)
+            resp.raise_for_status()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(samples)
+
+
+async def main(args: argparse.Namespace) -> None:
+    try:
+        async with async_session_maker() as session:
+            subscription_id = await session.scalar(select(Subscription.id).limit(1))
+        if subscription_id is None:
+            raise SystemExit("Database is empty, run python -m benchmarks.seed first")
+
+        paths = {"/health": "/health", "GET /{id}": f"/subscriptions/{subscription_id}"}
+        for title, target in (
+            ("before: BaseHTTPMiddleware", build_legacy_app()),
+            ("after: ASGI", app),
+        ):
+            rows: Dict[str, Dict[str, float]] = {}
+            transport = httpx.ASGITransport(app=target)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                for name, path in paths.items():
+                    for concurrency in (1, args.concurrency):
+                        await measure(client, path, 200, concurrency)
+                        rows[f"{name} c={concurrency}"] = await measure(
+                            client, path, args.requests, concurrency
+                        )
+            print_table(title, rows)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
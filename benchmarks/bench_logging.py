@@ -0,0 +1,97 @@
+"""Задержка event loop и стоимость вызова логгера: синхронный StreamHandler против очереди
+с фоновым QueueListener. Медленный stdout (pipe, docker log driver) имитируется задержкой
+на каждую запись.
+
+    python -m benchmarks.bench_logging --records 2000 --workers 10 --write-delay-us 200
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, List
+
+from app.core.logging import TraceIdFilter, build_handler, stop_logging
+from app.core.metrics import LOG_RECORDS_DROPPED
+from benchmarks.common import print_table, summarize, timed
+
+STATEMENT = (
+    "SELECT subscriptions.id, subscriptions.service_name, subscriptions.price\n"
+    "FROM subscriptions\nWHERE subscriptions.user_id = $1::UUID "
+    "ORDER BY subscriptions.start_date, subscriptions.id\n LIMIT $2::INTEGER"
+)
+
+
+class SlowStream:
+    def __init__(self, stream, delay: float):
+        self.stream = stream
+        self.delay = delay
+
+    def write(self, data):
+        time.sleep(self.delay)
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+
+async def probe_lag(samples: List[float], stop: asyncio.Event) -> None:
+    # насколько позже обещанного просыпается sleep(1 мс) - это и есть задержка event loop
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        samples.append(max(time.perf_counter() - started - 0.001, 0.0))
+
+
+async def run(logger: logging.Logger, records: int, workers: int) -> Dict[str, List[float]]:
+    calls: List[float] = []
+    lag: List[float] = []
+    stop = asyncio.Event()
+
+    async def worker() -> None:
+        for _ in range(records // workers):
+            with timed(calls):
+                logger.info(STATEMENT)
+            await asyncio.sleep(0)
+
+    probe = asyncio.create_task(probe_lag(lag, stop))
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    stop.set()
+    await probe
+    return {"call": calls, "loop lag": lag}
+
+
+async def main(args: argparse.Namespace) -> None:
+    rows: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for mode, queue_size in (("sync", 0), ("queue", args.queue_size)):
+            with open(os.path.join(directory, mode), "w") as sink:
+                handler = build_handler(
+                    args.format, queue_size, SlowStream(sink, args.write_delay_us / 1e6)
+                )
+                handler.addFilter(TraceIdFilter())
+                logger = logging.getLogger(f"bench.logging.{mode}")
+                logger.propagate = False
+                logger.setLevel(logging.INFO)
+                logger.addHandler(handler)
+
+                dropped = LOG_RECORDS_DROPPED._value.get()
+                for name, samples in (await run(logger, args.records, args.workers)).items():
+                    rows[f"{mode} {name}"] = summarize(samples)
+                # остановка дожидается, пока фоновый поток допишет очередь
+                stop_logging()
+                logger.removeHandler(handler)
+                print(f"{mode}: dropped {LOG_RECORDS_DROPPED._value.get() - dropped:.0f}")
+    print_table(f"logging, write delay {args.write_delay_us} us", rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=10)
+    parser.add_argument("--queue-size", type=int, default=10000)
+    parser.add_argument("--write-delay-us", type=int, default=200)
+    parser.add_argument("--format", choices=("text", "json"), default="json")
+    asyncio.run(main(parser.parse_args()))
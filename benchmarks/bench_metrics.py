@@ -0,0 +1,129 @@
+"""Накладные расходы метрик Prometheus: middleware на HTTP-запрос и события SQLAlchemy
+с инструментированным пулом на SQL-запрос.
+
+    python -m benchmarks.bench_metrics --iterations 20000 --queries 500 --rounds 10
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.config import settings
+from app.core.db import DATABASE_URL, engine
+from app.core.metrics import (
+    DB_POOL_WAIT,
+    MetricsMiddleware,
+    after_cursor_execute,
+    before_cursor_execute,
+)
+from benchmarks.common import print_table, summarize, timed
+
+
+class Route:
+    path = "/subscriptions/{subscription_id}"
+
+
+async def plain_app(scope, receive, send):
+    scope["route"] = Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def measure_asgi(app, iterations: int) -> List[float]:
+    samples: List[float] = []
+    for _ in range(iterations):
+        scope = {"type": "http", "method": "GET", "path": "/subscriptions/1"}
+        with timed(samples):
+            await app(scope, receive, send)
+    return samples
+
+
+class FakeConnection:
+    def __init__(self):
+        self.info = {}
+
+
+def measure_sql_hooks(iterations: int) -> List[float]:
+    # чистая стоимость того, что добавляется к каждому SQL-запросу: два события и гистограмма
+    # ожидания пула; сеть и база в этот замер не входят
+    conn = FakeConnection()
+    statement = "SELECT subscriptions.id FROM subscriptions WHERE subscriptions.id = $1"
+    samples: List[float] = []
+    for _ in range(iterations):
+        with timed(samples):
+            before_cursor_execute(conn, None, statement, (), None, False)
+            after_cursor_execute(conn, None, statement, (), None, False)
+            DB_POOL_WAIT.observe(0.0)
+    return samples
+
+
+async def measure_queries(bench_engine, queries: int) -> List[float]:
+    # соединение берётся из пула на каждый запрос, чтобы замер включал и ожидание пула
+    samples: List[float] = []
+    for _ in range(queries):
+        with timed(samples):
+            async with bench_engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+    return samples
+
+
+async def main(args: argparse.Namespace) -> None:
+    if not settings.METRICS_ENABLED:
+        raise SystemExit("Run with METRICS_ENABLED=true")
+    bare_engine = create_async_engine(
+        DATABASE_URL, pool_size=settings.DB_POOL_SIZE, max_overflow=settings.DB_MAX_OVERFLOW
+    )
+    try:
+        rows: Dict[str, Dict[str, float]] = {}
+        for name, app in (
+            ("asgi bare", plain_app),
+            ("asgi + metrics", MetricsMiddleware(plain_app)),
+        ):
+            await measure_asgi(app, 1000)
+            rows[name] = summarize(await measure_asgi(app, args.iterations))
+        rows["sql hooks"] = summarize(measure_sql_hooks(args.iterations))
+
+        # SELECT 1 через пул: задержка сети шумит сильнее самих хуков, поэтому прогоны
+        # чередуются, а сравниваются медианы по раундам, в том числе по процессорному времени
+        per_round: Dict[str, List[float]] = {}
+        for _ in range(args.rounds):
+            for name, bench_engine in (("sql", bare_engine), ("sql + metrics", engine)):
+                cpu_started = time.process_time()
+                samples = await measure_queries(bench_engine, args.queries)
+                cpu = (time.process_time() - cpu_started) / args.queries
+                per_round.setdefault(f"{name} wall", []).append(statistics.fmean(samples))
+                per_round.setdefault(f"{name} cpu", []).append(cpu)
+        for name, values in per_round.items():
+            rows[name] = summarize(values)
+        print_table("metrics overhead", rows)
+
+        asgi = rows["asgi + metrics"]["mean_ms"] - rows["asgi bare"]["mean_ms"]
+        print(f"middleware: +{asgi * 1000:.1f} us per request")
+        print(f"sql hooks alone: +{rows['sql hooks']['mean_ms'] * 1000:.1f} us per statement")
+        for kind in ("wall", "cpu"):
+            delta = rows[f"sql + metrics {kind}"]["p50_ms"] - rows[f"sql {kind}"]["p50_ms"]
+            print(f"SELECT 1 {kind}, median over rounds: {delta * 1000:+.1f} us per statement")
+    finally:
+        await bare_engine.dispose()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
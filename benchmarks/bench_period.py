@@ -0,0 +1,116 @@
+"""Фильтр по периоду у самых тяжёлых пользователей: прежнее условие
+(end_date >= start OR end_date IS NULL) AND start_date <= end против пересечения
+period && daterange(start, end). Для каждого окна печатается план самого тяжёлого
+пользователя и задержки страницы /list/, версии для ETag и /sum/ через generate_series.
+
+    python -m benchmarks.bench_period --users 5 --repeat 20
+"""
+
+import argparse
+import asyncio
+from datetime import date
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.dialects import postgresql
+
+from app.core.db import async_session_maker, engine
+from app.subscriptions import queries
+from app.subscriptions.models import Subscription
+from app.subscriptions.repository import SubscriptionRepository
+from benchmarks.common import print_table, summarize, timed
+
+WINDOWS = {
+    "3 months": (date(2024, 3, 1), date(2024, 5, 1)),
+    "2 years": (date(2023, 1, 1), date(2024, 12, 1)),
+    "from 2026": (date(2026, 1, 1), None),
+}
+STATEMENTS = ("list_statement", "list_version_statement", "sum_series_statement")
+
+
+def legacy_conditions(user_id=None, service_name=None, start_date=None, end_date=None):
+    conditions = []
+    if user_id is not None:
+        conditions.append(Subscription.user_id == user_id)
+    if service_name is not None:
+        conditions.append(Subscription.service_name == service_name)
+    if start_date is not None:
+        conditions.append(or_(Subscription.end_date >= start_date, Subscription.end_date.is_(None)))
+    if end_date is not None:
+        conditions.append(Subscription.start_date <= end_date)
+    return conditions
+
+
+def use_conditions(conditions: Callable) -> None:
+    # запросы собираются один раз на форму фильтров, поэтому кэши сбрасываются
+    queries.subscription_conditions = conditions
+    for name in STATEMENTS:
+        getattr(queries, name).cache_clear()
+
+
+async def explain(session, statement, params) -> List[str]:
+    sql = statement.params(**params).compile(
+        dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+    )
+    connection = await session.connection()
+    result = await connection.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {sql}")
+    return [row[0] for row in result if "Scan" in row[0] or "Execution" in row[0]]
+
+
+async def measure(
+    repo: SubscriptionRepository, users: list, start: date, end: Optional[date], repeat: int
+) -> Dict[str, Dict[str, float]]:
+    calls = {
+        "list page": lambda user_id: repo.list_rows_by_user(user_id, None, start, end, 50),
+        "etag version": lambda user_id: repo.list_version(user_id, None, start, end),
+        "sum series": lambda user_id: repo.sum_by_user_series(user_id, None, start, end),
+    }
+    rows: Dict[str, Dict[str, float]] = {}
+    for name, call in calls.items():
+        samples: List[float] = []
+        for user_id in users:
+            await call(user_id)
+            for _ in range(repeat):
+                with timed(samples):
+                    await call(user_id)
+        rows[name] = summarize(samples)
+    return rows
+
+
+async def main(args: argparse.Namespace) -> None:
+    overlap_conditions = queries.subscription_conditions
+    try:
+        async with async_session_maker() as session:
+            users = list(
+                await session.scalars(
+                    select(Subscription.user_id)
+                    .group_by(Subscription.user_id)
+                    .order_by(func.count().desc())
+                    .limit(args.users)
+                )
+            )
+            if not users:
+                raise SystemExit("Database is empty, run python -m benchmarks.seed first")
+            repo = SubscriptionRepository(session)
+            for window, (start, end) in WINDOWS.items():
+                params = queries.filter_params(users[0], None, start, end)
+                for variant, conditions in (("or", legacy_conditions), ("&&", overlap_conditions)):
+                    use_conditions(conditions)
+                    print(f"{window}, {variant}: plan for the heaviest user")
+                    for name in ("list_version_statement", "sum_series_statement"):
+                        statement = getattr(queries, name)(frozenset(params))
+                        for line in await explain(session, statement, params):
+                            print(f"    {name}: {line.strip()}")
+                    print_table(
+                        f"{window}, {variant}", await measure(repo, users, start, end, args.repeat)
+                    )
+    finally:
+        use_conditions(overlap_conditions)
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,116 @@
+"""Ответ /subscriptions/list/ на 1000 строк: ORM-объекты, SubscriptionOut и повторная
+валидация по response_model против строк из базы, сразу сериализуемых orjson.
+
+    python -m benchmarks.bench_serialization --rows 1000 --requests 200
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from datetime import date
+from typing import Dict, List
+
+import httpx
+from pydantic import TypeAdapter
+from sqlalchemy import delete, insert
+
+from app.config import settings
+from app.core.db import async_session_maker, engine
+from app.core.responses import FastJSONResponse
+from app.main import app
+from app.subscriptions import schemas
+from app.subscriptions.models import Subscription
+from app.subscriptions.queries import list_params, list_rows_statement, list_statement
+from benchmarks.common import print_table, summarize, timed
+from benchmarks.seed import SERVICES
+
+SUBSCRIPTIONS_OUT = TypeAdapter(List[schemas.SubscriptionOut])
+
+
+async def measure_serialization(
+    user_id: uuid.UUID, rows: int, iterations: int
+) -> Dict[str, Dict[str, float]]:
+    # только Python-часть ответа: данные из базы читаются один раз
+    params = list_params(user_id, None, None, None, rows, None, None)
+    async with async_session_maker() as session:
+        orm_rows = (await session.execute(list_statement(frozenset(params)), params)).scalars()
+        orm_rows = orm_rows.all()
+        result = await session.execute(list_rows_statement(frozenset(params)), params)
+        keys = tuple(result.keys())
+        plain_rows = result.all()
+
+    model_samples: List[float] = []
+    fast_samples: List[float] = []
+    for _ in range(iterations):
+        with timed(model_samples):
+            # как раньше: model_validate в репозитории, затем проверка и dump по response_model
+            subs = [schemas.SubscriptionOut.model_validate(sub) for sub in orm_rows]
+            json.dumps(
+                SUBSCRIPTIONS_OUT.dump_python(SUBSCRIPTIONS_OUT.validate_python(subs), mode="json")
+            )
+        with timed(fast_samples):
+            FastJSONResponse([dict(zip(keys, row, strict=True)) for row in plain_rows])
+    return {
+        "serialize: models": summarize(model_samples),
+        "serialize: orjson rows": summarize(fast_samples),
+    }
+
+
+async def measure_http(user_id: uuid.UUID, rows: int, requests: int) -> Dict[str, Dict[str, float]]:
+    result: Dict[str, Dict[str, float]] = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, fast_path in (("models", False), ("orjson rows", True)):
+            settings.RESPONSE_FAST_PATH = fast_path
+            path = f"/subscriptions/list/?user_id={user_id}&limit={rows}"
+            for _ in range(20):
+                (await client.get(path)).raise_for_status()
+            samples: List[float] = []
+            cpu_started = time.process_time()
+            for _ in range(requests):
+                with timed(samples):
+                    resp = await client.get(path)
+                assert len(resp.json()) == rows
+            cpu = (time.process_time() - cpu_started) / requests
+            result[f"GET /list/: {name}"] = summarize(samples)
+            result[f"GET /list/: {name} cpu"] = summarize([cpu])
+    return result
+
+
+async def main(args: argparse.Namespace) -> None:
+    # отдельный пользователь с нужным числом строк, после замера удаляется
+    user_id = uuid.uuid4()
+    values = [
+        {
+            "user_id": user_id,
+            "service_name": random.choice(SERVICES),
+            "price": random.randint(100, 2000),
+            "start_date": date(random.randint(2020, 2025), random.randint(1, 12), 1),
+            "end_date": None if i % 3 else date(2026, 12, 1),
+        }
+        for i in range(args.rows)
+    ]
+    try:
+        async with async_session_maker() as session:
+            await session.execute(insert(Subscription), values)
+            await session.commit()
+
+        rows = await measure_serialization(user_id, args.rows, args.iterations)
+        rows.update(await measure_http(user_id, args.rows, args.requests))
+        print_table(f"list response, {args.rows} rows", rows)
+    finally:
+        async with async_session_maker() as session:
+            await session.execute(delete(Subscription).where(Subscription.user_id == user_id))
+            await session.commit()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,77 @@
+"""Всплеск одинаковых /subscriptions/sum/ (загрузка дашборда): каждый запрос в базу
+против объединения одновременных запросов в один.
+
+    python -m benchmarks.bench_singleflight --burst 20 --rounds 30 --engine series
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Dict, List
+
+import httpx
+from sqlalchemy import func, select
+
+from app.config import settings
+from app.core.db import async_session_maker, engine
+from app.main import app
+from app.subscriptions import handlers
+from app.subscriptions.models import Subscription
+from benchmarks.common import print_table, summarize, timed
+
+
+async def burst(client: httpx.AsyncClient, url: str, size: int, samples: List[float]) -> None:
+    async def one() -> None:
+        with timed(samples):
+            resp = await client.get(url)
+        resp.raise_for_status()
+
+    await asyncio.gather(*(one() for _ in range(size)))
+
+
+async def main(args: argparse.Namespace) -> None:
+    try:
+        async with async_session_maker() as session:
+            # самый тяжёлый пользователь: на нём дублирование запроса обходится дороже всего
+            user_id = await session.scalar(
+                select(Subscription.user_id)
+                .group_by(Subscription.user_id)
+                .order_by(func.count().desc())
+                .limit(1)
+            )
+        if user_id is None:
+            raise SystemExit("Database is empty, run python -m benchmarks.seed first")
+
+        url = f"/subscriptions/sum/?user_id={user_id}&engine={args.engine}"
+        rows: Dict[str, Dict[str, float]] = {}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, single_flight in (("every request", False), ("single flight", True)):
+                settings.SUM_SINGLE_FLIGHT = single_flight
+                await burst(client, url, args.burst, [])
+                leaders = handlers.sum_flight.leaders
+                samples: List[float] = []
+                bursts: List[float] = []
+                for _ in range(args.rounds):
+                    started = time.perf_counter()
+                    await burst(client, url, args.burst, samples)
+                    bursts.append(time.perf_counter() - started)
+                rows[f"{name}: request"] = summarize(samples)
+                rows[f"{name}: whole burst"] = summarize(bursts)
+                queries = (
+                    handlers.sum_flight.leaders - leaders
+                    if single_flight
+                    else args.burst * args.rounds
+                )
+                print(f"{name}: {queries / args.rounds:.1f} DB queries per burst of {args.burst}")
+        print_table(f"burst of {args.burst} identical /sum/, engine={args.engine}", rows)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--burst", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=30)
+    parser.add_argument("--engine", choices=("rollup", "series", "numpy"), default="series")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,77 @@
+"""Первые запросы нового воркера: холодный пул (соединение, загрузка типов asyncpg,
+подготовка запросов) против пула, прогретого при старте.
+
+    python -m benchmarks.bench_warmup --rounds 20 --concurrency 5
+"""
+
+import argparse
+import asyncio
+from typing import Dict, List
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app.config import settings
+from app.core.db import DATABASE_URL, async_session_maker, engine
+from app.core.warmup import warm_engine
+from app.subscriptions.models import Subscription
+from app.subscriptions.repository import SubscriptionRepository
+from app.subscriptions.warmup import warm_statements
+from benchmarks.common import print_table, summarize, timed
+
+
+async def first_request(bench_engine, user_id: UUID, subscription_id: UUID) -> None:
+    # то, что делают первые запросы к get, list и sum
+    async with AsyncSession(bench_engine, expire_on_commit=False) as session:
+        repo = SubscriptionRepository(session)
+        await repo.get(subscription_id)
+        await repo.list_rows_by_user(user_id, limit=10, offset=0)
+        await repo.sum_by_user(user_id)
+
+
+async def measure(warm: bool, concurrency: int, user_id: UUID, subscription_id: UUID):
+    bench_engine = create_async_engine(DATABASE_URL, pool_size=concurrency, max_overflow=0)
+    samples: List[float] = []
+    try:
+        if warm:
+            await warm_engine(bench_engine, concurrency, [warm_statements])
+
+        async def one() -> None:
+            with timed(samples):
+                await first_request(bench_engine, user_id, subscription_id)
+
+        await asyncio.gather(*(one() for _ in range(concurrency)))
+    finally:
+        await bench_engine.dispose()
+    return samples
+
+
+async def main(args: argparse.Namespace) -> None:
+    try:
+        async with async_session_maker() as session:
+            row = (await session.execute(select(Subscription.user_id, Subscription.id))).first()
+        if row is None:
+            raise SystemExit("Database is empty, run python -m benchmarks.seed first")
+
+        results: Dict[str, List[float]] = {"cold": [], "warm": []}
+        # прогоны чередуются, чтобы фоновый шум базы делился поровну
+        for _ in range(args.rounds):
+            for name in results:
+                results[name].extend(
+                    await measure(name == "warm", args.concurrency, row.user_id, row.id)
+                )
+        print_table(
+            f"first requests per worker, concurrency {args.concurrency}, "
+            f"SUM_ENGINE={settings.SUM_ENGINE}",
+            {name: summarize(samples) for name, samples in results.items()},
+        )
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,107 @@
+"""Сравнение задержки записи: прежний путь (SELECT + изменение + commit + refresh)
+против одного INSERT/UPDATE/DELETE ... RETURNING.
+
+    python -m benchmarks.bench_writes --iterations 300 --concurrency 20
+"""
+
+import argparse
+import asyncio
+import uuid
+from typing import Dict, List, Optional
+from uuid import UUID
+
+from app.core.db import async_session_maker, engine
+from app.subscriptions import schemas
+from app.subscriptions.models import Subscription
+from app.subscriptions.repository import SubscriptionRepository
+from app.subscriptions.rollup import refresh_rollup
+from benchmarks.common import print_table, summarize, timed
+
+
+class LegacyRepository(SubscriptionRepository):
+    async def create(self, sub_in: schemas.SubscriptionCreate) -> schemas.SubscriptionOut:
+        subscription = Subscription(**sub_in.model_dump())
+        self.session.add(subscription)
+        await self.session.flush()
+        await refresh_rollup(self.session, [(subscription.user_id, subscription.service_name)])
+        await self.session.commit()
+        await self.session.refresh(subscription)
+        return schemas.SubscriptionOut.model_validate(subscription)
+
+    async def update(
+        self, subscription_id: UUID, sub_in: schemas.SubscriptionUpdate
+    ) -> Optional[schemas.SubscriptionOut]:
+        sub = await self._get_subscription_obj(subscription_id)
+        if not sub:
+            return None
+        old_key = (sub.user_id, sub.service_name)
+        for field, value in sub_in.model_dump(exclude_unset=True).items():
+            setattr(sub, field, value)
+        await self.session.flush()
+        await refresh_rollup(self.session, [old_key, (sub.user_id, sub.service_name)])
+        await self.session.commit()
+        await self.session.refresh(sub)
+        return schemas.SubscriptionOut.model_validate(sub)
+
+    async def delete(self, subscription_id: UUID) -> bool:
+        sub = await self._get_subscription_obj(subscription_id)
+        if not sub:
+            return False
+        await self.session.delete(sub)
+        await self.session.flush()
+        await refresh_rollup(self.session, [(sub.user_id, sub.service_name)])
+        await self.session.commit()
+        return True
+
+
+async def worker(repo_class, iterations: int, samples: Dict[str, List[float]]) -> None:
+    user_id = uuid.uuid4()
+    for i in range(iterations):
+        # каждая операция берёт соединение из общего пула, как отдельный HTTP-запрос
+        async with async_session_maker() as session:
+            repo = repo_class(session)
+            with timed(samples["create"]):
+                created = await repo.create(
+                    schemas.SubscriptionCreate(
+                        service_name=f"Bench {i % 5}",
+                        price=100 + i,
+                        user_id=user_id,
+                        start_date="01-2025",
+                        end_date="12-2025",
+                    )
+                )
+        async with async_session_maker() as session:
+            with timed(samples["update"]):
+                await repo_class(session).update(
+                    created.id, schemas.SubscriptionUpdate(price=200 + i)
+                )
+        async with async_session_maker() as session:
+            with timed(samples["delete"]):
+                await repo_class(session).delete(created.id)
+
+
+async def run(repo_class, iterations: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    samples: Dict[str, List[float]] = {"create": [], "update": [], "delete": []}
+    await asyncio.gather(*(worker(repo_class, iterations, samples) for _ in range(concurrency)))
+    return {name: summarize(values) for name, values in samples.items()}
+
+
+async def main(args: argparse.Namespace) -> None:
+    try:
+        # прогрев пула и кэша скомпилированных запросов
+        await run(SubscriptionRepository, 5, 1)
+        await run(LegacyRepository, 5, 1)
+        for title, repo_class in (
+            ("before: SELECT + commit + refresh", LegacyRepository),
+            ("after: single statement RETURNING", SubscriptionRepository),
+        ):
+            print_table(title, await run(repo_class, args.iterations, args.concurrency))
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,44 @@
+import statistics
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000 if samples else 0.0,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+    }
+
+
+@contextmanager
+def timed(samples: List[float]):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        samples.append(time.perf_counter() - started)
+
+
+def print_table(title: str, rows: Dict[str, Dict[str, float]]) -> None:
+    width = max([24, *(len(name) + 2 for name in rows)])
+    print(title)
+    print(
+        f"  {'name':<{width}}{'count':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    )
+    for name, row in rows.items():
+        print(
+            f"  {name:<{width}}{row['count']:>8}{row['mean_ms']:>10.2f}{row['p50_ms']:>10.2f}"
+            f"{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+        )
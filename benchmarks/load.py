@@ -0,0 +1,356 @@
+"""Нагрузочный прогон по всем ручкам app/subscriptions/routes.py.
+
+Каждая ручка прогоняется отдельной фазой: --requests запросов при --concurrency параллельных
+воркерах. Результат (p50/p95/p99 и запросов в секунду) пишется в JSON, два таких файла
+сравниваются командой compare.
+
+    python -m benchmarks.seed --rows 1000000 --truncate
+    python -m benchmarks.load run --output baseline.json
+    python -m benchmarks.load run --base-url http://localhost:8000 --output after.json
+    python -m benchmarks.load compare baseline.json after.json --threshold 0.1
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+import httpx
+from sqlalchemy import func, select
+
+from app.core.db import async_session_maker, engine
+from app.subscriptions.models import Subscription
+from app.subscriptions.routes import router
+from benchmarks.common import print_table, summarize
+from benchmarks.seed import SERVICES
+
+PREFIX = "/subscriptions"
+SAMPLE_SIZE = 1000
+
+
+@dataclass
+class Context:
+    client: httpx.AsyncClient
+    users: List[UUID]
+    subscription_ids: List[UUID]
+    rng: random.Random = field(default_factory=random.Random)
+    # подписки, созданные самим прогоном: их изменяем и удаляем, не трогая засеянные данные
+    created: List[UUID] = field(default_factory=list)
+    bench_user: UUID = field(default_factory=uuid.uuid4)
+
+    def user(self) -> str:
+        return str(self.rng.choice(self.users))
+
+    def filters(self) -> Dict[str, Any]:
+        year = self.rng.randint(2022, 2026)
+        params = {"start_date": f"01-{year}", "end_date": f"12-{year}"}
+        if self.rng.random() < 0.3:
+            params["service_name"] = self.rng.choice(SERVICES)
+        return params
+
+    def payload(self) -> Dict[str, Any]:
+        start_month = self.rng.randint(1, 12)
+        return {
+            "service_name": self.rng.choice(SERVICES),
+            "price": self.rng.randint(10, 300) * 10,
+            "user_id": str(self.bench_user),
+            "start_date": f"{start_month:02d}-2025",
+            "end_date": None if self.rng.random() < 0.3 else "12-2026",
+        }
+
+
+Request = Callable[[Context], Awaitable[httpx.Response]]
+
+
+@dataclass
+class Scenario:
+    request: Request
+    # подготовка вне замера, например заранее созданные подписки для DELETE
+    prepare: Optional[Callable[[Context, int], Awaitable[None]]] = None
+
+
+async def create_for_bench(ctx: Context, count: int) -> None:
+    while len(ctx.created) < count:
+        batch = [ctx.payload() for _ in range(min(1000, count - len(ctx.created)))]
+        resp = await ctx.client.post(f"{PREFIX}/bulk/", json=batch)
+        resp.raise_for_status()
+        ctx.created.extend(UUID(value) for value in resp.json()["ids"])
+
+
+async def post_create(ctx: Context) -> httpx.Response:
+    resp = await ctx.client.post(f"{PREFIX}/", json=ctx.payload())
+    if resp.status_code == 201:
+        ctx.created.append(UUID(resp.json()["id"]))
+    return resp
+
+
+async def post_bulk(ctx: Context) -> httpx.Response:
+    return await ctx.client.post(f"{PREFIX}/bulk/", json=[ctx.payload() for _ in range(100)])
+
+
+async def get_one(ctx: Context) -> httpx.Response:
+    return await ctx.client.get(f"{PREFIX}/{ctx.rng.choice(ctx.subscription_ids)}")
+
+
+async def put_one(ctx: Context) -> httpx.Response:
+    subscription_id = ctx.rng.choice(ctx.created)
+    return await ctx.client.put(
+        f"{PREFIX}/{subscription_id}", json={"price": ctx.rng.randint(10, 300) * 10}
+    )
+
+
+async def delete_one(ctx: Context) -> httpx.Response:
+    return await ctx.client.delete(f"{PREFIX}/{ctx.created.pop()}")
+
+
+async def patch_batch(ctx: Context) -> httpx.Response:
+    ids = ctx.rng.sample(ctx.created, min(100, len(ctx.created)))
+    items = [{"id": str(item_id), "price": ctx.rng.randint(10, 300) * 10} for item_id in ids]
+    return await ctx.client.patch(f"{PREFIX}/batch/", json={"items": items})
+
+
+async def patch_by_filter(ctx: Context) -> httpx.Response:
+    return await ctx.client.patch(
+        f"{PREFIX}/",
+        params={"user_id": str(ctx.bench_user), "service_name": ctx.rng.choice(SERVICES)},
+        json={"price": ctx.rng.randint(10, 300) * 10},
+    )
+
+
+async def delete_by_filter(ctx: Context) -> httpx.Response:
+    return await ctx.client.delete(
+        f"{PREFIX}/",
+        params={"user_id": str(ctx.bench_user), "service_name": ctx.rng.choice(SERVICES)},
+    )
+
+
+async def get_list(ctx: Context) -> httpx.Response:
+    return await ctx.client.get(
+        f"{PREFIX}/list/", params={"user_id": ctx.user(), "limit": 50, **ctx.filters()}
+    )
+
+
+async def get_sum(ctx: Context) -> httpx.Response:
+    return await ctx.client.get(f"{PREFIX}/sum/", params={"user_id": ctx.user(), **ctx.filters()})
+
+
+async def post_sum_batch(ctx: Context) -> httpx.Response:
+    filters = ctx.filters()
+    return await ctx.client.post(
+        f"{PREFIX}/sum/batch/",
+        json={"user_ids": [ctx.user() for _ in range(100)], **filters},
+    )
+
+
+async def get_sum_breakdown(ctx: Context) -> httpx.Response:
+    return await ctx.client.get(
+        f"{PREFIX}/sum/breakdown/",
+        params={"user_id": ctx.user(), "by_service": "true", **ctx.filters()},
+    )
+
+
+async def get_export(ctx: Context) -> httpx.Response:
+    return await ctx.client.get(f"{PREFIX}/export/", params={"user_id": ctx.user()})
+
+
+async def get_events(ctx: Context) -> httpx.Response:
+    # события подписок прогона с начала таблицы: поток закрывается после limit событий
+    return await ctx.client.get(
+        f"{PREFIX}/events/", params={"user_id": str(ctx.bench_user), "after": "0", "limit": 100}
+    )
+
+
+# порядок важен: PUT и DELETE работают с подписками, созданными на предыдущих фазах
+SCENARIOS: Dict[Tuple[str, str], Scenario] = {
+    ("POST", "/"): Scenario(post_create),
+    ("POST", "/bulk/"): Scenario(post_bulk),
+    ("GET", "/{subscription_id}"): Scenario(get_one),
+    ("PUT", "/{subscription_id}"): Scenario(put_one, prepare=create_for_bench),
+    ("DELETE", "/{subscription_id}"): Scenario(delete_one, prepare=create_for_bench),
+    ("GET", "/list/"): Scenario(get_list),
+    ("GET", "/sum/"): Scenario(get_sum),
+    ("POST", "/sum/batch/"): Scenario(post_sum_batch),
+    ("GET", "/sum/breakdown/"): Scenario(get_sum_breakdown),
+    ("GET", "/export/"): Scenario(get_export),
+    ("GET", "/events/"): Scenario(get_events, prepare=create_for_bench),
+    ("PATCH", "/batch/"): Scenario(patch_batch, prepare=create_for_bench),
+    ("PATCH", "/"): Scenario(patch_by_filter),
+    # последним: удаляет подписки прогона целиком по сервису
+    ("DELETE", "/"): Scenario(delete_by_filter, prepare=create_for_bench),
+}
+
+
+def route_keys() -> List[Tuple[str, str]]:
+    return [(method, route.path) for route in router.routes for method in sorted(route.methods)]
+
+
+async def sample_data() -> Tuple[List[UUID], List[UUID]]:
+    # случайные строки, а не случайные пользователи: «тяжёлые» пользователи попадают
+    # в выборку чаще, как и в реальном трафике
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(Subscription.user_id, Subscription.id).order_by(func.random()).limit(SAMPLE_SIZE)
+        )
+        rows = result.all()
+    if not rows:
+        raise SystemExit("Database is empty, run python -m benchmarks.seed first")
+    return [row.user_id for row in rows], [row.id for row in rows]
+
+
+async def run_phase(
+    ctx: Context, scenario: Scenario, requests: int, concurrency: int
+) -> Dict[str, float]:
+    if scenario.prepare:
+        await scenario.prepare(ctx, requests)
+    samples: List[float] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                resp = await scenario.request(ctx)
+                failed = resp.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            samples.append(time.perf_counter() - started)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {**summarize(samples), "errors": errors, "rps": len(samples) / elapsed}
+
+
+def make_client(base_url: Optional[str]) -> httpx.AsyncClient:
+    if base_url:
+        return httpx.AsyncClient(base_url=base_url, timeout=60)
+    # без --base-url приложение крутится в том же процессе, без сети и uvicorn
+    from app.main import app
+
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60
+    )
+
+
+async def run(args: argparse.Namespace) -> int:
+    missing = [key for key in route_keys() if key not in SCENARIOS]
+    if missing:
+        raise SystemExit(f"No load scenario for routes: {missing}")
+
+    try:
+        users, subscription_ids = await sample_data()
+        async with make_client(args.base_url) as client:
+            ctx = Context(client, users, subscription_ids, random.Random(args.seed))
+            results: Dict[str, Dict[str, float]] = {}
+            for method, path in SCENARIOS:
+                if args.only and path not in args.only:
+                    continue
+                name = f"{method} {PREFIX}{path}"
+                # короткий прогрев: пул соединений и кэши запросов
+                await run_phase(ctx, SCENARIOS[(method, path)], args.concurrency, args.concurrency)
+                results[name] = await run_phase(
+                    ctx, SCENARIOS[(method, path)], args.requests, args.concurrency
+                )
+                print(f"{name}: {results[name]['rps']:.1f} rps", file=sys.stderr)
+    finally:
+        await engine.dispose()
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "base_url": args.base_url or "in-process",
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "endpoints": results,
+    }
+    print_table("latency per endpoint", results)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+def compare_reports(
+    baseline: Dict[str, Any], current: Dict[str, Any], threshold: float
+) -> List[str]:
+    regressions = []
+    for name, before in baseline["endpoints"].items():
+        after = current["endpoints"].get(name)
+        if after is None:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            if before[metric] and after[metric] > before[metric] * (1 + threshold):
+                regressions.append(f"{name}: {metric} {before[metric]:.2f} -> {after[metric]:.2f}")
+        if after["rps"] < before["rps"] * (1 - threshold):
+            regressions.append(f"{name}: rps {before['rps']:.1f} -> {after['rps']:.1f}")
+        if after["errors"] > before["errors"]:
+            regressions.append(f"{name}: errors {before['errors']} -> {after['errors']}")
+    return regressions
+
+
+async def compare(args: argparse.Namespace) -> int:
+    with open(args.baseline) as fp:
+        baseline = json.load(fp)
+    with open(args.current) as fp:
+        current = json.load(fp)
+
+    print(f"  {'endpoint':<44}{'p50':>16}{'p95':>16}{'p99':>16}{'rps':>16}")
+    for name, before in baseline["endpoints"].items():
+        after = current["endpoints"].get(name)
+        if after is None:
+            print(f"  {name:<44} missing in {args.current}")
+            continue
+        cells = [
+            f"{before[metric]:.1f}->{after[metric]:.1f}"
+            for metric in ("p50_ms", "p95_ms", "p99_ms", "rps")
+        ]
+        print(f"  {name:<44}" + "".join(f"{cell:>16}" for cell in cells))
+
+    regressions = compare_reports(baseline, current, args.threshold)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    print(f"Regressions: {len(regressions)} (threshold {args.threshold:.0%})")
+    return 1 if regressions else 0
+
+
+COMMANDS = {"run": run, "compare": compare}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Прогнать нагрузку по всем ручкам")
+    run_parser.add_argument("--base-url", help="Адрес запущенного сервиса, иначе в процессе")
+    run_parser.add_argument("--requests", type=int, default=500, help="Запросов на ручку")
+    run_parser.add_argument("--concurrency", type=int, default=20, help="Параллельных воркеров")
+    run_parser.add_argument("--seed", type=int, default=42, help="Зерно генератора запросов")
+    run_parser.add_argument("--only", nargs="*", help="Прогнать только эти пути, например /sum/")
+    run_parser.add_argument("--output", help="Файл для JSON-отчёта, иначе stdout")
+
+    compare_parser = subparsers.add_parser("compare", help="Сравнить два JSON-отчёта")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=0.1, help="Допустимое ухудшение, доля"
+    )
+
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(COMMANDS[args.command](args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Синтетические данные для нагрузочных прогонов: подписки распределены по пользователям
+по закону Ципфа (немного «тяжёлых» пользователей и длинный хвост), часть подписок бессрочная.
+
+    python -m benchmarks.seed --rows 2000000 --users 100000 --truncate
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import date
+from typing import List, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
+from app.core.db import Base, async_session_maker, engine
+from app.subscriptions.rollup import rebuild_rollup
+from app.subscriptions.vectorized import month_from_index, month_index
+
+SERVICES = [
+    "Yandex Plus",
+    "Netflix",
+    "Spotify",
+    "Apple Music",
+    "YouTube Premium",
+    "Kinopoisk",
+    "Okko",
+    "ivi",
+    "VK Music",
+    "Start",
+    "Amediateka",
+    "Wink",
+    "Litres",
+    "Bookmate",
+    "Telegram Premium",
+    "iCloud",
+    "Google One",
+    "Dropbox",
+    "Notion",
+    "ChatGPT Plus",
+]
+
+COPY_COLUMNS = ["id", "service_name", "price", "user_id", "start_date", "end_date"]
+
+Record = Tuple[uuid.UUID, str, int, uuid.UUID, date, date | None]
+
+
+def zipf_weights(size: int, exponent: float) -> np.ndarray:
+    weights = 1.0 / np.arange(1, size + 1) ** exponent
+    return weights / weights.sum()
+
+
+def random_uuids(rng: np.random.Generator, count: int) -> List[uuid.UUID]:
+    raw = rng.bytes(16 * count)
+    return [uuid.UUID(bytes=raw[i * 16 : (i + 1) * 16], version=4) for i in range(count)]
+
+
+def generate_batch(
+    rng: np.random.Generator,
+    users: List[uuid.UUID],
+    user_weights: np.ndarray,
+    service_weights: np.ndarray,
+    size: int,
+    args: argparse.Namespace,
+) -> List[Record]:
+    user_codes = rng.choice(len(users), size=size, p=user_weights)
+    service_codes = rng.choice(len(SERVICES), size=size, p=service_weights)
+    prices = rng.integers(10, 300, size=size) * 10
+
+    # начала подписок равномерно за последние --months месяцев, часть заканчивается в будущем
+    last_month = month_index(date.today())
+    starts = rng.integers(last_month - args.months, last_month + 1, size=size)
+    durations = rng.integers(0, args.max_duration, size=size)
+    is_open = rng.random(size) < args.open_ratio
+
+    return [
+        (
+            subscription_id,
+            SERVICES[service_codes[i]],
+            int(prices[i]),
+            users[user_codes[i]],
+            month_from_index(int(starts[i])),
+            None if is_open[i] else month_from_index(int(starts[i] + durations[i])),
+        )
+        for i, subscription_id in enumerate(random_uuids(rng, size))
+    ]
+
+
+async def seed(args: argparse.Namespace) -> None:
+    rng = np.random.default_rng(args.seed)
+    users = random_uuids(rng, args.users)
+    user_weights = zipf_weights(args.users, args.skew)
+    service_weights = zipf_weights(len(SERVICES), 0.8)
+
+    async with engine.connect() as conn:
+        # в чистой базе (например, _test) схемы может ещё не быть
+        await conn.run_sync(Base.metadata.create_all)
+        if args.truncate:
+            await conn.execute(text("TRUNCATE subscriptions, subscription_monthly_spend"))
+            await conn.commit()
+        raw = await conn.get_raw_connection()
+        started = time.perf_counter()
+        for batch_start in range(0, args.rows, args.batch_size):
+            size = min(args.batch_size, args.rows - batch_start)
+            records = generate_batch(rng, users, user_weights, service_weights, size, args)
+            await raw.driver_connection.copy_records_to_table(
+                "subscriptions", records=records, columns=COPY_COLUMNS
+            )
+            print(f"Copied {batch_start + size}/{args.rows} rows")
+        print(f"COPY finished in {time.perf_counter() - started:.1f}s")
+        await conn.execute(text("ANALYZE subscriptions"))
+        await conn.commit()
+
+    if not args.skip_rollup:
+        started = time.perf_counter()
+        async with async_session_maker() as session:
+            await rebuild_rollup(session)
+        print(f"Rollup rebuilt in {time.perf_counter() - started:.1f}s")
+
+
+async def main(args: argparse.Namespace) -> None:
+    try:
+        await seed(args)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.seed")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Сколько подписок создать")
+    parser.add_argument("--users", type=int, default=50_000, help="Сколько пользователей")
+    parser.add_argument(
+        "--skew",
+        type=float,
+        default=1.1,
+        help="Показатель Ципфа для распределения по пользователям",
+    )
+    parser.add_argument("--open-ratio", type=float, default=0.3, help="Доля бессрочных подписок")
+    parser.add_argument("--months", type=int, default=60, help="Глубина дат начала в месяцах")
+    parser.add_argument(
+        "--max-duration", type=int, default=36, help="Максимальная длина подписки в месяцах"
+    )
+    parser.add_argument("--batch-size", type=int, default=100_000, help="Строк на один COPY")
+    parser.add_argument("--seed", type=int, default=42, help="Зерно генератора")
+    parser.add_argument("--truncate", action="store_true", help="Очистить таблицы перед загрузкой")
+    parser.add_argument("--skip-rollup", action="store_true", help="Не пересобирать свёртку")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,66 @@
+"""add subscription_monthly_spend
+
+Revision ID: 1a1bce88f6b3
+Revises: abb5bb3dfafa
+Create Date: 2026-10-18 10:12:41.204117
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.config import settings
+
+# revision identifiers, used by Alembic.
+revision: str = "1a1bce88f6b3"
+down_revision: Union[str, Sequence[str], None] = "abb5bb3dfafa"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "subscription_monthly_spend",
+        sa.Column("user_id", sa.UUID(), nullable=False),
+        sa.Column("month", sa.Date(), nullable=False),
+        sa.Column("service_name", sa.String(), nullable=False),
+        sa.Column("max_price", sa.Integer(), nullable=True),
+        sa.Column("open_max_price", sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint("user_id", "month", "service_name"),
+    )
+    # начальное заполнение свёртки на тот же горизонт, что и у записей приложения
+    op.execute(
+        sa.text(
+            """
+        INSERT INTO subscription_monthly_spend
+            (user_id, month, service_name, max_price, open_max_price)
+        SELECT
+            s.user_id,
+            m.month::date,
+            s.service_name,
+            max(s.price) FILTER (WHERE s.end_date IS NOT NULL),
+            max(s.price) FILTER (WHERE s.end_date IS NULL)
+        FROM subscriptions s
+        CROSS JOIN LATERAL generate_series(
+            date_trunc('month', s.start_date),
+            date_trunc(
+                'month',
+                coalesce(
+                    s.end_date,
+                    date_trunc('month', current_date) + make_interval(months => :horizon_months)
+                )
+            ),
+            interval '1 month'
+        ) AS m(month)
+        GROUP BY s.user_id, m.month, s.service_name
+        """
+        ).bindparams(horizon_months=settings.ROLLUP_HORIZON_MONTHS)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("subscription_monthly_spend")
@@ -0,0 +1,57 @@
+"""add subscription_rollup_state
+
+Revision ID: 3e7b5c9a1d42
+Revises: 9c41e7f2b8a6
+Create Date: 2026-10-18 23:04:17.512630
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+from app.config import settings
+
+# revision identifiers, used by Alembic.
+revision: str = "3e7b5c9a1d42"
+down_revision: Union[str, Sequence[str], None] = "9c41e7f2b8a6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "subscription_rollup_state",
+        sa.Column("id", sa.Boolean(), nullable=False),
+        sa.Column("covered_until", sa.Date(), nullable=False),
+        sa.CheckConstraint("id", name="ck_subscription_rollup_state_single_row"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    # покрытие берётся из самой свёртки: последний месяц, до которого разложен
+    # наименее продлённый бессрочный ключ; без бессрочных подписок - текущий горизонт
+    op.execute(
+        sa.text(
+            """
+            INSERT INTO subscription_rollup_state (id, covered_until)
+            SELECT true, coalesce(
+                (
+                    SELECT min(covered.month)
+                    FROM (
+                        SELECT max(month) AS month
+                        FROM subscription_monthly_spend
+                        WHERE open_max_price IS NOT NULL
+                        GROUP BY user_id, service_name
+                    ) AS covered
+                ),
+                date_trunc('month', current_date) + make_interval(months => :horizon_months)
+            )::date
+            """
+        ).bindparams(horizon_months=settings.ROLLUP_HORIZON_MONTHS)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("subscription_rollup_state")
@@ -0,0 +1,107 @@
+"""add period daterange
+
+Revision ID: 5d2a762bd1db
+Revises: 6a2b0d1571fb
+Create Date: 2026-10-18 19:36:05.811472
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+from app.subscriptions import partitioning
+
+# revision identifiers, used by Alembic.
+revision: str = "5d2a762bd1db"
+down_revision: Union[str, Sequence[str], None] = "6a2b0d1571fb"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PERIOD_EXPRESSION = (
+    "CASE WHEN end_date < start_date THEN 'empty'::daterange "
+    "ELSE daterange(start_date, end_date, '[]') END"
+)
+
+# покрывающие индексы: ключ и INCLUDE без period
+COVERING_INDEXES = {
+    "ix_subscriptions_user_id_start_date_id_covering": (
+        ["user_id", "start_date", "id"],
+        ["service_name", "end_date", "updated_at"],
+    ),
+    "ix_subscriptions_user_id_service_name_start_date": (
+        ["user_id", "service_name", "start_date"],
+        ["price", "end_date"],
+    ),
+}
+
+
+def rebuild_index(name: str, columns: list, include: list, concurrently: bool) -> None:
+    # новый индекс строится рядом и занимает имя прежнего
+    op.create_index(
+        f"{name}_rebuild",
+        "subscriptions",
+        columns,
+        unique=False,
+        postgresql_include=include,
+        postgresql_concurrently=concurrently,
+        if_not_exists=True,
+    )
+    op.drop_index(
+        name, table_name="subscriptions", postgresql_concurrently=concurrently, if_exists=True
+    )
+    op.execute(f"ALTER INDEX {name}_rebuild RENAME TO {name}")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    conn = op.get_bind()
+    # хранимая генерируемая колонка переписывает таблицу под эксклюзивной блокировкой;
+    # на большой таблице её можно добавить онлайн через partition-prepare/backfill/swap
+    op.add_column(
+        "subscriptions",
+        sa.Column(
+            "period",
+            postgresql.DATERANGE(),
+            sa.Computed(PERIOD_EXPRESSION, persisted=True),
+            nullable=False,
+        ),
+    )
+    # на секционированной таблице индексы CONCURRENTLY не строятся
+    concurrently = partitioning.table_scheme(conn) == "none"
+    btree_gist = conn.scalar(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'btree_gist'")
+    )
+    with op.get_context().autocommit_block():
+        # period в INCLUDE оставляет проверку ETag и /sum/ без свёртки index-only
+        for name, (columns, include) in COVERING_INDEXES.items():
+            rebuild_index(name, columns, [*include, "period"], concurrently)
+        if btree_gist:
+            op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+            op.create_index(
+                "ix_subscriptions_user_id_period",
+                "subscriptions",
+                ["user_id", "period"],
+                unique=False,
+                postgresql_using="gist",
+                postgresql_concurrently=concurrently,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    concurrently = partitioning.table_scheme(op.get_bind()) == "none"
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_subscriptions_user_id_period",
+            table_name="subscriptions",
+            postgresql_concurrently=concurrently,
+            if_exists=True,
+        )
+        # иначе индексы удалились бы вместе с колонкой
+        for name, (columns, include) in COVERING_INDEXES.items():
+            rebuild_index(name, columns, include, concurrently)
+    op.drop_column("subscriptions", "period")
@@ -0,0 +1,50 @@
+"""partition subscriptions
+
+Revision ID: 6a2b0d1571fb
+Revises: e323b89d8fb8
+Create Date: 2026-10-18 18:21:47.093611
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import context, op
+
+from app.subscriptions import partitioning
+
+# revision identifiers, used by Alembic.
+revision: str = "6a2b0d1571fb"
+down_revision: Union[str, Sequence[str], None] = "e323b89d8fb8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# схема задаётся при запуске, без неё миграция ничего не меняет:
+#   alembic -x partition_by=hash -x partitions=16 upgrade head
+#   alembic -x partition_by=range upgrade head
+# на больших таблицах удобнее те же шаги командами app.subscriptions.commands (README)
+def migrate_table(scheme: str) -> None:
+    args = context.get_x_argument(as_dictionary=True)
+    conn = op.get_bind()
+    if partitioning.table_scheme(conn) == scheme:
+        return
+    # подготовка и копирование идут вне транзакции миграции: каждая пачка фиксируется
+    # сразу, и рабочая таблица не блокируется на всё время копирования
+    with op.get_context().autocommit_block():
+        partitioning.prepare(conn, scheme, int(args.get("partitions", 16)))
+        partitioning.backfill(conn, int(args.get("batch_size", 10000)))
+    partitioning.swap(conn, lock_timeout=args.get("lock_timeout", "5s"))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    scheme = context.get_x_argument(as_dictionary=True).get("partition_by", "none")
+    if scheme not in partitioning.PARTITION_KEYS:
+        return
+    migrate_table(scheme)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if partitioning.table_scheme(op.get_bind()) != "none":
+        migrate_table("none")
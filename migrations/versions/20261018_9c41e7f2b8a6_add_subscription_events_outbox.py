@@ -0,0 +1,102 @@
+"""add subscription events outbox
+
+Revision ID: 9c41e7f2b8a6
+Revises: 5d2a762bd1db
+Create Date: 2026-10-18 21:12:40.318207
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "9c41e7f2b8a6"
+down_revision: Union[str, Sequence[str], None] = "5d2a762bd1db"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SUBSCRIPTION_JSON = """jsonb_build_object(
+                'service_name', n.service_name, 'price', n.price, 'start_date', n.start_date,
+                'end_date', n.end_date, 'id', n.id, 'user_id', n.user_id)"""
+
+OUTBOX_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION subscriptions_outbox() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO subscription_events (xid, op, subscription_id, user_id, service_name)
+        SELECT pg_current_xact_id()::text::bigint, 'delete', o.id, o.user_id, o.service_name
+        FROM old_rows o;
+    ELSIF TG_OP = 'UPDATE' THEN
+        INSERT INTO subscription_events
+            (xid, op, subscription_id, user_id, service_name, old_service_name, data)
+        SELECT pg_current_xact_id()::text::bigint, 'update', n.id, n.user_id, n.service_name,
+            o.service_name, {SUBSCRIPTION_JSON}
+        FROM new_rows n JOIN old_rows o ON o.id = n.id;
+    ELSE
+        INSERT INTO subscription_events (xid, op, subscription_id, user_id, service_name, data)
+        SELECT pg_current_xact_id()::text::bigint, 'create', n.id, n.user_id, n.service_name,
+            {SUBSCRIPTION_JSON}
+        FROM new_rows n;
+    END IF;
+    PERFORM pg_notify('subscription_events', '');
+    RETURN NULL;
+END
+$$
+"""
+
+OUTBOX_TRIGGERS = {
+    "INSERT": "REFERENCING NEW TABLE AS new_rows",
+    "UPDATE": "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows",
+    "DELETE": "REFERENCING OLD TABLE AS old_rows",
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "subscription_events",
+        sa.Column("id", sa.BigInteger(), sa.Identity(), nullable=False),
+        sa.Column("xid", sa.BigInteger(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column("op", sa.String(), nullable=False),
+        sa.Column("subscription_id", sa.UUID(), nullable=False),
+        sa.Column("user_id", sa.UUID(), nullable=False),
+        sa.Column("service_name", sa.String(), nullable=False),
+        sa.Column("old_service_name", sa.String(), nullable=True),
+        sa.Column("data", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_subscription_events_xid_id", "subscription_events", ["xid", "id"], unique=False
+    )
+    op.create_index(
+        "ix_subscription_events_created_at", "subscription_events", ["created_at"], unique=False
+    )
+    op.execute(OUTBOX_FUNCTION)
+    # триггеры на уровне оператора: пакетные изменения пишут события одной вставкой
+    for operation, referencing in OUTBOX_TRIGGERS.items():
+        op.execute(
+            f"CREATE TRIGGER subscriptions_outbox_{operation.lower()} AFTER {operation} "
+            f"ON subscriptions {referencing} FOR EACH STATEMENT "
+            "EXECUTE FUNCTION subscriptions_outbox()"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for operation in OUTBOX_TRIGGERS:
+        op.execute(
+            f"DROP TRIGGER IF EXISTS subscriptions_outbox_{operation.lower()} ON subscriptions"
+        )
+    op.execute("DROP FUNCTION IF EXISTS subscriptions_outbox()")
+    op.drop_index("ix_subscription_events_created_at", table_name="subscription_events")
+    op.drop_index("ix_subscription_events_xid_id", table_name="subscription_events")
+    op.drop_table("subscription_events")
@@ -0,0 +1,56 @@
+"""add user_id start_date id index
+
+Revision ID: cd07c145d823
+Revises: 1a1bce88f6b3
+Create Date: 2026-10-18 11:40:03.518240
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "cd07c145d823"
+down_revision: Union[str, Sequence[str], None] = "1a1bce88f6b3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # индекс строится без блокировки записи, поэтому вне транзакции миграции
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_subscriptions_user_id_start_date_id",
+            "subscriptions",
+            ["user_id", "start_date", "id"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # новый индекс покрывает все запросы по префиксу user_id
+        op.drop_index(
+            "ix_subscriptions_user_id",
+            table_name="subscriptions",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_subscriptions_user_id",
+            "subscriptions",
+            ["user_id"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            "ix_subscriptions_user_id_start_date_id",
+            table_name="subscriptions",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
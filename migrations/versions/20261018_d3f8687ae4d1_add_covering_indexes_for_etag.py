@@ -0,0 +1,72 @@
+"""add covering indexes for etag
+
+Revision ID: d3f8687ae4d1
+Revises: cd07c145d823
+Create Date: 2026-10-18 15:12:41.204117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "d3f8687ae4d1"
+down_revision: Union[str, Sequence[str], None] = "cd07c145d823"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # проверка ETag читает только индексы (index-only scan), поэтому нужные колонки - в INCLUDE
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_subscriptions_user_id_start_date_id_covering",
+            "subscriptions",
+            ["user_id", "start_date", "id"],
+            unique=False,
+            postgresql_include=["service_name", "end_date", "updated_at"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # покрывающий индекс заменяет прежний с тем же ключом
+        op.drop_index(
+            "ix_subscriptions_user_id_start_date_id",
+            table_name="subscriptions",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.create_index(
+            "ix_subscriptions_id_updated_at",
+            "subscriptions",
+            ["id"],
+            unique=False,
+            postgresql_include=["updated_at"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_subscriptions_id_updated_at",
+            table_name="subscriptions",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.create_index(
+            "ix_subscriptions_user_id_start_date_id",
+            "subscriptions",
+            ["user_id", "start_date", "id"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            "ix_subscriptions_user_id_start_date_id_covering",
+            table_name="subscriptions",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
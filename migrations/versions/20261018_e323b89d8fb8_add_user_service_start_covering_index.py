@@ -0,0 +1,44 @@
+"""add user service start covering index
+
+Revision ID: e323b89d8fb8
+Revises: d3f8687ae4d1
+Create Date: 2026-10-18 18:04:12.518930
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e323b89d8fb8"
+down_revision: Union[str, Sequence[str], None] = "d3f8687ae4d1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # /sum/ по generate_series, numpy-движок и пересборка свёртки читают только
+    # user_id, service_name, start_date, end_date и price - всё берётся из индекса
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_subscriptions_user_id_service_name_start_date",
+            "subscriptions",
+            ["user_id", "service_name", "start_date"],
+            unique=False,
+            postgresql_include=["price", "end_date"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_subscriptions_user_id_service_name_start_date",
+            table_name="subscriptions",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
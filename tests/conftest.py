@@ -4,6 +4,7 @@ from sqlalchemy import text
 
 from app.core.db import Base, async_session_maker, engine, get_db_session
 from app.main import app
+from app.subscriptions.feed import change_feed
 
 tables_recreated = False
 
@@ -20,6 +21,8 @@ async def prepare_database():
             table_names = ", ".join(table.name for table in reversed(Base.metadata.sorted_tables))
             await conn.execute(text(f"TRUNCATE TABLE {table_names} RESTART IDENTITY CASCADE"))
     yield
+    # слушатель ленты привязан к циклу событий теста
+    await change_feed.stop()
     await engine.dispose()
 
 
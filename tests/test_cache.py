@@ -0,0 +1,140 @@
+import uuid
+
+import pytest
+
+from app.core.cache import Cache, MemoryCacheBackend, RedisCacheBackend
+from app.core.db import async_session_maker
+from app.subscriptions import schemas
+from app.subscriptions.repository import SubscriptionRepository
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value.encode()
+        self.ttls[key] = ex
+        return True
+
+    async def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, b"0")) + 1).encode()
+        return int(self.data[key])
+
+    async def expire(self, key, seconds):
+        self.ttls[key] = seconds
+        return True
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.calls.clear()
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((getattr(self.redis, name), args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self):
+        return [await method(*args, **kwargs) for method, args, kwargs in self.calls]
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryCacheBackend(max_entries=2)
+    await backend.set("a", 1)
+    await backend.set("b", 2)
+    assert await backend.get("a") == 1
+    await backend.set("c", 3)
+    assert await backend.get("b") is None
+    assert await backend.get("a") == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "backend_factory",
+    [lambda: MemoryCacheBackend(max_entries=100), lambda: RedisCacheBackend(FakeRedis())],
+)
+async def test_repository_cache_invalidated_by_writes(backend_factory):
+    cache = Cache(backend_factory(), ttl=60)
+    user_id = uuid.uuid4()
+    async with async_session_maker() as session:
+        repo = SubscriptionRepository(session, cache=cache)
+        created = await repo.create(
+            schemas.SubscriptionCreate(
+                service_name="Netflix", price=500, user_id=user_id, start_date="01-2025"
+            )
+        )
+
+        assert (await repo.get(created.id)).price == 500
+        assert len(await repo.list_by_user(user_id)) == 1
+        assert (await repo.get(created.id)).price == 500
+        assert len(await repo.list_by_user(user_id)) == 1
+        assert cache.hits == 2
+
+        await repo.update(created.id, schemas.SubscriptionUpdate(price=600))
+        assert (await repo.get(created.id)).price == 600
+        assert (await repo.list_by_user(user_id))[0].price == 600
+
+        await repo.delete(created.id)
+        assert await repo.get(created.id) is None
+        assert await repo.list_by_user(user_id) == []
+
+
+@pytest.mark.asyncio
+async def test_list_rows_share_cache_with_models():
+    cache = Cache(RedisCacheBackend(FakeRedis()), ttl=60)
+    user_id = uuid.uuid4()
+    async with async_session_maker() as session:
+        repo = SubscriptionRepository(session, cache=cache)
+        await repo.create(
+            schemas.SubscriptionCreate(
+                service_name="Netflix", price=500, user_id=user_id, start_date="01-2025"
+            )
+        )
+        rows = await repo.list_rows_by_user(user_id)
+        cached = await repo.list_rows_by_user(user_id)
+        subs = await repo.list_by_user(user_id)
+
+    assert cached == [sub.model_dump(mode="json") for sub in subs]
+    assert [str(row["id"]) for row in rows] == [row["id"] for row in cached]
+
+
+@pytest.mark.asyncio
+async def test_redis_generation_keys_expire_and_restart_above_old_values():
+    redis = FakeRedis()
+    cache = Cache(RedisCacheBackend(redis), ttl=30)
+    user_id = uuid.uuid4()
+    key = await cache.versioned_key("user", user_id, "list")
+    await cache.set(key, [1])
+    await cache.invalidate_many("sub", [uuid.uuid4()])
+
+    generation_keys = [name for name in redis.data if ":gen:" in name]
+    assert len(generation_keys) == 2
+    assert all(redis.ttls[name] == cache.generation_ttl > cache.ttl for name in generation_keys)
+    assert redis.ttls[key] == cache.ttl
+
+    # истёкший ключ поколения начинается заново с текущего времени, а не с 1
+    generation = await cache.generation("user", user_id)
+    redis.data.pop(cache._generation_key("user", user_id))
+    await cache.invalidate("user", user_id)
+    assert await cache.generation("user", user_id) > generation
+    assert await cache.versioned_key("user", user_id, "list") != key
@@ -0,0 +1,108 @@
+import uuid
+
+import pytest
+from sqlalchemy import select, update
+
+from app.config import settings
+from app.core.db import engine
+from app.subscriptions.models import Subscription
+from app.utils.etag import etag_matches
+
+
+def test_etag_matching():
+    assert etag_matches('W/"a", W/"b"', 'W/"b"')
+    assert etag_matches('"b"', 'W/"b"')
+    assert etag_matches("*", 'W/"b"')
+    assert not etag_matches('W/"a"', 'W/"b"')
+    assert not etag_matches(None, 'W/"b"')
+
+
+async def create(async_client, user_id: str, service_name: str = "Netflix") -> dict:
+    resp = await async_client.post(
+        "/subscriptions/",
+        json={
+            "service_name": service_name,
+            "price": 500,
+            "user_id": user_id,
+            "start_date": "01-2025",
+        },
+    )
+    return resp.json()
+
+
+@pytest.mark.asyncio
+async def test_get_returns_304_until_updated(async_client):
+    created = await create(async_client, str(uuid.uuid4()))
+    url = f"/subscriptions/{created['id']}"
+
+    first = await async_client.get(url)
+    etag = first.headers["etag"]
+    cached = await async_client.get(url, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+
+    await async_client.put(url, json={"price": 700})
+    changed = await async_client.get(url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()["price"] == 700
+    assert changed.headers["etag"] != etag
+
+    missing = await async_client.get(f"/subscriptions/{uuid.uuid4()}")
+    assert missing.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_list_etag_tracks_filter_and_page(async_client, monkeypatch):
+    monkeypatch.setattr(settings, "LIST_ETAG_ENABLED", True)
+    user_id = str(uuid.uuid4())
+    first = await create(async_client, user_id)
+    url = f"/subscriptions/list/?user_id={user_id}"
+
+    etag = (await async_client.get(url)).headers["etag"]
+    assert (await async_client.get(url, headers={"If-None-Match": etag})).status_code == 304
+    other_page = await async_client.get(url + "&limit=1", headers={"If-None-Match": etag})
+    assert other_page.status_code == 200
+
+    second = await create(async_client, user_id, "Spotify")
+    resp = await async_client.get(url, headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert len(resp.json()) == 2
+
+    etag = resp.headers["etag"]
+    await async_client.delete(f"/subscriptions/{second['id']}")
+    resp = await async_client.get(url, headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert [sub["id"] for sub in resp.json()] == [first["id"]]
+
+
+@pytest.mark.asyncio
+async def test_list_etag_sees_older_transaction_committed_later(async_client, monkeypatch):
+    monkeypatch.setattr(settings, "LIST_ETAG_ENABLED", True)
+    user_id = str(uuid.uuid4())
+    first = await create(async_client, user_id)
+    second = await create(async_client, user_id, "Spotify")
+    url = f"/subscriptions/list/?user_id={user_id}"
+
+    async with engine.connect() as slow:
+        # now() этой транзакции, а значит и её updated_at, раньше изменения ниже
+        await slow.execute(select(1))
+        await async_client.put(f"/subscriptions/{first['id']}", json={"price": 700})
+        etag = (await async_client.get(url)).headers["etag"]
+        await slow.execute(
+            update(Subscription).where(Subscription.id == second["id"]).values(price=900)
+        )
+        await slow.commit()
+
+    resp = await async_client.get(url, headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert {sub["price"] for sub in resp.json()} == {700, 900}
+
+
+@pytest.mark.asyncio
+async def test_list_etag_is_off_by_default(async_client):
+    user_id = str(uuid.uuid4())
+    await create(async_client, user_id)
+    resp = await async_client.get(f"/subscriptions/list/?user_id={user_id}")
+    assert resp.status_code == 200
+    assert "etag" not in resp.headers
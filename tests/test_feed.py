@@ -0,0 +1,124 @@
+import asyncio
+import json
+import uuid
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, select, update
+
+from app.config import settings
+from app.core.db import engine
+from app.subscriptions import feed
+from app.subscriptions.feed import change_feed
+from app.subscriptions.models import SubscriptionEvent
+
+
+def parse_events(body: str) -> list:
+    events = []
+    for frame in body.split("\n\n"):
+        fields = dict(
+            line.split(": ", 1) for line in frame.splitlines() if not line.startswith(":")
+        )
+        if fields:
+            events.append({"id": fields["id"], "op": fields["event"], **json.loads(fields["data"])})
+    return events
+
+
+async def create_subscription(async_client, user_id: str, service_name: str) -> str:
+    resp = await async_client.post(
+        "/subscriptions/",
+        json={
+            "service_name": service_name,
+            "price": 100,
+            "user_id": user_id,
+            "start_date": "01-2025",
+        },
+    )
+    assert resp.status_code == 201
+    return resp.json()["id"]
+
+
+async def wait_for_subscriber() -> None:
+    while not change_feed.subscribers:
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_events_resume_from_last_event_id(async_client):
+    user_id = str(uuid.uuid4())
+    first = await create_subscription(async_client, user_id, "Netflix")
+    second = await create_subscription(async_client, user_id, "Spotify")
+    await create_subscription(async_client, str(uuid.uuid4()), "Netflix")
+    await async_client.put(f"/subscriptions/{first}", json={"service_name": "Kion"})
+    await async_client.delete(f"/subscriptions/{second}")
+
+    resp = await async_client.get(f"/subscriptions/events/?user_id={user_id}&after=0&limit=4")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    events = parse_events(resp.text)
+    assert [event["op"] for event in events] == ["create", "create", "update", "delete"]
+    assert events[2]["subscription"]["service_name"] == "Kion"
+    assert events[2]["old_service_name"] == "Netflix"
+    assert events[3]["subscription"] is None
+
+    resp = await async_client.get(
+        "/subscriptions/events/?service_name=Netflix&limit=2",
+        headers={"Last-Event-ID": events[0]["id"]},
+    )
+    # другой пользователь с Netflix и переименование из Netflix
+    assert [event["op"] for event in parse_events(resp.text)] == ["create", "update"]
+
+    resp = await async_client.get("/subscriptions/events/?after=broken")
+    assert resp.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_events_live_and_slow_consumer(async_client, monkeypatch):
+    monkeypatch.setattr(settings, "FEED_QUEUE_SIZE", 1)
+    user_id = str(uuid.uuid4())
+    stream = asyncio.create_task(
+        async_client.get(f"/subscriptions/events/?user_id={user_id}&limit=4")
+    )
+    await wait_for_subscriber()
+
+    # события пачки приходят одним чтением: в очередь помещается одно, остальные
+    # клиент дочитывает из таблицы
+    rows = [
+        {"service_name": f"svc{i}", "price": 100, "user_id": user_id, "start_date": "01-2025"}
+        for i in range(3)
+    ]
+    await async_client.post("/subscriptions/bulk/", json=rows)
+    await create_subscription(async_client, user_id, "svc3")
+
+    resp = await asyncio.wait_for(stream, 10)
+    events = parse_events(resp.text)
+    assert [event["service_name"] for event in events] == ["svc0", "svc1", "svc2", "svc3"]
+    assert len({event["id"] for event in events}) == 4
+
+
+@pytest.mark.asyncio
+async def test_old_events_are_pruned_without_subscribers(async_client, monkeypatch):
+    monkeypatch.setattr(settings, "FEED_PRUNE_SECONDS", 3600)
+    monkeypatch.setattr(feed, "PRUNE_BATCH_SIZE", 2)
+    user_id = str(uuid.uuid4())
+    for service_name in ("Netflix", "Spotify", "Kion"):
+        await create_subscription(async_client, user_id, service_name)
+    async with engine.begin() as conn:
+        await conn.execute(
+            update(SubscriptionEvent)
+            .where(SubscriptionEvent.service_name != "Kion")
+            .values(created_at=func.now() - timedelta(hours=settings.FEED_RETENTION_HOURS + 1))
+        )
+
+    async def remaining() -> list:
+        async with engine.connect() as conn:
+            return list(await conn.scalars(select(SubscriptionEvent.service_name)))
+
+    # подписчиков нет и слушатель не запущен, удаление всё равно идёт
+    change_feed.start_pruning()
+    for _ in range(500):
+        if await remaining() == ["Kion"]:
+            break
+        await asyncio.sleep(0.01)
+    assert await remaining() == ["Kion"]
+    assert change_feed.task is None
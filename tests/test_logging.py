@@ -0,0 +1,68 @@
+import io
+import json
+import logging
+import queue
+
+from app.core.context import trace_id_ctx
+from app.core.logging import (
+    NonBlockingQueueHandler,
+    SamplingFilter,
+    TraceIdFilter,
+    build_handler,
+    stop_logging,
+)
+from app.core.metrics import LOG_RECORDS_DROPPED
+
+
+def make_record(name: str, trace_id) -> logging.LogRecord:
+    record = logging.LogRecord(name, logging.INFO, __file__, 1, "SELECT 1", None, None)
+    record.trace_id = trace_id
+    return record
+
+
+def test_queue_handler_writes_json_with_trace_id():
+    stream = io.StringIO()
+    handler = build_handler("json", 100, stream)
+    handler.addFilter(TraceIdFilter())
+    logger = logging.getLogger("tests.logging.json")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+
+    token = trace_id_ctx.set("abc123")
+    try:
+        logger.warning("first\nsecond %s", 42)
+    finally:
+        trace_id_ctx.reset(token)
+        stop_logging()
+        logger.removeHandler(handler)
+
+    payload = json.loads(stream.getvalue())
+    assert payload["trace_id"] == "abc123"
+    assert payload["message"] == "first\nsecond 42"
+    assert payload["level"] == "WARNING"
+    assert payload["logger"] == "tests.logging.json"
+
+
+def test_sampling_is_per_trace_and_per_logger():
+    sampling = SamplingFilter({"sqlalchemy.engine": 0.5, "uvicorn.access": 0.0})
+
+    kept = [sampling.filter(make_record("sqlalchemy.engine.Engine", str(i))) for i in range(400)]
+    assert 100 < sum(kept) < 300
+    # одна и та же трасса получает одно и то же решение
+    assert kept == [
+        sampling.filter(make_record("sqlalchemy.engine.Engine", str(i))) for i in range(400)
+    ]
+    assert not sampling.filter(make_record("uvicorn.access", "1"))
+    assert sampling.filter(make_record("app.subscriptions", "1"))
+
+
+def test_full_queue_drops_and_counts():
+    handler = NonBlockingQueueHandler(queue.Queue(1))
+    dropped = LOG_RECORDS_DROPPED._value.get()
+
+    handler.handle(make_record("app", 0))
+    handler.handle(make_record("app", 0))
+
+    assert handler.queue.qsize() == 1
+    assert LOG_RECORDS_DROPPED._value.get() == dropped + 1
@@ -0,0 +1,31 @@
+import uuid
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_metrics_expose_route_templates_and_db_timings(async_client):
+    create_resp = await async_client.post(
+        "/subscriptions/",
+        json={
+            "service_name": "Netflix",
+            "price": 500,
+            "user_id": str(uuid.uuid4()),
+            "start_date": "01-2025",
+        },
+    )
+    await async_client.get(f"/subscriptions/{create_resp.json()['id']}")
+    await async_client.get(f"/subscriptions/{uuid.uuid4()}")
+    await async_client.get("/no-such-route")
+
+    resp = await async_client.get("/metrics")
+    assert resp.status_code == 200
+    body = resp.text
+    route = 'route="/subscriptions/{subscription_id}"'
+    assert f'http_requests_total{{method="GET",{route},status="200"}}' in body
+    assert f'http_requests_total{{method="GET",{route},status="404"}}' in body
+    assert 'route="unmatched",status="404"' in body
+    assert str(create_resp.json()["id"]) not in body
+    assert 'db_query_duration_seconds_count{operation="INSERT"}' in body
+    assert "db_pool_wait_seconds_count" in body
+    assert "db_pool_checked_out" in body
@@ -0,0 +1,31 @@
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_trace_id_is_generated_and_timing_headers_are_set(async_client):
+    resp = await async_client.get("/health")
+    assert resp.status_code == 200
+    assert len(resp.headers["x-trace-id"]) == 16
+    assert resp.headers["server-timing"].startswith("app;dur=")
+    assert float(resp.headers["x-response-time-ms"]) >= 0
+
+    other = await async_client.get("/health")
+    assert other.headers["x-trace-id"] != resp.headers["x-trace-id"]
+
+
+@pytest.mark.asyncio
+async def test_incoming_trace_id_is_honoured(async_client):
+    resp = await async_client.get("/health", headers={"X-Trace-Id": "checkout-42.a"})
+    assert resp.headers["x-trace-id"] == "checkout-42.a"
+
+    resp = await async_client.get("/health", headers={"X-Trace-Id": "bad value; drop"})
+    assert resp.headers["x-trace-id"] != "bad value; drop"
+    assert len(resp.headers["x-trace-id"]) == 16
+
+
+@pytest.mark.asyncio
+async def test_export_streams_through_middleware(async_client):
+    resp = await async_client.get("/subscriptions/export/?format=csv")
+    assert resp.status_code == 200
+    assert "x-trace-id" in resp.headers
+    assert resp.text.startswith("service_name,")
@@ -0,0 +1,100 @@
+import uuid
+
+import pytest
+from sqlalchemy import text
+
+from app.core.db import engine
+from app.subscriptions import partitioning
+
+
+async def run_sync(fn, *args, autocommit=False):
+    async with engine.connect() as conn:
+        if autocommit:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        result = await conn.run_sync(fn, *args)
+        await conn.commit()
+    return result
+
+
+async def convert(scheme, partitions=4):
+    await run_sync(partitioning.prepare, scheme, partitions)
+    await run_sync(partitioning.backfill, 2, autocommit=True)
+    await run_sync(partitioning.swap)
+
+
+@pytest.fixture
+async def plain_table_after():
+    yield
+    # остальные тесты рассчитаны на обычную таблицу
+    if await run_sync(partitioning.table_scheme) != "none":
+        await convert("none")
+
+
+async def create_subscription(async_client, user_id: str, service_name: str) -> dict:
+    resp = await async_client.post(
+        "/subscriptions/",
+        json={
+            "service_name": service_name,
+            "price": 100,
+            "user_id": user_id,
+            "start_date": "01-2025",
+        },
+    )
+    assert resp.status_code == 201
+    return resp.json()
+
+
+async def service_names(async_client, user_id: str) -> list:
+    resp = await async_client.get(f"/subscriptions/list/?user_id={user_id}&limit=100")
+    return sorted(item["service_name"] for item in resp.json())
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("scheme", ["hash", "range"])
+async def test_online_partitioning_keeps_concurrent_writes(async_client, plain_table_after, scheme):
+    user_id = str(uuid.uuid4())
+    created = [await create_subscription(async_client, user_id, f"svc{i}") for i in range(5)]
+    async with engine.begin() as conn:
+        await conn.execute(
+            text(
+                "CREATE FUNCTION noop_trigger() RETURNS trigger LANGUAGE plpgsql "
+                "AS $$ BEGIN RETURN NEW; END $$"
+            )
+        )
+        await conn.execute(
+            text(
+                "CREATE TRIGGER subscriptions_noop BEFORE UPDATE ON subscriptions "
+                "FOR EACH ROW EXECUTE FUNCTION noop_trigger()"
+            )
+        )
+
+    await run_sync(partitioning.prepare, scheme, 4)
+    # записи между подготовкой и копированием доходят до новой таблицы через триггер
+    resp = await async_client.delete(f"/subscriptions/{created[0]['id']}")
+    assert resp.status_code == 200
+    resp = await async_client.put(
+        f"/subscriptions/{created[1]['id']}",
+        json={"service_name": "renamed", "start_date": "03-2025"},
+    )
+    assert resp.status_code == 200
+    await create_subscription(async_client, user_id, "added")
+    await run_sync(partitioning.backfill, 2, autocommit=True)
+    await run_sync(partitioning.swap)
+
+    assert await run_sync(partitioning.table_scheme) == scheme
+    assert await run_sync(partitioning.table_scheme, partitioning.NEW_TABLE) is None
+    assert await service_names(async_client, user_id) == [
+        "added",
+        "renamed",
+        "svc2",
+        "svc3",
+        "svc4",
+    ]
+    async with engine.connect() as conn:
+        triggers = await conn.run_sync(partitioning.user_triggers)
+        await conn.execute(text("DROP TRIGGER subscriptions_noop ON subscriptions"))
+        await conn.execute(text("DROP FUNCTION noop_trigger()"))
+        await conn.commit()
+    assert sum("subscriptions_noop" in trigger for trigger in triggers) == 1
+    # триггеры ленты изменений переезжают вместе с остальными
+    assert sum("subscriptions_outbox()" in trigger for trigger in triggers) == 3
@@ -0,0 +1,69 @@
+import asyncio
+import uuid
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import event
+
+from app.config import settings
+from app.core import profiling
+from app.core.db import engine
+from app.core.middleware import TraceMiddleware
+from app.core.profiling import ProfilingMiddleware, profile_engine, profiler
+from app.main import app
+
+
+@pytest.fixture
+async def profiled_client(monkeypatch):
+    monkeypatch.setattr(settings, "PROFILE_ENABLED", True)
+    monkeypatch.setattr(settings, "PROFILE_QUERY_BUDGET", 1)
+    monkeypatch.setattr(settings, "PROFILE_SLOW_QUERY_MS", 0)
+    monkeypatch.setattr(settings, "PROFILE_EXPLAIN_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(settings, "LIST_ETAG_ENABLED", True)
+    profile_engine(engine)
+    profiler.plans.clear()
+    # слои в том же порядке, что и в app.main при PROFILE_ENABLED=true
+    profiled_app = TraceMiddleware(ProfilingMiddleware(app))
+    async with AsyncClient(app=profiled_app, base_url="http://testserver") as client:
+        yield client
+    await asyncio.gather(*profiler.tasks)
+    for name in ("before_cursor_execute", "after_cursor_execute", "handle_error"):
+        event.remove(engine.sync_engine, name, getattr(profiling, name))
+    del profiler.engines[engine.sync_engine]
+
+
+@pytest.mark.asyncio
+async def test_statements_are_counted_and_slow_selects_explained(profiled_client):
+    user_id = str(uuid.uuid4())
+    resp = await profiled_client.post(
+        "/subscriptions/",
+        json={"service_name": "Netflix", "price": 500, "user_id": user_id, "start_date": "01-2025"},
+    )
+    assert resp.status_code == 201
+    await asyncio.gather(*profiler.tasks)
+
+    over_budget = profiler.over_budget
+    resp = await profiled_client.get(
+        f"/subscriptions/list/?user_id={user_id}", headers={"X-Trace-Id": "profiled-list"}
+    )
+    assert resp.status_code == 200
+    db_timing = [
+        timing for timing in resp.headers.get_list("server-timing") if timing.startswith("db;")
+    ]
+    assert len(db_timing) == 1
+    # версия для ETag и сама страница
+    assert 'desc="statements: 2"' in db_timing[0]
+    assert profiler.over_budget == over_budget + 1
+    await asyncio.gather(*profiler.tasks)
+
+    stats = (await profiled_client.get("/debug/slow-queries")).json()
+    assert stats["enabled"] is True
+    plans = [plan for plan in stats["plans"] if plan["trace_id"] == "profiled-list"]
+    assert plans
+    for plan in plans:
+        assert plan["request"] == f"GET /subscriptions/list/?user_id={user_id}"
+        assert plan["statement"].lstrip().upper().startswith(("SELECT", "WITH"))
+        assert "actual time=" in plan["plan"]
+        assert "Execution Time" in plan["plan"]
+    # INSERT из POST не повторяется через EXPLAIN ANALYZE
+    assert not any("INSERT" in plan["statement"] for plan in stats["plans"])
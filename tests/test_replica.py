@@ -0,0 +1,143 @@
+import uuid
+from datetime import date
+
+import pytest
+from sqlalchemy import insert, text, update
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.core import db
+from app.core.cache import build_cache
+from app.core.db import Base, database_url, engine
+from app.subscriptions import handlers
+from app.subscriptions.models import Subscription
+
+REPLICA_DB_NAME = f"{settings.DB_NAME}_replica"
+
+
+@pytest.fixture
+async def replica(monkeypatch):
+    # вторая база на том же сервере без данных ведёт себя как сильно отстающая реплика
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        exists = await conn.scalar(
+            text("SELECT 1 FROM pg_database WHERE datname = :name"), {"name": REPLICA_DB_NAME}
+        )
+        if not exists:
+            await conn.execute(text(f'CREATE DATABASE "{REPLICA_DB_NAME}"'))
+
+    replica_engine = create_async_engine(
+        database_url(settings.DB_HOST, settings.DB_PORT, REPLICA_DB_NAME)
+    )
+    async with replica_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    monkeypatch.setattr(db, "replica_engine", replica_engine)
+    monkeypatch.setattr(
+        db,
+        "replica_session_maker",
+        sessionmaker(bind=replica_engine, class_=AsyncSession, expire_on_commit=False),
+    )
+    yield
+    await replica_engine.dispose()
+
+
+async def create_subscription(async_client, user_id: str) -> dict:
+    resp = await async_client.post(
+        "/subscriptions/",
+        json={"service_name": "Netflix", "price": 500, "user_id": user_id, "start_date": "01-2025"},
+    )
+    assert resp.status_code == 201
+    return resp.json()
+
+
+async def replicate(subscription: dict) -> None:
+    # реплика догнала основную базу до этой версии подписки
+    async with db.replica_engine.begin() as conn:
+        await conn.execute(
+            insert(Subscription).values(
+                id=uuid.UUID(subscription["id"]),
+                user_id=uuid.UUID(subscription["user_id"]),
+                service_name=subscription["service_name"],
+                price=subscription["price"],
+                start_date=date(2025, 1, 1),
+            )
+        )
+
+
+@pytest.mark.asyncio
+async def test_reads_go_to_replica(async_client, replica, monkeypatch):
+    monkeypatch.setattr(settings, "READ_YOUR_WRITES_SECONDS", 0)
+    user_id = str(uuid.uuid4())
+    created = await create_subscription(async_client, user_id)
+
+    assert "rw_until" not in async_client.cookies
+    assert (await async_client.get(f"/subscriptions/{created['id']}")).status_code == 404
+    assert (await async_client.get(f"/subscriptions/list/?user_id={user_id}")).json() == []
+    assert (await async_client.get(f"/subscriptions/sum/?user_id={user_id}")).json() == {"sum": 0}
+    export = await async_client.get(f"/subscriptions/export/?user_id={user_id}")
+    assert export.text == ""
+
+
+@pytest.mark.asyncio
+async def test_read_your_writes_window_reads_primary(async_client, replica, monkeypatch):
+    monkeypatch.setattr(settings, "READ_YOUR_WRITES_SECONDS", 30)
+    user_id = str(uuid.uuid4())
+    created = await create_subscription(async_client, user_id)
+
+    assert "rw_until" in async_client.cookies
+    assert (await async_client.get(f"/subscriptions/{created['id']}")).status_code == 200
+    assert len((await async_client.get(f"/subscriptions/list/?user_id={user_id}")).json()) == 1
+    export = await async_client.get(f"/subscriptions/export/?user_id={user_id}")
+    assert created["id"] in export.text
+
+    async_client.cookies.clear()
+    assert (await async_client.get(f"/subscriptions/{created['id']}")).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_cache_is_not_filled_from_lagging_replica(async_client, replica, monkeypatch):
+    monkeypatch.setattr(settings, "READ_YOUR_WRITES_SECONDS", 30)
+    monkeypatch.setattr(settings, "CACHE_BACKEND", "memory")
+    monkeypatch.setattr(handlers, "cache", build_cache(settings))
+    user_id = str(uuid.uuid4())
+    created = await create_subscription(async_client, user_id)
+    await replicate(created)
+    resp = await async_client.put(f"/subscriptions/{created['id']}", json={"price": 700})
+    assert resp.status_code == 200
+    writer_cookies = dict(async_client.cookies)
+
+    # другой клиент без куки читает реплику, которая ещё не получила изменение цены
+    async_client.cookies.clear()
+    assert (await async_client.get(f"/subscriptions/{created['id']}")).json()["price"] == 500
+    listed = await async_client.get(f"/subscriptions/list/?user_id={user_id}")
+    assert [sub["price"] for sub in listed.json()] == [500]
+
+    # автор изменения в окне read-your-writes не получает из кэша ответ реплики
+    async_client.cookies.update(writer_cookies)
+    assert (await async_client.get(f"/subscriptions/{created['id']}")).json()["price"] == 700
+    listed = await async_client.get(f"/subscriptions/list/?user_id={user_id}")
+    assert [sub["price"] for sub in listed.json()] == [700]
+
+
+@pytest.mark.asyncio
+async def test_replica_catching_up_is_not_hidden_by_cache(async_client, replica, monkeypatch):
+    monkeypatch.setattr(settings, "READ_YOUR_WRITES_SECONDS", 0)
+    monkeypatch.setattr(settings, "CACHE_BACKEND", "memory")
+    monkeypatch.setattr(handlers, "cache", build_cache(settings))
+    user_id = str(uuid.uuid4())
+    created = await create_subscription(async_client, user_id)
+    await replicate(created)
+    await async_client.put(f"/subscriptions/{created['id']}", json={"price": 700})
+
+    # чтение сразу после записи видит реплику до изменения
+    assert (await async_client.get(f"/subscriptions/{created['id']}")).json()["price"] == 500
+    async with db.replica_engine.begin() as conn:
+        await conn.execute(update(Subscription).values(price=700))
+
+    # реплика догнала: новая цена видна сразу, а не после истечения CACHE_TTL_SECONDS
+    assert (await async_client.get(f"/subscriptions/{created['id']}")).json()["price"] == 700
+    listed = await async_client.get(f"/subscriptions/list/?user_id={user_id}")
+    assert [sub["price"] for sub in listed.json()] == [700]
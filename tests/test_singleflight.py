@@ -0,0 +1,110 @@
+import asyncio
+import uuid
+
+import pytest
+from sqlalchemy import text
+
+from app.core.metrics import SINGLE_FLIGHT_CALLS
+from app.core.singleflight import SingleFlight
+from app.subscriptions import handlers
+from app.subscriptions.repository import SubscriptionRepository
+
+
+def flight_calls(name: str, result: str) -> float:
+    return SINGLE_FLIGHT_CALLS.labels(name, result)._value.get()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight("test")
+    calls = 0
+    leaders, coalesced = flight_calls("test", "leader"), flight_calls("test", "coalesced")
+
+    async def query():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    results = await asyncio.gather(*(flight.do("key", query) for _ in range(5)))
+    assert results == [1] * 5
+    assert flight.in_flight == {}
+    assert flight_calls("test", "leader") == leaders + 1
+    assert flight_calls("test", "coalesced") == coalesced + 4
+
+    # после завершения результат не переиспользуется
+    assert await flight.do("key", query) == 2
+    assert await flight.do("other", query) == 3
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_waiter_and_cancel_does_not_leak():
+    flight = SingleFlight("test")
+    started = asyncio.Event()
+
+    async def failing():
+        started.set()
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    leader = asyncio.ensure_future(flight.do("key", failing))
+    await started.wait()
+    follower = asyncio.ensure_future(flight.do("key", failing))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    with pytest.raises(RuntimeError):
+        await follower
+    assert flight.in_flight == {}
+
+
+@pytest.mark.asyncio
+async def test_identical_sum_requests_are_coalesced(async_client, monkeypatch):
+    flight = SingleFlight("sum")
+    monkeypatch.setattr(handlers, "sum_flight", flight)
+    user_id = str(uuid.uuid4())
+    await async_client.post(
+        "/subscriptions/",
+        json={"service_name": "Netflix", "price": 500, "user_id": user_id, "start_date": "01-2025"},
+    )
+    calls = flight_calls("sum", "leader") + flight_calls("sum", "coalesced")
+
+    url = f"/subscriptions/sum/?user_id={user_id}&start_date=01-2025&end_date=03-2025"
+    responses = await asyncio.gather(*(async_client.get(url) for _ in range(5)))
+    assert [resp.json() for resp in responses] == [{"sum": 1500}] * 5
+    assert flight_calls("sum", "leader") + flight_calls("sum", "coalesced") == calls + 5
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_break_followers(async_client, monkeypatch):
+    flight = SingleFlight("sum")
+    monkeypatch.setattr(handlers, "sum_flight", flight)
+    user_id = str(uuid.uuid4())
+    await async_client.post(
+        "/subscriptions/",
+        json={"service_name": "Netflix", "price": 500, "user_id": user_id, "start_date": "01-2025"},
+    )
+
+    sum_by_user = SubscriptionRepository.sum_by_user
+
+    async def slow_sum(repo, *args):
+        # запрос ещё идёт, когда клиент ведущего отключается
+        await repo.read_session.execute(text("SELECT pg_sleep(0.3)"))
+        return await sum_by_user(repo, *args)
+
+    monkeypatch.setattr(SubscriptionRepository, "sum_by_user", slow_sum)
+    url = f"/subscriptions/sum/?user_id={user_id}&start_date=01-2025&end_date=03-2025"
+    coalesced = flight_calls("sum", "coalesced")
+    leader = asyncio.ensure_future(async_client.get(url))
+    while not flight.in_flight:
+        await asyncio.sleep(0.01)
+    follower = asyncio.ensure_future(async_client.get(url))
+    while flight_calls("sum", "coalesced") == coalesced:
+        await asyncio.sleep(0.01)
+    leader.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+
+    resp = await follower
+    assert resp.status_code == 200
+    assert resp.json() == {"sum": 1500}
@@ -1,6 +1,17 @@
+import csv
+import io
+import json
 import uuid
+from datetime import date, timedelta
 
 import pytest
+from sqlalchemy import delete, insert
+
+from app.config import settings
+from app.core.db import async_session_maker
+from app.subscriptions.models import SubscriptionMonthlySpend, SubscriptionRollupState
+from app.subscriptions.repository import SubscriptionRepository
+from app.subscriptions.rollup import refresh_open_ended, rollup_coverage
 
 
 @pytest.mark.asyncio
@@ -42,8 +53,9 @@ async def test_delete_subscription(async_client):
 @pytest.mark.asyncio
 async def test_list_subscriptions(async_client):
     user_id = str(uuid.uuid4())
+    created = {}
     for service, price in [("Netflix", 500), ("Spotify", 300)]:
-        await async_client.post(
+        resp = await async_client.post(
             "/subscriptions/",
             json={
                 "service_name": service,
@@ -52,6 +64,8 @@ async def test_list_subscriptions(async_client):
                 "start_date": "07-2025",
             },
         )
+        created[resp.json()["id"]] = service
+    first, second = (created[sub_id] for sub_id in sorted(created))
 
     list_resp = await async_client.get(
         f"/subscriptions/list/?user_id={user_id}&start_date=07-2025&end_date=07-2025"
@@ -64,14 +78,176 @@ async def test_list_subscriptions(async_client):
     )
     assert list_resp.status_code == 200
     assert len(list_resp.json()) == 1
-    assert list_resp.json()[0]["service_name"] == "Netflix"
+    assert list_resp.json()[0]["service_name"] == first
 
     list_resp = await async_client.get(
         f"/subscriptions/list/?user_id={user_id}&start_date=07-2025&end_date=07-2025&offset=1&limit=1"
     )
     assert list_resp.status_code == 200
     assert len(list_resp.json()) == 1
-    assert list_resp.json()[0]["service_name"] == "Spotify"
+    assert list_resp.json()[0]["service_name"] == second
+
+
+@pytest.mark.asyncio
+async def test_list_subscriptions_period_overlap(async_client):
+    user_id = str(uuid.uuid4())
+    for service, start, end in [
+        ("closed", "01-2025", "03-2025"),
+        ("open", "02-2025", None),
+        ("later", "06-2025", "08-2025"),
+        ("reversed", "05-2025", "04-2025"),
+    ]:
+        resp = await async_client.post(
+            "/subscriptions/",
+            json={
+                "service_name": service,
+                "price": 100,
+                "user_id": user_id,
+                "start_date": start,
+                "end_date": end,
+            },
+        )
+        assert resp.status_code == 201
+
+    async def names(query: str) -> list:
+        resp = await async_client.get(f"/subscriptions/list/?user_id={user_id}&{query}")
+        assert resp.status_code == 200
+        return sorted(item["service_name"] for item in resp.json())
+
+    # границы включительные, у бессрочной подписки верхней границы нет
+    assert await names("start_date=03-2025&end_date=03-2025") == ["closed", "open"]
+    assert await names("end_date=01-2025") == ["closed"]
+    assert await names("") == ["closed", "later", "open", "reversed"]
+    # перевёрнутая подписка отбирается по end_date >= start и start_date <= end, как раньше,
+    # а в сумму не входит
+    assert await names("start_date=04-2025") == ["later", "open", "reversed"]
+    assert await names("start_date=04-2025&end_date=05-2025") == ["open", "reversed"]
+    resp = await async_client.get(
+        f"/subscriptions/sum/?user_id={user_id}&start_date=04-2025&end_date=05-2025"
+    )
+    assert resp.json() == {"sum": 200}
+
+
+@pytest.mark.asyncio
+async def test_reversed_filter_period_is_rejected(async_client):
+    user_id = str(uuid.uuid4())
+    query = f"user_id={user_id}&start_date=07-2025&end_date=02-2025"
+    for url in (
+        f"/subscriptions/list/?{query}",
+        f"/subscriptions/sum/?{query}",
+        f"/subscriptions/sum/breakdown/?{query}",
+        f"/subscriptions/export/?{query}",
+    ):
+        resp = await async_client.get(url)
+        assert resp.status_code == 400
+        assert resp.json() == {"detail": "start_date is after end_date"}
+
+    resp = await async_client.post(
+        "/subscriptions/sum/batch/",
+        json={"user_ids": [user_id], "start_date": "07-2025", "end_date": "02-2025"},
+    )
+    assert resp.status_code == 400
+    resp = await async_client.delete(f"/subscriptions/?{query}")
+    assert resp.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_list_subscriptions_with_cursor(async_client):
+    user_id = str(uuid.uuid4())
+    rows = [
+        {"service_name": f"Service {i}", "price": 100, "user_id": user_id, "start_date": start}
+        for i, start in enumerate(["03-2025", "01-2025", "02-2025", "01-2025", "04-2025"])
+    ]
+    await async_client.post("/subscriptions/bulk/", json=rows)
+
+    full = await async_client.get(f"/subscriptions/list/?user_id={user_id}&limit=100")
+    assert [sub["start_date"] for sub in full.json()] == sorted(
+        sub["start_date"] for sub in full.json()
+    )
+
+    seen, cursor = [], None
+    while True:
+        url = f"/subscriptions/list/?user_id={user_id}&limit=2"
+        if cursor:
+            url += f"&cursor={cursor}"
+        resp = await async_client.get(url)
+        assert resp.status_code == 200
+        seen.extend(sub["id"] for sub in resp.json())
+        cursor = resp.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == [sub["id"] for sub in full.json()]
+
+    bad = await async_client.get(f"/subscriptions/list/?user_id={user_id}&cursor=broken")
+    assert bad.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_list_fast_path_matches_model_path(async_client, monkeypatch):
+    user_id = str(uuid.uuid4())
+    rows = [
+        {"service_name": "Netflix", "price": 500, "user_id": user_id, "start_date": "01-2025"},
+        {
+            "service_name": "Spotify",
+            "price": 200,
+            "user_id": user_id,
+            "start_date": "02-2025",
+            "end_date": "06-2025",
+        },
+    ]
+    await async_client.post("/subscriptions/bulk/", json=rows)
+
+    responses = {}
+    for fast_path in (False, True):
+        monkeypatch.setattr(settings, "RESPONSE_FAST_PATH", fast_path)
+        resp = await async_client.get(f"/subscriptions/list/?user_id={user_id}&limit=1")
+        assert resp.status_code == 200
+        responses[fast_path] = resp
+    assert responses[True].json() == responses[False].json()
+    assert responses[True].headers["X-Next-Cursor"] == responses[False].headers["X-Next-Cursor"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("etag", [True, False])
+async def test_list_total(async_client, monkeypatch, etag):
+    monkeypatch.setattr(settings, "LIST_ETAG_ENABLED", etag)
+    user_id = str(uuid.uuid4())
+    rows = [
+        {"service_name": "Netflix", "price": 100, "user_id": user_id, "start_date": f"0{i}-2025"}
+        for i in range(1, 6)
+    ]
+    await async_client.post("/subscriptions/bulk/", json=rows)
+    url = f"/subscriptions/list/?user_id={user_id}&end_date=04-2025&limit=2"
+
+    pages = {}
+    for fast_path in (False, True):
+        monkeypatch.setattr(settings, "RESPONSE_FAST_PATH", fast_path)
+        resp = await async_client.get(f"{url}&total=exact")
+        assert resp.status_code == 200
+        pages[fast_path] = resp.json()
+    assert pages[True] == pages[False]
+    assert pages[True]["total"] == 4
+    assert pages[True]["total_estimated"] is False
+    assert [sub["start_date"] for sub in pages[True]["items"]] == ["2025-01-01", "2025-02-01"]
+
+    cursor = resp.headers["X-Next-Cursor"]
+    resp = await async_client.get(f"{url}&total=exact&cursor={cursor}")
+    assert resp.json()["total"] == 4
+    assert len(resp.json()["items"]) == 2
+    resp = await async_client.get(f"{url}&total=exact&offset=10")
+    assert resp.json() == {"items": [], "total": 4, "total_estimated": False}
+    # только подсчёт, без строк
+    resp = await async_client.get(url.replace("limit=2", "limit=0") + "&total=exact")
+    assert resp.json() == {"items": [], "total": 4, "total_estimated": False}
+
+    monkeypatch.setattr(settings, "LIST_TOTAL_EXACT_LIMIT", 2)
+    resp = await async_client.get(f"{url}&total=auto")
+    # с ETag число подписок уже посчитано точно, без него срабатывает порог
+    assert resp.json()["total_estimated"] is not etag
+    assert resp.json()["total"] == 4 if etag else resp.json()["total"] >= 3
+    resp = await async_client.get(f"{url}&total=estimated")
+    assert resp.json()["total_estimated"] is not etag
+    assert len(resp.json()["items"]) == 2
 
 
 @pytest.mark.asyncio
@@ -139,3 +315,347 @@ async def test_sum_subscriptions_with_empty_end(async_client):
     )
     assert sum_resp.status_code == 200
     assert sum_resp.json()["sum"] == (200) * 9
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_subscriptions(async_client):
+    user_id = str(uuid.uuid4())
+    rows = [
+        {"service_name": "Netflix", "price": 500, "user_id": user_id, "start_date": "01-2025"},
+        {"service_name": "Spotify", "price": 200, "user_id": user_id, "start_date": "2025-01"},
+        {"service_name": "Spotify", "price": 200, "user_id": user_id, "start_date": "02-2025"},
+    ]
+    resp = await async_client.post("/subscriptions/bulk/", json=rows)
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["created"] == 2
+    assert [e["index"] for e in body["errors"]] == [1]
+
+    get_resp = await async_client.get(f"/subscriptions/{body['ids'][0]}")
+    assert get_resp.json()["service_name"] == "Netflix"
+
+    list_resp = await async_client.get(f"/subscriptions/list/?user_id={user_id}")
+    assert len(list_resp.json()) == 2
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_reports_only_rows_rejected_by_database(async_client, monkeypatch):
+    user_id = str(uuid.uuid4())
+    rows = [
+        {"service_name": f"svc{i}", "price": 100, "user_id": user_id, "start_date": "01-2025"}
+        for i in range(7)
+    ]
+    # схема такую строку пропускает, а text в PostgreSQL - нет
+    rows[4]["service_name"] = "bad\x00name"
+    rows[5]["price"] = 2**31
+    resp = await async_client.post("/subscriptions/bulk/", json=rows)
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["created"] == 5
+    assert [error["index"] for error in body["errors"]] == [4, 5]
+    assert body["errors"][0]["errors"][0]["type"] == "db_error"
+    assert body["errors"][1]["errors"][0]["type"] == "less_than_equal"
+
+    list_resp = await async_client.get(f"/subscriptions/list/?user_id={user_id}&limit=10")
+    assert sorted(sub["id"] for sub in list_resp.json()) == sorted(body["ids"])
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_subscriptions_ndjson(async_client):
+    user_id = str(uuid.uuid4())
+    lines = [
+        f'{{"service_name": "Netflix", "price": 500, "user_id": "{user_id}", "start_date": "01-2025"}}',
+        "{not json",
+        f'{{"service_name": "Spotify", "price": 200, "user_id": "{user_id}", "start_date": "01-2025"}}',
+    ]
+    resp = await async_client.post(
+        "/subscriptions/bulk/",
+        content="\n".join(lines),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["created"] == 2
+    assert len(body["ids"]) == 2
+    assert body["errors"][0]["index"] == 1
+
+
+@pytest.mark.asyncio
+async def test_sum_rollup_follows_updates_and_deletes(async_client):
+    user_id = str(uuid.uuid4())
+    ids = []
+    for service, price, start, end in [
+        ("Spotify", 200, "01-2025", "06-2025"),
+        ("Spotify", 300, "04-2025", None),
+        ("Netflix", 500, "03-2025", "04-2025"),
+    ]:
+        resp = await async_client.post(
+            "/subscriptions/",
+            json={
+                "service_name": service,
+                "price": price,
+                "user_id": user_id,
+                "start_date": start,
+                "end_date": end,
+            },
+        )
+        ids.append(resp.json()["id"])
+
+    await async_client.put(f"/subscriptions/{ids[1]}", json={"service_name": "Yandex Plus"})
+    await async_client.delete(f"/subscriptions/{ids[2]}")
+
+    params = f"user_id={user_id}&start_date=01-2025&end_date=12-2025"
+    sum_resp = await async_client.get(f"/subscriptions/sum/?{params}")
+    assert sum_resp.json()["sum"] == 200 * 6 + 300 * 9
+
+    async with async_session_maker() as session:
+        repo = SubscriptionRepository(session)
+        for service_name in (None, "Spotify", "Yandex Plus"):
+            args = (uuid.UUID(user_id), service_name, date(2025, 1, 1), date(2025, 12, 1))
+            assert await repo.sum_by_user_rollup(*args) == await repo.sum_by_user_series(*args)
+
+
+@pytest.mark.asyncio
+async def test_sum_falls_back_to_series_when_rollup_not_extended(async_client, monkeypatch):
+    monkeypatch.setattr(rollup_coverage, "covered_until", None)
+    monkeypatch.setattr(rollup_coverage, "checked_at", float("-inf"))
+    user_id = str(uuid.uuid4())
+    await async_client.post(
+        "/subscriptions/",
+        json={"service_name": "Spotify", "price": 300, "user_id": user_id, "start_date": "01-2025"},
+    )
+    current_month = date.today().replace(day=1)
+    months = (current_month.year - 2025) * 12 + current_month.month
+    previous_month = (current_month - timedelta(days=1)).replace(day=1)
+
+    # свёртку последний раз продлевали в прошлом месяце, ежемесячный запуск пропущен
+    async with async_session_maker() as session:
+        await session.execute(
+            delete(SubscriptionMonthlySpend).where(SubscriptionMonthlySpend.month >= current_month)
+        )
+        await session.execute(
+            insert(SubscriptionRollupState).values(id=True, covered_until=previous_month)
+        )
+        await session.commit()
+
+    params = f"user_id={user_id}&start_date=01-2025&engine=rollup"
+    resp = await async_client.get(f"/subscriptions/sum/?{params}")
+    assert resp.json()["sum"] == 300 * months
+    assert rollup_coverage.covered_until == previous_month
+
+    async with async_session_maker() as session:
+        assert await refresh_open_ended(session) == 1
+        repo = SubscriptionRepository(session)
+        args = (uuid.UUID(user_id), None, date(2025, 1, 1), None)
+        assert await repo.sum_by_user_rollup(*args) == 300 * months
+        # продление записывает новое покрытие, и свёртка снова используется
+        rollup_coverage.checked_at = float("-inf")
+        assert await rollup_coverage.covers(session)
+        assert rollup_coverage.covered_until > current_month
+
+
+async def create_many(async_client, rows) -> list:
+    resp = await async_client.post("/subscriptions/bulk/", json=rows)
+    assert resp.status_code == 200
+    return resp.json()["ids"]
+
+
+@pytest.mark.asyncio
+async def test_patch_batch(async_client):
+    user_id = str(uuid.uuid4())
+    ids = await create_many(
+        async_client,
+        [
+            {"service_name": "Netflix", "price": 500, "user_id": user_id, "start_date": "01-2025"},
+            {"service_name": "Spotify", "price": 200, "user_id": user_id, "start_date": "01-2025"},
+            {"service_name": "Spotify", "price": 300, "user_id": user_id, "start_date": "03-2025"},
+        ],
+    )
+    missing = str(uuid.uuid4())
+    resp = await async_client.patch(
+        "/subscriptions/batch/",
+        json={
+            "items": [
+                {"id": ids[0], "price": 600},
+                {"id": ids[1], "price": 250},
+                {"id": ids[2], "service_name": "Yandex Plus", "end_date": "06-2025"},
+                {"id": missing, "price": 100},
+            ]
+        },
+    )
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["count"] == 3
+    assert sorted(body["ids"]) == sorted(ids)
+    assert body["not_found"] == [missing]
+
+    subs = [(await async_client.get(f"/subscriptions/{sub_id}")).json() for sub_id in ids]
+    assert [sub["price"] for sub in subs] == [600, 250, 300]
+    assert subs[2]["service_name"] == "Yandex Plus"
+    assert subs[2]["end_date"] == "2025-06-01"
+
+    params = f"user_id={user_id}&start_date=01-2025&end_date=12-2025"
+    sum_resp = await async_client.get(f"/subscriptions/sum/?{params}&service_name=Yandex Plus")
+    assert sum_resp.json()["sum"] == 300 * 4
+
+    resp = await async_client.patch(
+        "/subscriptions/batch/", json={"items": [{"id": ids[0]}, {"id": ids[0], "price": 1}]}
+    )
+    assert resp.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_update_and_delete_by_filter(async_client):
+    user_id = str(uuid.uuid4())
+    other_user = str(uuid.uuid4())
+    rows = [
+        {"service_name": "Netflix", "price": 500, "user_id": user_id, "start_date": "01-2025"},
+        {"service_name": "Netflix", "price": 500, "user_id": user_id, "start_date": "06-2026"},
+        {"service_name": "Spotify", "price": 200, "user_id": user_id, "start_date": "01-2025"},
+        {"service_name": "Netflix", "price": 500, "user_id": other_user, "start_date": "01-2025"},
+    ]
+    ids = await create_many(async_client, rows)
+    before = (await async_client.get(f"/subscriptions/{ids[0]}")).headers["ETag"]
+
+    resp = await async_client.patch("/subscriptions/", json={"price": 1})
+    assert resp.status_code == 400
+    resp = await async_client.patch(f"/subscriptions/?user_id={user_id}", json={})
+    assert resp.status_code == 400
+
+    resp = await async_client.patch(
+        f"/subscriptions/?user_id={user_id}&service_name=Netflix&end_date=12-2025",
+        json={"price": 550},
+    )
+    assert resp.status_code == 200
+    assert resp.json()["ids"] == [ids[0]]
+    after = await async_client.get(f"/subscriptions/{ids[0]}")
+    assert after.json()["price"] == 550
+    assert after.headers["ETag"] != before
+
+    params = f"user_id={user_id}&service_name=Netflix&start_date=01-2025&end_date=03-2025"
+    sum_resp = await async_client.get(f"/subscriptions/sum/?{params}")
+    assert sum_resp.json()["sum"] == 550 * 3
+
+    resp = await async_client.delete("/subscriptions/")
+    assert resp.status_code == 400
+    resp = await async_client.delete(f"/subscriptions/?user_id={user_id}&service_name=Netflix")
+    assert resp.status_code == 200
+    assert resp.json()["count"] == 2
+    assert sorted(resp.json()["ids"]) == sorted(ids[:2])
+
+    list_resp = await async_client.get(f"/subscriptions/list/?user_id={user_id}")
+    assert [sub["service_name"] for sub in list_resp.json()] == ["Spotify"]
+    other = await async_client.get(f"/subscriptions/list/?user_id={other_user}")
+    assert len(other.json()) == 1
+
+
+@pytest.mark.asyncio
+async def test_export_subscriptions(async_client):
+    user_id = str(uuid.uuid4())
+    rows = [
+        {"service_name": "Netflix", "price": 500, "user_id": user_id, "start_date": "01-2025"},
+        {"service_name": "Spotify", "price": 200, "user_id": user_id, "start_date": "02-2025"},
+        {
+            "service_name": "Netflix",
+            "price": 400,
+            "user_id": str(uuid.uuid4()),
+            "start_date": "01-2025",
+        },
+    ]
+    await async_client.post("/subscriptions/bulk/", json=rows)
+
+    resp = await async_client.get(f"/subscriptions/export/?user_id={user_id}")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/x-ndjson"
+    exported = [json.loads(line) for line in resp.text.splitlines()]
+    assert sorted(sub["service_name"] for sub in exported) == ["Netflix", "Spotify"]
+    assert exported[0]["end_date"] is None
+
+    resp = await async_client.get("/subscriptions/export/?format=csv&service_name=Netflix")
+    assert resp.status_code == 200
+    exported = list(csv.DictReader(io.StringIO(resp.text)))
+    assert sorted(int(sub["price"]) for sub in exported) == [400, 500]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("engine", ["rollup", "series", "numpy"])
+async def test_sum_batch(async_client, monkeypatch, engine):
+    monkeypatch.setattr(settings, "SUM_BATCH_CHUNK_SIZE", 2)
+    users = [str(uuid.uuid4()) for _ in range(3)]
+    for user_id, price in zip(users, (100, 200, 300), strict=True):
+        for service in ("Netflix", "Spotify"):
+            await async_client.post(
+                "/subscriptions/",
+                json={
+                    "service_name": service,
+                    "price": price,
+                    "user_id": user_id,
+                    "start_date": "01-2025",
+                    "end_date": "03-2025",
+                },
+            )
+    missing = str(uuid.uuid4())
+
+    resp = await async_client.post(
+        f"/subscriptions/sum/batch/?engine={engine}",
+        json={
+            "user_ids": [*users, missing],
+            "service_name": "Netflix",
+            "start_date": "02-2025",
+            "end_date": "12-2025",
+        },
+    )
+    assert resp.status_code == 200
+    sums = resp.json()["sums"]
+    assert sums == {users[0]: 200, users[1]: 400, users[2]: 600, missing: 0}
+
+    for user_id in users:
+        single = await async_client.get(
+            f"/subscriptions/sum/?user_id={user_id}&service_name=Netflix"
+            f"&start_date=02-2025&end_date=12-2025&engine={engine}"
+        )
+        assert single.json()["sum"] == sums[user_id]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("engine", ["rollup", "series", "numpy"])
+async def test_sum_breakdown(async_client, engine):
+    user_id = str(uuid.uuid4())
+    for service, price, start, end in [
+        ("Spotify", 200, "01-2025", "03-2025"),
+        ("Spotify", 300, "03-2025", "04-2025"),
+        ("Netflix", 500, "02-2025", "02-2025"),
+    ]:
+        await async_client.post(
+            "/subscriptions/",
+            json={
+                "service_name": service,
+                "price": price,
+                "user_id": user_id,
+                "start_date": start,
+                "end_date": end,
+            },
+        )
+
+    params = f"user_id={user_id}&start_date=02-2025&end_date=12-2025&engine={engine}"
+    resp = await async_client.get(f"/subscriptions/sum/breakdown/?{params}")
+    assert resp.status_code == 200
+    assert resp.json() == {
+        "sum": 700 + 300 + 300,
+        "items": [
+            {"month": "2025-02-01", "service_name": None, "sum": 700},
+            {"month": "2025-03-01", "service_name": None, "sum": 300},
+            {"month": "2025-04-01", "service_name": None, "sum": 300},
+        ],
+    }
+
+    resp = await async_client.get(f"/subscriptions/sum/breakdown/?{params}&by_service=true")
+    items = [(item["month"], item["service_name"], item["sum"]) for item in resp.json()["items"]]
+    assert items == [
+        ("2025-02-01", "Netflix", 500),
+        ("2025-02-01", "Spotify", 200),
+        ("2025-03-01", "Spotify", 300),
+        ("2025-04-01", "Spotify", 300),
+    ]
+    total = await async_client.get(f"/subscriptions/sum/?{params}")
+    assert total.json()["sum"] == resp.json()["sum"]
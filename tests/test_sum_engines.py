@@ -0,0 +1,89 @@
+import uuid
+from datetime import date
+
+import pytest
+from hypothesis import HealthCheck, given, settings
+from hypothesis import strategies as st
+
+from app.core.db import async_session_maker
+from app.subscriptions import schemas
+from app.subscriptions.repository import SubscriptionRepository
+from app.subscriptions.vectorized import monthly_breakdown, sum_monthly_max
+
+SERVICES = ["Netflix", "Spotify", "Yandex Plus"]
+months = st.dates(min_value=date(2024, 1, 1), max_value=date(2027, 12, 1)).map(
+    lambda value: value.replace(day=1)
+)
+
+
+def point_key(point):
+    return point.month, point.service_name or ""
+
+
+@st.composite
+def subscription_spans(draw):
+    start = draw(months)
+    end = draw(st.none() | months.filter(lambda value: value >= start))
+    return draw(st.sampled_from(SERVICES)), draw(st.integers(0, 10_000)), start, end
+
+
+def test_sum_monthly_max_takes_max_per_service_month():
+    rows = [
+        ("Spotify", 200, date(2025, 1, 1), date(2025, 6, 1)),
+        ("Spotify", 300, date(2025, 4, 1), date(2025, 9, 1)),
+        ("Netflix", 500, date(2025, 3, 1), date(2025, 4, 1)),
+    ]
+    assert sum_monthly_max(rows) == 200 * 3 + 300 * 6 + 500 * 2
+    assert sum_monthly_max(rows, date(2025, 4, 1), date(2025, 4, 1)) == 300 + 500
+    assert sum_monthly_max(rows, date(2026, 1, 1)) == 0
+    assert sum_monthly_max([]) == 0
+
+    assert monthly_breakdown(rows, date(2025, 3, 1), date(2025, 4, 1)) == [
+        (date(2025, 3, 1), None, 200 + 500),
+        (date(2025, 4, 1), None, 300 + 500),
+    ]
+    assert monthly_breakdown(rows, date(2025, 9, 1), by_service=True) == [
+        (date(2025, 9, 1), "Spotify", 300)
+    ]
+
+
+@pytest.mark.asyncio
+@settings(
+    max_examples=40,
+    deadline=None,
+    suppress_health_check=[HealthCheck.function_scoped_fixture],
+)
+@given(
+    spans=st.lists(subscription_spans(), max_size=8),
+    service_name=st.none() | st.sampled_from(SERVICES),
+    start_date=st.none() | months,
+    end_date=st.none() | months,
+)
+async def test_sum_engines_agree(spans, service_name, start_date, end_date):
+    user_id = uuid.uuid4()
+    async with async_session_maker() as session:
+        repo = SubscriptionRepository(session)
+        if spans:
+            await repo.bulk_create(
+                [
+                    schemas.SubscriptionCreate(
+                        service_name=service,
+                        price=price,
+                        user_id=user_id,
+                        start_date=start,
+                        end_date=end,
+                    )
+                    for service, price, start, end in spans
+                ]
+            )
+        args = (user_id, service_name, start_date, end_date)
+        expected = await repo.sum_by_user_series(*args)
+        assert await repo.sum_by_user_numpy(*args) == expected
+        assert await repo.sum_by_user(*args, engine="numpy") == expected
+
+        for by_service in (False, True):
+            series = await repo.breakdown_by_user(*args, by_service, engine="series")
+            assert sum(point.sum for point in series) == expected
+            for engine in ("numpy", "rollup"):
+                points = await repo.breakdown_by_user(*args, by_service, engine=engine)
+                assert sorted(points, key=point_key) == sorted(series, key=point_key)
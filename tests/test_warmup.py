@@ -0,0 +1,34 @@
+import pytest
+
+from app import main
+from app.config import settings
+from app.core.db import engine, pool_limits
+from app.core.warmup import WarmUp
+from app.subscriptions.warmup import warm_statements
+
+
+@pytest.mark.parametrize(
+    ("budget", "workers", "expected"),
+    [(0, 4, (5, 10)), (40, 4, (5, 5)), (12, 4, (3, 0)), (3, 8, (1, 0))],
+)
+def test_pool_budget_is_split_across_workers(monkeypatch, budget, workers, expected):
+    monkeypatch.setattr(settings, "DB_POOL_SIZE", 5)
+    monkeypatch.setattr(settings, "DB_MAX_OVERFLOW", 10)
+    monkeypatch.setattr(settings, "DB_POOL_BUDGET", budget)
+    monkeypatch.setattr(settings, "WEB_CONCURRENCY", workers)
+    assert pool_limits() == expected
+
+
+@pytest.mark.asyncio
+async def test_ready_after_warmup(async_client, monkeypatch):
+    warmup = WarmUp([engine], 2, [warm_statements])
+    monkeypatch.setattr(main, "warmup", warmup)
+
+    resp = await async_client.get("/ready")
+    assert resp.status_code == 503
+
+    await warmup.run()
+    assert engine.sync_engine.pool.checkedin() == 2
+    resp = await async_client.get("/ready")
+    assert resp.status_code == 200
+    assert resp.json() == {"status": "ready"}